@@ -1,10 +1,15 @@
 import base64
+import io
 import os
+import struct
 import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
+from sized_lru import SizedLRUCache
 
 def _load_key():
     try:
@@ -32,6 +37,30 @@ def _load_key():
 
 _KEY = _load_key()
 
+
+class DecryptCache(SizedLRUCache):
+    """
+    以密文字符串为键的 LRU 缓存，按占用内存淘汰。
+
+    密文自带随机 nonce，同一密文永远解出同一明文，因此缓存不会过期。
+    """
+
+
+_decrypt_cache = DecryptCache()
+
+
+def decrypt_cache_stats():
+    return _decrypt_cache.stats()
+
+
+def clear_decrypt_cache():
+    _decrypt_cache.clear()
+
+
+def set_decrypt_cache_limit(max_bytes):
+    _decrypt_cache.resize(max_bytes)
+
+
 def encrypt_text(text):
     if text is None:
         return None
@@ -41,7 +70,9 @@ def encrypt_text(text):
     cipher = AES.new(_KEY, AES.MODE_GCM, nonce=nonce)
     ct, tag = cipher.encrypt_and_digest(text.encode('utf-8'))
     payload = base64.b64encode(nonce + tag + ct).decode('ascii')
-    return 'enc:' + payload
+    enc = 'enc:' + payload
+    _decrypt_cache.put(enc, text)
+    return enc
 
 def decrypt_text(text):
     if text is None:
@@ -55,21 +86,23 @@ def decrypt_text(text):
         return text
     if not text.startswith('enc:'):
         return text
+    cached = _decrypt_cache.get(text)
+    if cached is not None:
+        return cached
     b = base64.b64decode(text[4:])
     nonce = b[:12]
     tag = b[12:28]
     ct = b[28:]
     cipher = AES.new(_KEY, AES.MODE_GCM, nonce=nonce)
-    pt = cipher.decrypt_and_verify(ct, tag)
-    return pt.decode('utf-8')
+    pt = cipher.decrypt_and_verify(ct, tag).decode('utf-8')
+    _decrypt_cache.put(text, pt)
+    return pt
 
 def encrypt_json(obj):
-    import json
     s = json.dumps(obj, ensure_ascii=False)
     return encrypt_text(s)
 
 def decrypt_json(text):
-    import json
     if text is None:
         return None
     try:
@@ -80,6 +113,100 @@ def decrypt_json(text):
     except Exception:
         return None
 
+
+# 批量接口：整列加解密时共用一次缓存加锁与随机数生成；
+# 数量达到 BULK_PARALLEL_MIN 且给了 max_workers 时分块交给线程池（PyCryptodome 加解密时释放 GIL）
+BULK_PARALLEL_MIN = 2048
+BULK_CHUNK_SIZE = 512
+
+
+def _run_bulk(func, items, max_workers):
+    if not max_workers or max_workers <= 1 or len(items) < BULK_PARALLEL_MIN:
+        return func(items)
+    chunks = [items[i:i + BULK_CHUNK_SIZE] for i in range(0, len(items), BULK_CHUNK_SIZE)]
+    out = []
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        for part in ex.map(func, chunks):
+            out.extend(part)
+    return out
+
+
+def _encrypt_texts(texts):
+    new, mode, key, b64 = AES.new, AES.MODE_GCM, _KEY, base64.b64encode
+    nonces = get_random_bytes(12 * len(texts))
+    out = []
+    for i, text in enumerate(texts):
+        nonce = nonces[12 * i:12 * i + 12]
+        ct, tag = new(key, mode, nonce=nonce).encrypt_and_digest(text.encode('utf-8'))
+        out.append('enc:' + b64(nonce + tag + ct).decode('ascii'))
+    return out
+
+
+def _decrypt_texts(encs):
+    new, mode, key, b64 = AES.new, AES.MODE_GCM, _KEY, base64.b64decode
+    out = []
+    for enc in encs:
+        try:
+            b = b64(enc[4:])
+            out.append(new(key, mode, nonce=b[:12]).decrypt_and_verify(b[28:], b[12:28]).decode('utf-8'))
+        except Exception as e:
+            out.append(e)
+    return out
+
+
+def encrypt_many(values, as_json=False, max_workers=None):
+    """批量加密一列值，结果与逐个调用 encrypt_text（as_json 时为 encrypt_json）相同"""
+    values = list(values)
+    if as_json:
+        texts = [json.dumps(v, ensure_ascii=False) for v in values]
+    else:
+        texts = [None if v is None else (v if isinstance(v, str) else str(v)) for v in values]
+    idx = [i for i, t in enumerate(texts) if t is not None]
+    encs = _run_bulk(_encrypt_texts, [texts[i] for i in idx], max_workers)
+    out = [None] * len(values)
+    for i, enc in zip(idx, encs):
+        out[i] = enc
+    _decrypt_cache.put_many(zip(encs, (texts[i] for i in idx)))
+    return out
+
+
+def decrypt_many(values, as_json=False, max_workers=None):
+    """批量解密一列值，结果与逐个调用 decrypt_text（as_json 时为 decrypt_json）相同"""
+    out = list(values)
+    idx = []
+    for i, v in enumerate(out):
+        if isinstance(v, bytes):
+            try:
+                v = out[i] = v.decode('utf-8')
+            except Exception:
+                continue
+        if isinstance(v, str) and v.startswith('enc:'):
+            idx.append(i)
+    encs = [out[i] for i in idx]
+    plains = _decrypt_cache.get_many(encs)
+    miss = [k for k, p in enumerate(plains) if p is None]
+    if miss:
+        fresh = []
+        for k, p in zip(miss, _run_bulk(_decrypt_texts, [encs[k] for k in miss], max_workers)):
+            if isinstance(p, Exception):
+                if not as_json:
+                    raise p
+                p = None
+            else:
+                fresh.append((encs[k], p))
+            plains[k] = p
+        _decrypt_cache.put_many(fresh)
+    for i, p in zip(idx, plains):
+        out[i] = p
+    if not as_json:
+        return out
+    for i, v in enumerate(out):
+        try:
+            out[i] = json.loads(v) if v else None
+        except Exception:
+            out[i] = None
+    return out
+
 def key_fingerprint():
     return hashlib.sha256(_KEY).hexdigest()
 
@@ -93,6 +220,14 @@ def verify_probe(enc):
         return False
 
 
+def _secret_key_bytes(secret_key):
+    # 将字符串 key 转为 bytes，并调整长度为 32 字节（AES-256）
+    key_bytes = secret_key.encode('utf-8')
+    if len(key_bytes) < 32:
+        return key_bytes.ljust(32, b'\0')  # 不够 32 字节补 0
+    return key_bytes[:32]  # 超过截断
+
+
 def aes_bytesio(data_io: BytesIO, secret_key: str, operation: str) -> BytesIO:
     """
     对 BytesIO 对象进行 AES-CBC 加密或解密，secret_key 为字符串。
@@ -108,12 +243,7 @@ def aes_bytesio(data_io: BytesIO, secret_key: str, operation: str) -> BytesIO:
     data_io.seek(0)
     data = data_io.read()
 
-    # 将字符串 key 转为 bytes，并调整长度为 32 字节（AES-256）
-    key_bytes = secret_key.encode('utf-8')
-    if len(key_bytes) < 32:
-        key_bytes = key_bytes.ljust(32, b'\0')  # 不够 32 字节补 0
-    else:
-        key_bytes = key_bytes[:32]  # 超过截断
+    key_bytes = _secret_key_bytes(secret_key)
 
     if operation == "encrypt":
         iv = get_random_bytes(16)
@@ -132,3 +262,125 @@ def aes_bytesio(data_io: BytesIO, secret_key: str, operation: str) -> BytesIO:
 
     else:
         raise ValueError("Operation must be 'encrypt' or 'decrypt'")
+
+
+# 分块认证加密流：头部 = 魔数 + 版本 + 块大小 + 8 字节随机 nonce 前缀；
+# 之后每块为 >IB（密文长度、是否末块）+ 密文 + 16 字节 tag。
+# 块 nonce = 前缀 + 块序号，头部、序号与末块标记都参与认证，块被篡改、重排或截断都会被发现
+STREAM_MAGIC = b'EXAESGCM'
+STREAM_VERSION = 1
+STREAM_CHUNK_SIZE = 64 * 1024
+_STREAM_HEADER = struct.Struct('>8sBI8s')
+_STREAM_FRAME = struct.Struct('>IB')
+_STREAM_AAD = struct.Struct('>QB')
+
+
+def _stream_key(secret_key):
+    return _KEY if secret_key is None else _secret_key_bytes(secret_key)
+
+
+def _stream_cipher(key, prefix, index, header, final):
+    cipher = AES.new(key, AES.MODE_GCM, nonce=prefix + struct.pack('>I', index))
+    cipher.update(header + _STREAM_AAD.pack(index, final))
+    return cipher
+
+
+def is_stream_encrypted(head):
+    """head 为文件开头的若干字节，判断是否为 EncryptWriter 写出的格式"""
+    return head[:len(STREAM_MAGIC)] == STREAM_MAGIC
+
+
+class EncryptWriter(io.RawIOBase):
+    """
+    把写入的明文按块加密后写到 fp，内存占用只有一个块。
+
+    secret_key 为 None 时使用本机 AES 密钥，否则与 aes_bytesio 一样由字符串派生；
+    close() 时写出末块，不会关闭 fp。
+    """
+
+    def __init__(self, fp, secret_key=None, chunk_size=STREAM_CHUNK_SIZE):
+        super().__init__()
+        self._fp = fp
+        self._key = _stream_key(secret_key)
+        self._chunk_size = int(chunk_size)
+        self._prefix = get_random_bytes(8)
+        self._header = _STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, self._chunk_size, self._prefix)
+        self._buf = bytearray()
+        self._index = 0
+        fp.write(self._header)
+
+    def writable(self):
+        return True
+
+    def _emit(self, data, final):
+        cipher = _stream_cipher(self._key, self._prefix, self._index, self._header, final)
+        ct, tag = cipher.encrypt_and_digest(bytes(data))
+        self._fp.write(_STREAM_FRAME.pack(len(ct), final) + ct + tag)
+        self._index += 1
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError("write to closed EncryptWriter")
+        self._buf += b
+        while len(self._buf) > self._chunk_size:
+            self._emit(self._buf[:self._chunk_size], 0)
+            del self._buf[:self._chunk_size]
+        return len(b)
+
+    def close(self):
+        if not self.closed:
+            self._emit(self._buf, 1)
+            self._buf = bytearray()
+        super().close()
+
+
+def iter_decrypt(fp, secret_key=None):
+    """逐块读取并校验 EncryptWriter 写出的流，依次产出明文块；数据被篡改或不完整时抛出 ValueError"""
+    key = _stream_key(secret_key)
+    header = fp.read(_STREAM_HEADER.size)
+    if len(header) < _STREAM_HEADER.size or not is_stream_encrypted(header):
+        raise ValueError("Not an encrypted stream")
+    _, version, chunk_size, prefix = _STREAM_HEADER.unpack(header)
+    if version != STREAM_VERSION:
+        raise ValueError(f"Unsupported stream version: {version}")
+    index = 0
+    while True:
+        frame = fp.read(_STREAM_FRAME.size)
+        if len(frame) < _STREAM_FRAME.size:
+            raise ValueError("Encrypted stream truncated")
+        length, final = _STREAM_FRAME.unpack(frame)
+        if length > chunk_size:
+            raise ValueError("Encrypted stream chunk too large")
+        body = fp.read(length + 16)
+        if len(body) < length + 16:
+            raise ValueError("Encrypted stream truncated")
+        cipher = _stream_cipher(key, prefix, index, header, final)
+        yield cipher.decrypt_and_verify(body[:length], body[length:])
+        if final:
+            return
+        index += 1
+
+
+class DecryptReader(io.RawIOBase):
+    """以只读文件对象的形式按需解密 fp，供需要 read() 接口的调用方使用"""
+
+    def __init__(self, fp, secret_key=None):
+        super().__init__()
+        self._chunks = iter_decrypt(fp, secret_key)
+        self._pending = b''
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._offset >= len(self._pending):
+            self._pending = next(self._chunks, None)
+            self._offset = 0
+            if self._pending is None:
+                self._pending = b''
+                return 0
+        n = min(len(b), len(self._pending) - self._offset)
+        b[:n] = self._pending[self._offset:self._offset + n]
+        self._offset += n
+        return n
@@ -1,6 +1,10 @@
 import os
 import pathlib
 import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 from crypto_util import encrypt_probe, verify_probe
 
@@ -17,22 +21,178 @@ FILES_DIR = os.path.join(DB_DIR, 'files')
 RESOURCE_PATH = os.path.join(DB_DIR, 'resources')
 DB_VERFILE_PATH = os.path.join(DB_DIR, '.db_version')
 DB_PATH = EXAMS_DB_PATH
+ALL_DB_PATHS = [UID_DB_PATH, ADMIN_DB_PATH, USERS_DB_PATH, EXAMS_DB_PATH, SCORES_DB_PATH, CONFIG_DB_PATH, PROGRESS_DB_PATH, KB_DB_PATH]
+
+# 统一的 PRAGMA 配置：WAL 让考试窗口写答案与管理端合并互不阻塞
+BUSY_TIMEOUT_MS = 10000
+# 检查点被读者阻塞时的重试次数与间隔（秒）
+CHECKPOINT_RETRIES = 3
+CHECKPOINT_RETRY_DELAY = 0.5
+PRAGMA_PROFILE = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', BUSY_TIMEOUT_MS),
+    ('temp_store', 'MEMORY'),
+    ('cache_size', -8000),
+    ('mmap_size', 64 * 1024 * 1024),
+)
+
+# 二级索引：(数据库, 索引名, 建表语句片段)
+INDEX_DEFS = [
+    (SCORES_DB_PATH, 'idx_attempt_answers_attempt_question',
+     'CREATE UNIQUE INDEX IF NOT EXISTS idx_attempt_answers_attempt_question '
+     'ON attempt_answers (attempt_uuid, question_id)'),
+    (SCORES_DB_PATH, 'idx_attempts_exam',
+     'CREATE INDEX IF NOT EXISTS idx_attempts_exam ON attempts (exam_id)'),
+    (SCORES_DB_PATH, 'idx_attempts_user',
+     'CREATE INDEX IF NOT EXISTS idx_attempts_user ON attempts (user_id)'),
+    (EXAMS_DB_PATH, 'idx_questions_exam_pool',
+     'CREATE INDEX IF NOT EXISTS idx_questions_exam_pool ON questions (exam_uuid, pool)'),
+    (KB_DB_PATH, 'idx_knowledge_base_sha1',
+     'CREATE INDEX IF NOT EXISTS idx_knowledge_base_sha1 ON knowledge_base (sha1)'),
+]
+
+# 变更日志：这些表的插入/更新由触发器按递增序号记入同库的 change_log，
+# 同步拉取时只读取序号高于上次水位的行
+CHANGE_LOG_TABLES = [
+    (SCORES_DB_PATH, 'attempts'),
+    (SCORES_DB_PATH, 'attempt_answers'),
+    (USERS_DB_PATH, 'users'),
+    (ADMIN_DB_PATH, 'admins'),
+    (KB_DB_PATH, 'knowledge_base'),
+    (PROGRESS_DB_PATH, 'user_task_progress'),
+]
+
+# 每个线程、每个数据库文件各持有一条长连接
+_local = threading.local()
+_ensure_lock = threading.Lock()
+_db_ready = False
+
+
+class PooledConnection(sqlite3.Connection):
+    """线程内复用的长连接：close() 只回滚未提交的事务，不真正断开"""
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def close_real(self):
+        super().close()
+
+
+def connect(db_path, factory=sqlite3.Connection):
+    """打开数据库连接并应用 PRAGMA_PROFILE"""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, factory=factory)
+    for key, value in PRAGMA_PROFILE:
+        try:
+            conn.execute(f'PRAGMA {key}={value}')
+        except sqlite3.DatabaseError as e:
+            print(f"PRAGMA {key} failed on {db_path}: {e}")
+    return conn
+
+
+def _checkpoint(db_path, mode, retries):
+    # 被读者阻塞时 wal_checkpoint 不抛异常，而是在结果行 (busy, log, checkpointed) 中返回 busy=1
+    for attempt in range(retries):
+        if attempt:
+            time.sleep(CHECKPOINT_RETRY_DELAY)
+        try:
+            conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+            try:
+                row = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError as e:
+            print(f"Checkpoint failed on {db_path}: {e}")
+            continue
+        if not row or row[0] == 0:
+            return True
+    return False
+
+
+def checkpoint_all(mode='TRUNCATE', retries=CHECKPOINT_RETRIES):
+    """把各库 WAL 中的内容写回主文件，推送前调用以保证远端拿到完整的 .db。
+    返回重试后仍未能完整写回的库路径列表，调用方不应推送这些库文件"""
+    busy = []
+    for db_path in ALL_DB_PATHS:
+        if os.path.exists(db_path) and not _checkpoint(db_path, mode, retries):
+            busy.append(db_path)
+    return busy
+
+
+def create_indexes(conn, db_path):
+    """为指定数据库创建 INDEX_DEFS 中的索引，失败的索引打印后跳过"""
+    for path, name, sql in INDEX_DEFS:
+        if path != db_path:
+            continue
+        try:
+            conn.execute(sql)
+        except sqlite3.DatabaseError as e:
+            print(f"Create index {name} failed: {e}")
+    conn.commit()
+
+
+def create_change_log(conn, db_path):
+    """为指定数据库建立 change_log 与记录触发器，并压缩掉被后续变更覆盖的旧条目"""
+    tables = [tbl for path, tbl in CHANGE_LOG_TABLES if path == db_path]
+    if not tables:
+        return
+    try:
+        conn.execute('CREATE TABLE IF NOT EXISTS change_log '
+                     '(seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                     'tbl TEXT, row_id INTEGER, op TEXT, changed_at TEXT)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_tbl_seq ON change_log (tbl, seq)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (tbl, row_id)')
+        # log_id 标识这份日志的来源，文件被整体替换（推送）后序号要按新来源重新比较
+        conn.execute('CREATE TABLE IF NOT EXISTS change_log_meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute("INSERT OR IGNORE INTO change_log_meta (key, value) VALUES ('log_id', ?)", (uuid.uuid4().hex,))
+        for tbl in tables:
+            for op in ('INSERT', 'UPDATE'):
+                # 同一行反复更新（如自动保存作答）只保留最新一条，旧版触发器在此替换
+                conn.execute(f'DROP TRIGGER IF EXISTS trg_{tbl}_{op.lower()}_log')
+                conn.execute(f'CREATE TRIGGER trg_{tbl}_{op.lower()}_log AFTER {op} ON {tbl} '
+                             f"BEGIN DELETE FROM change_log WHERE tbl='{tbl}' AND row_id=NEW.rowid; "
+                             f"INSERT INTO change_log (tbl, row_id, op, changed_at) "
+                             f"VALUES ('{tbl}', NEW.rowid, '{op[0]}', strftime('%Y-%m-%dT%H:%M:%S', 'now')); END")
+        # 同一行只需保留最新的序号
+        conn.execute('DELETE FROM change_log WHERE seq NOT IN (SELECT MAX(seq) FROM change_log GROUP BY tbl, row_id)')
+    except sqlite3.DatabaseError as e:
+        print(f"Create change log on {db_path} failed: {e}")
+    conn.commit()
+
+
+def change_log_state(db_path):
+    """返回数据库文件的 (log_id, 最大序号)，没有变更日志时为 (None, 0)。
+    序号取自 sqlite_sequence，日志被压缩清空后水位也不会回退"""
+    if not os.path.exists(db_path):
+        return None, 0
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        log_id = conn.execute("SELECT value FROM change_log_meta WHERE key='log_id'").fetchone()
+        seq = conn.execute("SELECT MAX(seq) FROM (SELECT MAX(seq) AS seq FROM change_log "
+                           "UNION ALL SELECT seq FROM sqlite_sequence WHERE name='change_log')").fetchone()
+    except sqlite3.DatabaseError:
+        return None, 0
+    finally:
+        conn.close()
+    return (log_id[0] if log_id else None), int(seq[0] or 0)
 
 
 def ensure_db():
+    global _db_ready
     if not os.path.exists(DB_DIR):
         os.makedirs(DB_DIR, exist_ok=True)
     if not os.path.exists(RESOURCE_PATH):
         os.makedirs(RESOURCE_PATH, exist_ok=True)
     if not os.path.exists(FILES_DIR):
         os.makedirs(FILES_DIR, exist_ok=True)
-    conn = sqlite3.connect(UID_DB_PATH)
+    conn = connect(UID_DB_PATH)
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS uid_map '
     '(id INTEGER PRIMARY KEY AUTOINCREMENT)')
     conn.commit()
     conn.close()
-    conn = sqlite3.connect(ADMIN_DB_PATH)
+    conn = connect(ADMIN_DB_PATH)
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS admins '
     '(id INTEGER PRIMARY KEY, '
@@ -41,8 +201,9 @@ def ensure_db():
     'full_name TEXT, edit_at TEXT DEFAULT NULL, '
     'shadow_delete INTEGER NOT NULL DEFAULT 0)')
     conn.commit()
+    create_change_log(conn, ADMIN_DB_PATH)
     conn.close()
-    conn = sqlite3.connect(USERS_DB_PATH)
+    conn = connect(USERS_DB_PATH)
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS users '
     '(id INTEGER PRIMARY KEY, '
@@ -50,8 +211,9 @@ def ensure_db():
     'active INTEGER DEFAULT 1, created_at TEXT, full_name TEXT, '
     'edit_at TEXT DEFAULT NULL, shadow_delete INTEGER NOT NULL DEFAULT 0)')
     conn.commit()
+    create_change_log(conn, USERS_DB_PATH)
     conn.close()
-    conn = sqlite3.connect(EXAMS_DB_PATH)
+    conn = connect(EXAMS_DB_PATH)
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS exams '
     '(id INTEGER PRIMARY KEY AUTOINCREMENT, '
@@ -65,8 +227,9 @@ def ensure_db():
     'correct_answers TEXT, score REAL, pictures TEXT DEFAULT NULL, '
     'pool TEXT)')
     conn.commit()
+    create_indexes(conn, EXAMS_DB_PATH)
     conn.close()
-    conn = sqlite3.connect(SCORES_DB_PATH)
+    conn = connect(SCORES_DB_PATH)
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS attempts '
     '(id INTEGER PRIMARY KEY AUTOINCREMENT, '
@@ -81,8 +244,10 @@ def ensure_db():
     'reviewed_at TEXT, manual_score REAL DEFAULT 0.0, '
     'review_comment TEXT)')
     conn.commit()
+    create_indexes(conn, SCORES_DB_PATH)
+    create_change_log(conn, SCORES_DB_PATH)
     conn.close()
-    conn = sqlite3.connect(CONFIG_DB_PATH)
+    conn = connect(CONFIG_DB_PATH)
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS settings '
     '(id INTEGER PRIMARY KEY AUTOINCREMENT, '
@@ -92,9 +257,15 @@ def ensure_db():
     'name TEXT, ip TEXT, username TEXT, '
     'remote_path TEXT, ssh_password TEXT, '
     'is_admin INTEGER DEFAULT 0, active INTEGER DEFAULT 1)')
+    c.execute('CREATE TABLE IF NOT EXISTS push_fingerprints '
+    '(target TEXT, artifact TEXT, fingerprint TEXT, pushed_at TEXT, '
+    'PRIMARY KEY (target, artifact))')
+    c.execute('CREATE TABLE IF NOT EXISTS sync_marks '
+    '(target TEXT, db TEXT, log_id TEXT, seq INTEGER, synced_at TEXT, '
+    'PRIMARY KEY (target, db))')
     conn.commit()
     conn.close()
-    conn = sqlite3.connect(PROGRESS_DB_PATH)
+    conn = connect(PROGRESS_DB_PATH)
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS progress_modules '
     '(id INTEGER PRIMARY KEY AUTOINCREMENT, '
@@ -125,15 +296,18 @@ def ensure_db():
 
     # 兜底：为已有数据库添加 files 列
     try:
-        conn = sqlite3.connect(PROGRESS_DB_PATH)
+        conn = connect(PROGRESS_DB_PATH)
         c = conn.cursor()
         c.execute('ALTER TABLE user_task_progress ADD COLUMN files TEXT DEFAULT NULL')
         conn.commit()
         conn.close()
     except Exception:
         pass
+    conn = connect(PROGRESS_DB_PATH)
+    create_change_log(conn, PROGRESS_DB_PATH)
+    conn.close()
 
-    conn = sqlite3.connect(KB_DB_PATH)
+    conn = connect(KB_DB_PATH)
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS knowledge_base '
     '(id INTEGER PRIMARY KEY AUTOINCREMENT, '
@@ -144,38 +318,93 @@ def ensure_db():
     'uploaded_at TEXT, edit_at TEXT, '
     'deleted INTEGER DEFAULT 0)')
     conn.commit()
+    create_indexes(conn, KB_DB_PATH)
+    create_change_log(conn, KB_DB_PATH)
+    conn.close()
+    _db_ready = True
+
+def _ensure_db_once():
+    if _db_ready:
+        return
+    with _ensure_lock:
+        if not _db_ready:
+            ensure_db()
+
+def file_identity(path):
+    """返回文件的 (st_dev, st_ino)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+def get_conn(db_path):
+    """获取当前线程对应数据库的长连接，首次调用时才检查表结构"""
+    _ensure_db_once()
+    pool = getattr(_local, 'conns', None)
+    if pool is None:
+        pool = _local.conns = {}
+    conn = pool.get(db_path)
+    file_id = file_identity(db_path)
+    if conn is not None and conn.file_id != file_id:
+        # 数据库文件被同步推送整体替换，旧连接仍指向旧文件，需重连
+        conn.close_real()
+        conn = None
+    if conn is None:
+        conn = connect(db_path, factory=PooledConnection)
+        conn.file_id = file_identity(db_path)
+        pool[db_path] = conn
+    elif conn.in_transaction:
+        # 上一次调用异常退出时遗留的事务不应被下一次 commit 带上
+        conn.rollback()
+    return conn
+
+@contextmanager
+def transaction(db_path):
+    """事务上下文：正常退出提交，异常时回滚"""
+    conn = get_conn(db_path)
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def close_thread_connections():
+    """真正关闭当前线程持有的所有连接（线程退出前调用）"""
+    pool = getattr(_local, 'conns', None)
+    if not pool:
+        return
+    for conn in pool.values():
+        try:
+            conn.close_real()
+        except Exception:
+            pass
+    pool.clear()
 
 def get_uid_conn():
-    ensure_db()
-    return sqlite3.connect(UID_DB_PATH)
+    return get_conn(UID_DB_PATH)
 
 def get_admin_conn():
-    ensure_db()
-    return sqlite3.connect(ADMIN_DB_PATH)
+    return get_conn(ADMIN_DB_PATH)
 
 def get_user_conn():
-    ensure_db()
-    return sqlite3.connect(USERS_DB_PATH)
+    return get_conn(USERS_DB_PATH)
 
 def get_exam_conn():
-    ensure_db()
-    return sqlite3.connect(EXAMS_DB_PATH)
+    return get_conn(EXAMS_DB_PATH)
 
 def get_score_conn():
-    ensure_db()
-    return sqlite3.connect(SCORES_DB_PATH)
+    return get_conn(SCORES_DB_PATH)
 
 def get_config_conn():
-    ensure_db()
-    return sqlite3.connect(CONFIG_DB_PATH)
+    return get_conn(CONFIG_DB_PATH)
 
 def get_progress_conn():
-    ensure_db()
-    return sqlite3.connect(PROGRESS_DB_PATH)
+    return get_conn(PROGRESS_DB_PATH)
 
 def get_kb_conn():
-    ensure_db()
-    return sqlite3.connect(KB_DB_PATH)
+    return get_conn(KB_DB_PATH)
 
 def now_iso(timestamp=False, ms_enable=False):
     if timestamp and ms_enable:
@@ -189,7 +418,7 @@ def now_iso(timestamp=False, ms_enable=False):
     
 
 def get_setting(key):
-    conn = sqlite3.connect(CONFIG_DB_PATH)
+    conn = get_config_conn()
     c = conn.cursor()
     c.execute('SELECT value FROM settings WHERE key=?', (key,))
     row = c.fetchone()
@@ -197,13 +426,90 @@ def get_setting(key):
     return row[0] if row else None
 
 def set_setting(key, value):
-    conn = sqlite3.connect(CONFIG_DB_PATH)
+    conn = get_config_conn()
     c = conn.cursor()
     c.execute('DELETE FROM settings WHERE key=?', (key,))
     c.execute('INSERT INTO settings (key, value) VALUES (?,?)', (key, value))
     conn.commit()
     conn.close()
 
+# 附件分片存放的开关（'1' 开启）：须等所有设备都升级到能读取分片布局的版本后再开启，
+# config.db 会随推送下发，各设备随之切换
+FILES_SHARDED_SETTING = 'files_sharded_layout'
+
+def files_sharded_layout():
+    try:
+        return get_setting(FILES_SHARDED_SETTING) == '1'
+    except Exception:
+        return False
+
+def push_target_key(ip, username, remote_path):
+    """推送指纹按 用户@主机:远端目录 区分"""
+    return f'{username}@{ip}:{remote_path}'
+
+def get_push_fingerprints(target):
+    """上次成功推送到 target 的各文件指纹 {artifact: fingerprint}"""
+    conn = get_config_conn()
+    rows = conn.execute('SELECT artifact, fingerprint FROM push_fingerprints WHERE target=?', (target,)).fetchall()
+    conn.close()
+    return {r[0]: r[1] for r in rows}
+
+def set_push_fingerprints(target, fingerprints, removed=()):
+    with transaction(CONFIG_DB_PATH) as conn:
+        now = now_iso()
+        conn.executemany('INSERT INTO push_fingerprints (target, artifact, fingerprint, pushed_at) VALUES (?,?,?,?) '
+                         'ON CONFLICT(target, artifact) DO UPDATE SET fingerprint=excluded.fingerprint, pushed_at=excluded.pushed_at',
+                         [(target, k, v, now) for k, v in fingerprints.items()])
+        conn.executemany('DELETE FROM push_fingerprints WHERE target=? AND artifact=?', [(target, k) for k in removed])
+
+def clear_push_fingerprints(target=None):
+    """清除指纹，下次推送全量发送"""
+    with transaction(CONFIG_DB_PATH) as conn:
+        if target is None:
+            conn.execute('DELETE FROM push_fingerprints')
+        else:
+            conn.execute('DELETE FROM push_fingerprints WHERE target=?', (target,))
+
+def get_sync_mark(target, db, log_id):
+    """上次从 target 合并 db 时的变更序号水位；日志来源不同（或从未同步）时为 0，即全量合并"""
+    if not log_id:
+        return 0
+    conn = get_config_conn()
+    row = conn.execute('SELECT log_id, seq FROM sync_marks WHERE target=? AND db=?', (target, db)).fetchone()
+    conn.close()
+    if not row or row[0] != log_id:
+        return 0
+    return int(row[1] or 0)
+
+def set_sync_marks(target, marks):
+    """记录水位，marks 为 {db: (log_id, seq)}；没有 log_id 的远端库不记录"""
+    rows = [(target, db, log_id, seq, now_iso()) for db, (log_id, seq) in marks.items() if log_id]
+    if not rows:
+        return
+    with transaction(CONFIG_DB_PATH) as conn:
+        conn.executemany('INSERT INTO sync_marks (target, db, log_id, seq, synced_at) VALUES (?,?,?,?,?) '
+                         'ON CONFLICT(target, db) DO UPDATE SET log_id=excluded.log_id, seq=excluded.seq, synced_at=excluded.synced_at',
+                         rows)
+
+def compact_change_log(db_path):
+    """删除所有同步目标的水位都已越过的变更日志条目，返回删除的条数。
+    只看记录的是本库当前日志来源的水位；其他来源或从未同步的目标下次本就全量合并"""
+    log_id, _ = change_log_state(db_path)
+    if not log_id:
+        return 0
+    conn = get_config_conn()
+    row = conn.execute('SELECT MIN(seq) FROM sync_marks WHERE db=? AND log_id=?',
+                       (os.path.basename(db_path), log_id)).fetchone()
+    conn.close()
+    if not row or not row[0]:
+        return 0
+    try:
+        with transaction(db_path) as conn:
+            return conn.execute('DELETE FROM change_log WHERE seq <= ?', (int(row[0]),)).rowcount
+    except sqlite3.DatabaseError as e:
+        print(f"Compact change log on {db_path} failed: {e}")
+        return 0
+
 def ensure_key_probe():
     try:
         v = get_setting('key_probe')
@@ -15,15 +15,17 @@ from database import (
 from db_iter_conf import (
     simple_iter_dict,
     admin_user_table_merge,
-    exam_uuid_migration
+    exam_uuid_migration,
+    secondary_index_migration
 )
 
 # 当前数据库版本，数据库更新需要更改
-__current_db_version__ = "260606"
+__current_db_version__ = "261017"
 __ver_train_dict__ = {
     # 模块名: 模块版本过度标识
     simple_iter_dict.__name__: simple_iter_dict.VER_TRAIN,
-    exam_uuid_migration.__name__: exam_uuid_migration.VER_TRAIN
+    exam_uuid_migration.__name__: exam_uuid_migration.VER_TRAIN,
+    secondary_index_migration.__name__: secondary_index_migration.VER_TRAIN
 }
 
 
@@ -72,6 +74,19 @@ ITER_VERSION_ACTION_MAP = {
             "func": simple_iter_dict.__simple_columns_iter__,
             "param": (__from_iter_dict__,)
         }
+    },
+    "260606": {
+        "next_iter_ver": "261017",
+        "action": [
+            {
+                "func": simple_iter_dict.__simple_columns_iter__,
+                "param": (__from_iter_dict__,)
+            },
+            {
+                "func": secondary_index_migration.__secondary_index_migrate__,
+                "param": (None,)
+            }
+        ]
     }
 }
 
@@ -0,0 +1,47 @@
+"""
+Description: Add secondary indexes to scores/exams/knowledge databases
+Author: GentsunCheng
+"""
+import os
+import sqlite3
+from database import (
+    SCORES_DB_PATH,
+    EXAMS_DB_PATH,
+    KB_DB_PATH,
+    create_indexes,
+)
+
+# 版本过度标识
+VER_TRAIN = {"260606": "261017"}
+
+
+def dedupe_attempt_answers():
+    """唯一索引 (attempt_uuid, question_id) 建立前，只保留每题最新的一条答案"""
+    if not os.path.exists(SCORES_DB_PATH):
+        return
+    conn = sqlite3.connect(SCORES_DB_PATH)
+    c = conn.cursor()
+    try:
+        c.execute('DELETE FROM attempt_answers WHERE id NOT IN '
+                  '(SELECT MAX(id) FROM attempt_answers GROUP BY attempt_uuid, question_id)')
+        conn.commit()
+    except Exception as e:
+        print("attempt_answers 去重失败，已回滚：", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def secondary_index_migrate(param):
+    dedupe_attempt_answers()
+    for db_path in (SCORES_DB_PATH, EXAMS_DB_PATH, KB_DB_PATH):
+        if not os.path.exists(db_path):
+            continue
+        conn = sqlite3.connect(db_path)
+        try:
+            create_indexes(conn, db_path)
+        finally:
+            conn.close()
+
+
+__secondary_index_migrate__ = secondary_index_migrate
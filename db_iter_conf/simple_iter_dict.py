@@ -40,7 +40,8 @@ ITER_DICT = {
         (SCORES_DB_PATH, 'attempt_answers', 'reviewed_at', 'TEXT', 'NULL'),
         (SCORES_DB_PATH, 'attempt_answers', 'manual_score', 'REAL', '0.0'),
         (SCORES_DB_PATH, 'attempt_answers', 'review_comment', 'TEXT', 'NULL')
-    ]
+    ],
+    "261017": []
 }
 
 __all_db__ = [ADMIN_DB_PATH, USERS_DB_PATH, EXAMS_DB_PATH, SCORES_DB_PATH, CONFIG_DB_PATH, PROGRESS_DB_PATH]
@@ -0,0 +1,203 @@
+"""
+FILES_DIR 的内容寻址存储。
+
+文件以 <sha1><扩展名> 命名，并维护 sha1 -> 路径 的内存索引，查找不再需要列出整个目录。
+新文件默认仍平铺在根目录：旧版本只在根目录中查找，分片存放的文件在旧设备上会“消失”。
+整个机房都升级后可开启分片（sharded=True），新文件按 sha1 前两段存放在 ab/cd/ 子目录下，
+单个目录中的条目数保持在很小的范围；两种布局的文件都能被索引到。
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+SHA1_HEX_LEN = 40
+TMP_SUFFIX = '.tmp'
+# 导入中的临时文件放在根目录下的独立子目录，写入不会改变根目录的 mtime
+TMP_DIR_NAME = '.tmp'
+# 导入时每次读取的块大小
+INGEST_BUFFER_SIZE = 4 * 1024 * 1024
+_HEX_DIGITS = frozenset('0123456789abcdef')
+
+
+def sha1_from_name(fname):
+    """从 <sha1><扩展名> 形式的文件名取出 sha1，不是这种形式（或是写入中的临时文件）时返回 None"""
+    if fname.endswith(TMP_SUFFIX):
+        return None
+    head = fname[:SHA1_HEX_LEN]
+    if len(head) == SHA1_HEX_LEN and all(ch in _HEX_DIGITS for ch in head):
+        return head
+    return None
+
+
+class FileStore:
+    def __init__(self, root, sharded=False):
+        self.root = root
+        self.sharded = sharded
+        self._index = None
+        self._root_mtime = None
+        self._lock = threading.Lock()
+
+    def shard_dir(self, sha1):
+        return os.path.join(self.root, sha1[:2], sha1[2:4])
+
+    def path_for(self, sha1, ext=''):
+        """sha1 对应的存放路径：分片目录或根目录"""
+        directory = self.shard_dir(sha1) if self.sharded else self.root
+        return os.path.join(directory, sha1 + ext)
+
+    def _root_stamp(self):
+        try:
+            return os.stat(self.root).st_mtime_ns
+        except OSError:
+            return None
+
+    def _rebuild(self):
+        index = {}
+        stamp = self._root_stamp()
+        for dirpath, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs if d != TMP_DIR_NAME)
+            for fname in sorted(files):
+                sha1 = sha1_from_name(fname)
+                if sha1 and sha1 not in index:
+                    index[sha1] = os.path.join(dirpath, fname)
+        self._index = index
+        self._root_mtime = stamp
+
+    @staticmethod
+    def _find_in(directory, sha1):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return None
+        for fname in names:
+            if sha1_from_name(fname) == sha1:
+                return os.path.join(directory, fname)
+        return None
+
+    def lookup(self, sha1):
+        """返回 sha1 对应文件的路径，不存在时返回 None"""
+        if not sha1:
+            return None
+        with self._lock:
+            if self._index is None:
+                self._rebuild()
+            path = self._index.get(sha1)
+            if path and os.path.exists(path):
+                return path
+            # 索引未命中或已失效（文件可能由同步写入）：先看分片目录，
+            # 根目录有变化（旧版平铺文件）时再整体重建一次
+            path = self._find_in(self.shard_dir(sha1), sha1)
+            if path is None and self._root_stamp() != self._root_mtime:
+                self._rebuild()
+                path = self._index.get(sha1)
+            if path:
+                self._index[sha1] = path
+            else:
+                self._index.pop(sha1, None)
+            return path
+
+    def _own_change(self, action):
+        """执行会改变根目录 mtime 的自身写入（新建一级分片、平铺文件的增删）；
+        若此前索引与根目录一致，则同步记录新的 mtime，避免自己的写入触发整体重建"""
+        with self._lock:
+            in_sync = self._index is not None and self._root_stamp() == self._root_mtime
+        result = action()
+        if in_sync:
+            with self._lock:
+                self._root_mtime = self._root_stamp()
+        return result
+
+    def _makedirs(self, path):
+        if not os.path.isdir(path):
+            self._own_change(lambda: os.makedirs(path, exist_ok=True))
+
+    def _commit(self, tmp, sha1, ext):
+        """把写好的临时文件原子改名到分片位置，内容已存在时丢弃临时文件"""
+        existing = self.lookup(sha1)
+        if existing:
+            os.remove(tmp)
+            return existing
+        dest = self.path_for(sha1, ext)
+        self._makedirs(os.path.dirname(dest))
+        self._own_change(lambda: os.replace(tmp, dest))
+        with self._lock:
+            if self._index is not None:
+                self._index[sha1] = dest
+        return dest
+
+    def ingest(self, source_path, ext='', progress=None):
+        """单遍导入未知 sha1 的文件：大块读取源文件，边算 sha1 边写入 .tmp 子目录中的临时文件，
+        完成后原子改名到分片位置。progress(done, total) 每块回调一次，回调抛出异常即中止导入。
+        返回 (sha1, 路径)"""
+        total = os.path.getsize(source_path)
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, TMP_DIR_NAME)
+        self._makedirs(tmp_dir)
+        fd, tmp = tempfile.mkstemp(prefix='ingest-', suffix=TMP_SUFFIX, dir=tmp_dir)
+        h = hashlib.sha1()
+        buf = bytearray(INGEST_BUFFER_SIZE)
+        view = memoryview(buf)
+        done = 0
+        try:
+            with open(source_path, 'rb', buffering=0) as src, os.fdopen(fd, 'wb') as out:
+                while True:
+                    n = src.readinto(buf)
+                    if not n:
+                        break
+                    h.update(view[:n])
+                    out.write(view[:n])
+                    done += n
+                    if progress:
+                        progress(done, total)
+            shutil.copystat(source_path, tmp)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        sha1 = h.hexdigest()
+        return sha1, self._commit(tmp, sha1, ext)
+
+    def put(self, source_path, sha1, ext=''):
+        """把已知 sha1 的文件（如同步拉取的文件）放入存储，内容已存在时直接返回已有路径"""
+        existing = self.lookup(sha1)
+        if existing:
+            return existing
+        dest = self.path_for(sha1, ext)
+        self._makedirs(os.path.dirname(dest))
+        tmp = os.path.join(self.root, TMP_DIR_NAME, os.path.basename(dest) + TMP_SUFFIX)
+        self._makedirs(os.path.dirname(tmp))
+        # sha1 已知时无需经过用户态，copy2 在 Linux/macOS 上走 sendfile/fcopyfile
+        shutil.copy2(source_path, tmp)
+        return self._commit(tmp, sha1, ext)
+
+    def remove(self, sha1):
+        path = self.lookup(sha1)
+        if path and os.path.exists(path):
+            self._own_change(lambda: os.remove(path))
+        with self._lock:
+            if self._index is not None:
+                self._index.pop(sha1, None)
+        return path
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(root, sharded=None):
+    """按根目录复用 FileStore 实例；sharded 不为 None 时同时更新新文件的存放布局"""
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = FileStore(root)
+        if sharded is not None:
+            store.sharded = bool(sharded)
+        return store
@@ -12,9 +12,12 @@
 """
 
 import os
+import bisect
 import shutil
 import logging
 import html
+import threading
+from collections import OrderedDict
 
 import fitz
 import markdown as md_lib
@@ -22,8 +25,8 @@ from docx import Document
 from pptx import Presentation
 from openpyxl import load_workbook
 
-from PySide6.QtCore import Qt, QUrl, QTimer
-from PySide6.QtGui import QPixmap, QImage, QFont, QDesktopServices
+from PySide6.QtCore import Qt, QUrl, QTimer, QThread, Signal, QRect
+from PySide6.QtGui import QPixmap, QImage, QFont, QDesktopServices, QPainter, QColor
 from PySide6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QTextBrowser,
     QScrollArea, QPushButton, QTabWidget, QWidget, QSizePolicy,
@@ -50,6 +53,18 @@ _MEDIA_EXTS = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.mp3',
 # 降级为系统打开的格式
 _FALLBACK_EXTS = {'.doc', '.xls', '.ppt', '.zip', '.rar', '.7z'}
 
+# PDF 虚拟化显示：只渲染可见页及前后少量页面，像素缓存按占用内存淘汰
+_PDF_DEFAULT_ZOOM = 150.0 / 72.0  # 默认相当于 150 DPI
+_PDF_MIN_ZOOM = 0.5
+_PDF_MAX_ZOOM = 6.0
+_PDF_ZOOM_STEP = 1.25
+_PDF_LOOKAHEAD = 2
+_PDF_CACHE_MAX_BYTES = 128 * 1024 * 1024
+# 单页渲染的最大边长（像素），更大的缩放由绘制时拉伸，避免单页占用数百 MB
+_PDF_MAX_RENDER_SIDE = 4096
+_PDF_MARGIN = 8
+_PDF_LABEL_HEIGHT = 22
+
 
 def is_supported_format(file_path):
     """判断文件是否可在应用内查看"""
@@ -375,6 +390,17 @@ class FileViewerDialog(QDialog):
     # ------------------------------------------------------------------ #
     def _build_pdf_viewer(self):
         doc = fitz.open(self.file_path)
+        try:
+            # 只读取页面尺寸（不渲染），用于预先排版整份文档
+            page_sizes = [(page.rect.width, page.rect.height) for page in doc]
+        finally:
+            doc.close()
+
+        wrapper = QWidget()
+        wrapper_layout = QVBoxLayout(wrapper)
+        wrapper_layout.setContentsMargins(0, 0, 0, 0)
+        wrapper_layout.setSpacing(6)
+
         scroll = QScrollArea()
         scroll.setWidgetResizable(False)
         scroll.setAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop)
@@ -382,48 +408,41 @@ class FileViewerDialog(QDialog):
             f"QScrollArea {{ border: 1px solid {self.colors['border']}; border-radius: 6px; "
             f"background-color: {self.colors['background']}; }}"
         )
-
-        container = QWidget()
-        container_layout = QVBoxLayout()
-        container_layout.setContentsMargins(8, 8, 8, 8)
-        container_layout.setSpacing(8)
-        container_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop)
-
-        # DPI 缩放：使用 150 DPI 作为默认渲染精度
-        zoom = 150.0 / 72.0
-        mat = fitz.Matrix(zoom, zoom)
-
-        page_count = doc.page_count
-        for page_num in range(page_count):
-            page = doc.load_page(page_num)
-            pix = page.get_pixmap(matrix=mat)
-
-            # 将 pixmap 数据转为 QImage
-            img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-            qpix = QPixmap.fromImage(img.copy())
-
-            page_label = QLabel()
-            page_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            page_label.setPixmap(qpix)
-            page_label.setStyleSheet(
-                f"background-color: {self.colors['card_background']}; "
-                f"border: 1px solid {self.colors['border']}; border-radius: 4px;"
-            )
-            container_layout.addWidget(page_label)
-
-            # 页码标注
-            page_info = QLabel(f"— {page_num + 1} / {page_count} —")
-            page_info.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            page_info.setStyleSheet(
-                f"color: {self.colors['text_tertiary']}; font-size: 11px; padding: 2px 0;"
-            )
-            container_layout.addWidget(page_info)
-
-        container_layout.addStretch()
-        container.setLayout(container_layout)
-        scroll.setWidget(container)
-        doc.close()
-        return scroll
+        canvas = _PdfPageCanvas(self.file_path, page_sizes, self.colors)
+        scroll.setWidget(canvas)
+        self.finished.connect(canvas.shutdown)
+
+        zoom_row = QHBoxLayout()
+        zoom_row.addStretch()
+        btn_zoom_out = QPushButton('−')
+        zoom_label = QLabel()
+        zoom_label.setMinimumWidth(56)
+        zoom_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        zoom_label.setStyleSheet(f"color: {self.colors['text_secondary']}; font-size: 12px;")
+        btn_zoom_in = QPushButton('+')
+        btn_zoom_out.setFixedWidth(36)
+        btn_zoom_in.setFixedWidth(36)
+        zoom_row.addWidget(btn_zoom_out)
+        zoom_row.addWidget(zoom_label)
+        zoom_row.addWidget(btn_zoom_in)
+
+        def set_zoom(zoom):
+            bar = scroll.verticalScrollBar()
+            old_height = max(1, canvas.height())
+            anchor = bar.value() + bar.pageStep() / 2
+            canvas.set_zoom(zoom)
+            # 保持视口中心对准同一位置
+            bar.setValue(int(anchor * canvas.height() / old_height - bar.pageStep() / 2))
+            zoom_label.setText(f"{round(canvas.zoom / _PDF_DEFAULT_ZOOM * 100)}%")
+
+        btn_zoom_out.clicked.connect(lambda: set_zoom(canvas.zoom / _PDF_ZOOM_STEP))
+        btn_zoom_in.clicked.connect(lambda: set_zoom(canvas.zoom * _PDF_ZOOM_STEP))
+        canvas.zoom_requested.connect(lambda steps: set_zoom(canvas.zoom * _PDF_ZOOM_STEP ** steps))
+        set_zoom(_PDF_DEFAULT_ZOOM)
+
+        wrapper_layout.addLayout(zoom_row)
+        wrapper_layout.addWidget(scroll, 1)
+        return wrapper
 
     # ------------------------------------------------------------------ #
     #  DOCX 文件渲染 (python-docx)
@@ -832,6 +851,218 @@ class FileViewerDialog(QDialog):
         QDesktopServices.openUrl(QUrl.fromLocalFile(self.file_path))
 
 
+class _PdfRenderWorker(QThread):
+    """PDF 后台渲染线程：独立打开一份文档，按最近一次请求的顺序逐页渲染"""
+    rendered = Signal(int, float, QImage)
+
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
+        self._file_path = file_path
+        self._cond = threading.Condition()
+        self._pending = []
+        self._stopped = False
+
+    def request(self, items):
+        """以 [(页码, 渲染倍率)] 替换待渲染队列；已排队但不再需要的页面直接丢弃"""
+        with self._cond:
+            self._pending = list(items)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._pending = []
+            self._cond.notify()
+        self.wait()
+
+    def run(self):
+        doc = fitz.open(self._file_path)
+        try:
+            while True:
+                with self._cond:
+                    while not self._pending and not self._stopped:
+                        self._cond.wait()
+                    if self._stopped:
+                        return
+                    page, scale = self._pending.pop(0)
+                try:
+                    pix = doc.load_page(page).get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+                    img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888).copy()
+                except Exception as e:
+                    logger.warning("PDF 第 %s 页渲染失败: %s", page + 1, e)
+                    continue
+                self.rendered.emit(page, scale, img)
+        finally:
+            doc.close()
+
+
+class _PdfPageCanvas(QWidget):
+    """
+    虚拟化的 PDF 页面画布。
+
+    按页面尺寸与缩放预先排版出整体高度，绘制时只画可见页面；
+    像素由后台线程按需渲染，放在按内存淘汰的 LRU 中。缩放后旧像素先拉伸显示，
+    新的渲染完成后替换。
+    """
+    zoom_requested = Signal(int)
+
+    def __init__(self, file_path, page_sizes, colors, parent=None):
+        super().__init__(parent)
+        self._page_sizes = page_sizes
+        self._colors = colors
+        self.zoom = _PDF_DEFAULT_ZOOM
+        self._tops = []
+        self._cache = OrderedDict()  # page -> (scale, QPixmap)
+        self._cache_bytes = 0
+        # 当前可见的页面，淘汰时跳过，避免可见页被淘汰后反复重渲染
+        self._pinned = frozenset()
+        self._last_request = None
+        self._worker = _PdfRenderWorker(file_path)
+        self._worker.rendered.connect(self._on_rendered)
+        # 画布随对话框销毁时同样要停下渲染线程，否则 QThread 在运行中被析构
+        self.destroyed.connect(self._worker.stop)
+        self._worker.start()
+        self._relayout()
+
+    def shutdown(self):
+        if self._worker is not None:
+            self._worker.stop()
+            self._worker = None
+        self._cache.clear()
+        self._cache_bytes = 0
+
+    def set_zoom(self, zoom):
+        self.zoom = min(_PDF_MAX_ZOOM, max(_PDF_MIN_ZOOM, zoom))
+        self._last_request = None
+        self._relayout()
+        self.update()
+
+    def _relayout(self):
+        self._tops = []
+        y = _PDF_MARGIN
+        width = 0
+        for w, h in self._page_sizes:
+            self._tops.append(y)
+            y += int(h * self.zoom) + _PDF_LABEL_HEIGHT + _PDF_MARGIN
+            width = max(width, int(w * self.zoom))
+        self.setFixedSize(width + 2 * _PDF_MARGIN, max(y, 1))
+
+    def _page_rect(self, page):
+        w, h = self._page_sizes[page]
+        w, h = int(w * self.zoom), int(h * self.zoom)
+        return QRect((self.width() - w) // 2, self._tops[page], w, h)
+
+    def _render_scale(self, page):
+        w, h = self._page_sizes[page]
+        scale = self.zoom * self.devicePixelRatioF()
+        return min(scale, _PDF_MAX_RENDER_SIDE / max(w, h, 1))
+
+    def _page_bytes(self, page):
+        w, h = self._page_sizes[page]
+        scale = self._render_scale(page)
+        return int(w * scale) * int(h * scale) * 4
+
+    @staticmethod
+    def _pixmap_bytes(pix):
+        return pix.width() * pix.height() * 4
+
+    def _evict(self):
+        for page in list(self._cache):
+            if self._cache_bytes <= _PDF_CACHE_MAX_BYTES:
+                break
+            if page in self._pinned:
+                continue
+            _, pix = self._cache.pop(page)
+            self._cache_bytes -= self._pixmap_bytes(pix)
+
+    def _visible_pages(self):
+        area = self.visibleRegion().boundingRect()
+        if not self._tops or area.isEmpty():
+            return range(0)
+        first = max(0, bisect.bisect_right(self._tops, area.top()) - 1)
+        last = max(first, bisect.bisect_left(self._tops, area.bottom()) - 1)
+        return range(first, min(last, len(self._tops) - 1) + 1)
+
+    def _request_visible(self, visible):
+        if self._worker is None or not visible:
+            return
+        wanted = list(visible)
+        # 预读页只在可见页之外还放得下时才请求；可见页本身就占满预算时不预读
+        budget = _PDF_CACHE_MAX_BYTES - sum(self._page_bytes(p) for p in visible)
+        for k in range(1, _PDF_LOOKAHEAD + 1):
+            for p in (visible[-1] + k, visible[0] - k):
+                if 0 <= p < len(self._tops):
+                    budget -= self._page_bytes(p)
+                    if budget < 0:
+                        break
+                    wanted.append(p)
+            if budget < 0:
+                break
+        items = [(p, self._render_scale(p)) for p in wanted]
+        items = tuple(item for item in items if self._cache.get(item[0], (None,))[0] != item[1])
+        if items != self._last_request:
+            self._last_request = items
+            self._worker.request(items)
+
+    def _on_rendered(self, page, scale, img):
+        if self._worker is None:
+            return
+        # 缩放已变化时，旧倍率的结果只在该页还没有任何像素时使用
+        if scale != self._render_scale(page) and page in self._cache:
+            return
+        size = img.width() * img.height() * 4
+        old = self._cache.get(page)
+        freed = self._pixmap_bytes(old[1]) if old is not None else 0
+        pinned_bytes = sum(self._pixmap_bytes(v[1]) for p, v in self._cache.items() if p in self._pinned and p != page)
+        # 已滚出视野的页面放不下时直接丢弃，不挤掉可见页
+        if page not in self._pinned and pinned_bytes + size > _PDF_CACHE_MAX_BYTES:
+            return
+        self._cache.pop(page, None)
+        self._cache_bytes -= freed
+        self._cache[page] = (scale, QPixmap.fromImage(img))
+        self._cache_bytes += size
+        self._evict()
+        self.update(self._page_rect(page))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        exposed = event.rect()
+        border = QColor(self._colors['border'])
+        placeholder = QColor(self._colors['card_background'])
+        painter.setPen(QColor(self._colors['text_tertiary']))
+        total = len(self._tops)
+        first = max(0, bisect.bisect_right(self._tops, exposed.top()) - 1)
+        for page in range(first, total):
+            rect = self._page_rect(page)
+            if rect.top() > exposed.bottom():
+                break
+            entry = self._cache.get(page)
+            if entry is not None:
+                self._cache.move_to_end(page)
+                painter.drawPixmap(rect, entry[1])
+            else:
+                painter.fillRect(rect, placeholder)
+            painter.save()
+            painter.setPen(border)
+            painter.drawRect(rect.adjusted(0, 0, -1, -1))
+            painter.restore()
+            # 页码标注
+            label_rect = QRect(0, rect.bottom() + 1, self.width(), _PDF_LABEL_HEIGHT)
+            painter.drawText(label_rect, Qt.AlignmentFlag.AlignCenter, f"— {page + 1} / {total} —")
+        painter.end()
+        visible = self._visible_pages()
+        self._pinned = frozenset(visible)
+        self._request_visible(visible)
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            steps = 1 if event.angleDelta().y() > 0 else -1
+            self.zoom_requested.emit(steps)
+            event.accept()
+            return
+        event.ignore()
+
+
 def _escape(text):
     """HTML 转义"""
     return html.escape(str(text))
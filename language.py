@@ -58,6 +58,8 @@ _DICT = {
         'common.confirm': '确认',
         'common.ok': '确定',
         'common.cancel': '取消',
+        'upload.progress_title': '上传中',
+        'upload.progress_message': '正在上传 {name}...',
         'common.close': '关闭',
         'common.confirm_delete_target': '确定要删除该目标吗？',
         'viewer.open_external': '用外部程序打开',
@@ -229,10 +231,16 @@ _DICT = {
         'admin.import.error.no_valid': '没有任何有效题目',
         'admin.import.success': '导入成功：单选{single} 多选{multiple} 判断{truefalse} 填空{fill} 简答{essay}；必考{mandatory} 随机{random}{extra}',
         'admin.import.extra_prefix': '\n部分题目未导入：\n',
+        'admin.import.progress.reading': '正在读取文件…',
+        'admin.import.progress.parsing': '正在解析 {sheet}…',
+        'admin.import.progress.writing': '正在写入题目 {done}/{total}',
         'admin.exams.clear_confirm': '确定要清空该试题的所有题目吗？',
         'admin.exams.clear_done': '已清空该试题的所有题目',
         'admin.exams.delete_confirm': '确定要删除该试题吗？所有相关题目与成绩将一并删除',
         'admin.exams.delete_done': '试题已删除',
+        'admin.exams.regrade': '重新评分',
+        'admin.exams.regrade_confirm': '确定按当前答案重新评分该试题的所有已交卷记录吗？',
+        'admin.exams.regrade_done': '已重新评分 {count} 条记录',
         'admin.questions.title': '题目管理',
         'admin.questions.back': '返回',
         'admin.questions.mandatory_group': '必考题',
@@ -313,6 +321,15 @@ _DICT = {
         'sync.push_btn': '同步题库到设备',
         'sync.pull_btn': '拉取成绩',
         'sync.sync_btn': '同步数据',
+        'sync.scan_btn': '检测在线状态',
+        'sync.scan_result': '在线设备 {online}/{total}',
+        'sync.reach.online': '在线',
+        'sync.reach.offline': '离线（SSH 端口不可达）',
+        'sync.export_bundle_btn': '导出同步包',
+        'sync.import_bundle_btn': '导入同步包',
+        'sync.bundle_filter': '同步包 (*.exbundle)',
+        'sync.bundle_exporting_message': '正在导出同步包，请稍候...',
+        'sync.bundle_importing_message': '正在导入同步包，请稍候...',
         'sync.progress.title': '同步中',
         'sync.pushing_message': '正在同步题库到设备，请稍候...',
         'sync.pulling_message': '正在拉取成绩，请稍候...',
@@ -429,6 +446,9 @@ _DICT = {
         'exam.confirm_exit': '确定要退出考试吗？未作答的题目按0分，其他题目正常记分',
         'exam.exit_result': '已退出考试，得分:{score} {pass_text}',
         'exam.unanswered_note': '（未作答按0分）',
+        'exam.autosave_failed': '作答保存失败，将自动重试：{error}',
+        'exam.submit_blocked': '作答尚未保存成功，暂不能交卷，请稍后重试',
+        'exam.answers_lost': '考试时间已到，有 {count} 道题的作答未能保存，按已保存的作答交卷',
         'admin.review.title': '简答题批阅',
         'admin.review.save': '保存批阅',
         'admin.review.saved': '批阅已保存',
@@ -451,6 +471,8 @@ _DICT = {
         'common.confirm': 'Confirm',
         'common.ok': 'OK',
         'common.cancel': 'Cancel',
+        'upload.progress_title': 'Uploading',
+        'upload.progress_message': 'Uploading {name}...',
         'common.close': 'Close',
         'common.confirm_delete_target': 'Are you sure you want to delete this target?',
         'viewer.open_external': 'Open with External App',
@@ -610,10 +632,16 @@ _DICT = {
         'admin.import.error.no_valid': 'No valid questions',
         'admin.import.success': 'Imported: Single {single} Multiple {multiple} True/False {truefalse} Fill {fill} Essay {essay}; Mandatory {mandatory} Random {random}{extra}',
         'admin.import.extra_prefix': '\nSome questions were not imported:\n',
+        'admin.import.progress.reading': 'Reading file…',
+        'admin.import.progress.parsing': 'Parsing {sheet}…',
+        'admin.import.progress.writing': 'Writing questions {done}/{total}',
         'admin.exams.clear_confirm': 'Clear all questions of this exam?',
         'admin.exams.clear_done': 'All questions of this exam have been cleared',
         'admin.exams.delete_confirm': 'Delete this exam? Related questions and scores will be removed',
         'admin.exams.delete_done': 'Exam deleted',
+        'admin.exams.regrade': 'Regrade',
+        'admin.exams.regrade_confirm': 'Regrade all submitted attempts of this exam with the current answer key?',
+        'admin.exams.regrade_done': '{count} attempts regraded',
         'admin.questions.title': 'Question Management',
         'admin.questions.back': 'Back',
         'admin.questions.mandatory_group': 'Mandatory',
@@ -688,6 +716,15 @@ _DICT = {
         'sync.push_btn': 'Push exam DB to devices',
         'sync.pull_btn': 'Pull scores',
         'sync.sync_btn': 'Sync Data',
+        'sync.scan_btn': 'Check Online',
+        'sync.scan_result': 'Online devices {online}/{total}',
+        'sync.reach.online': 'Online',
+        'sync.reach.offline': 'Offline (SSH port unreachable)',
+        'sync.export_bundle_btn': 'Export Sync Bundle',
+        'sync.import_bundle_btn': 'Import Sync Bundle',
+        'sync.bundle_filter': 'Sync bundle (*.exbundle)',
+        'sync.bundle_exporting_message': 'Exporting sync bundle, please wait...',
+        'sync.bundle_importing_message': 'Importing sync bundle, please wait...',
         'sync.progress.title': 'Syncing',
         'sync.pushing_message': 'Pushing exam DB to devices, please wait...',
         'sync.pulling_message': 'Pulling scores, please wait...',
@@ -810,6 +847,9 @@ _DICT = {
         'exam.confirm_exit': 'Are you sure to exit the exam? Unanswered questions will be scored as 0',
         'exam.exit_result': 'Exited. Score:{score} {pass_text}',
         'exam.unanswered_note': ' (Unanswered scored as 0)',
+        'exam.autosave_failed': 'Failed to save answers, will retry automatically: {error}',
+        'exam.submit_blocked': 'Answers have not been saved yet, cannot submit now. Please try again later',
+        'exam.answers_lost': 'Time is up. Answers to {count} questions could not be saved; submitting with the saved answers',
         'exam.question_title': '{index}/{total} {text} ({type} Score:{score})',
         'admin.review.title': 'Essay Review',
         'admin.review.save': 'Save Review',
@@ -3,7 +3,7 @@ import sys
 from PySide6.QtWidgets import QApplication, QMainWindow, QStackedWidget, QGraphicsOpacityEffect
 from PySide6.QtGui import QKeySequence, QShortcut, QPalette
 from PySide6.QtCore import QPropertyAnimation, QEasingCurve, QRect, QParallelAnimationGroup
-from database import ensure_db
+from database import ensure_db, close_thread_connections
 from db_iter import iter_loop
 from models import create_admin_if_absent
 from utils import load_binary
@@ -167,4 +167,6 @@ if __name__ == '__main__':
     theme_manager.install_smooth_scroll(app)
     win = MainWindow()
     win.show()
-    sys.exit(app.exec())
+    ret = app.exec()
+    close_thread_connections()
+    sys.exit(ret)
@@ -1,9 +1,13 @@
 import os
+import copy
+import itertools
 import random
+import threading
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from io import BytesIO
 from datetime import datetime, UTC
-from PIL import Image
+from PIL import Image, ImageFile, features
 from PySide6.QtGui import QImage
 from database import (
     get_uid_conn,
@@ -19,10 +23,22 @@ from database import (
     verify_db_encryption_key,
     RESOURCE_PATH,
     FILES_DIR,
+    EXAMS_DB_PATH,
+    SCORES_DB_PATH,
+    USERS_DB_PATH,
+    ADMIN_DB_PATH,
+    file_identity,
+    transaction,
+    push_target_key,
+    files_sharded_layout,
+    close_thread_connections,
 )
 from utils import hash_password, verify_password
+from file_store import get_store
+from sized_lru import SizedLRUCache
 import sqlite3
-from crypto_util import encrypt_text, decrypt_text, encrypt_json, decrypt_json, aes_bytesio
+from crypto_util import (encrypt_text, decrypt_text, encrypt_json, decrypt_json, encrypt_many, decrypt_many, aes_bytesio,
+                         EncryptWriter, iter_decrypt, is_stream_encrypted, STREAM_MAGIC)
 import hashlib
 import hmac
 import json
@@ -35,7 +51,6 @@ DELETE_IDENTIFIER = '␡'
 
 import hashlib
 import os
-import shutil
 import mimetypes
 
 
@@ -58,28 +73,15 @@ def get_exam_uuid(exam_id):
 
 def get_file_path(sha1):
     """根据 SHA1 在 FILES_DIR 中查找文件（支持带扩展名的文件）"""
-    for fname in os.listdir(FILES_DIR):
-        if fname.startswith(sha1):
-            return os.path.join(FILES_DIR, fname)
-    return None
+    return get_store(FILES_DIR, files_sharded_layout()).lookup(sha1)
 
 
-def save_task_file(source_path):
-    """保存任务附件到 FILES_DIR，返回文件元数据 dict"""
+def save_task_file(source_path, progress=None):
+    """保存任务附件到 FILES_DIR，返回文件元数据 dict；progress(done, total) 为写入进度回调"""
     if not os.path.exists(source_path):
         return None
-    sha1 = hashlib.sha1()
-    with open(source_path, 'rb') as f:
-        while True:
-            chunk = f.read(8192)
-            if not chunk:
-                break
-            sha1.update(chunk)
-    sha1_hex = sha1.hexdigest()
     _, ext = os.path.splitext(source_path)
-    dest = os.path.join(FILES_DIR, sha1_hex + ext)
-    if not os.path.exists(dest):
-        shutil.copy2(source_path, dest)
+    sha1_hex, dest = get_store(FILES_DIR, files_sharded_layout()).ingest(source_path, ext, progress)
     stat = os.stat(dest)
     original_name = os.path.basename(source_path)
     mime_type, _ = mimetypes.guess_type(original_name)
@@ -96,9 +98,7 @@ def save_task_file(source_path):
 
 def delete_task_file(sha1):
     """从 FILES_DIR 删除指定 SHA1 的文件"""
-    path = get_file_path(sha1)
-    if path and os.path.exists(path):
-        os.remove(path)
+    get_store(FILES_DIR, files_sharded_layout()).remove(sha1)
 
 
 
@@ -237,11 +237,8 @@ def list_users():
         c.execute('SELECT id, username, NULL as full_name, role, active, created_at FROM users WHERE shadow_delete=0 ORDER BY id DESC')
     rows = c.fetchall()
     conn.close()
-    out = []
-    for r in rows:
-        fn = r[2]
-        out.append((r[0], r[1], decrypt_text(fn) if fn else None, r[3], r[4], r[5]))
-    return out
+    names = decrypt_many([r[2] or None for r in rows])
+    return [(r[0], r[1], fn, r[3], r[4], r[5]) for r, fn in zip(rows, names)]
 
 def list_admins():
     conn = get_admin_conn()
@@ -252,25 +249,23 @@ def list_admins():
         c.execute('SELECT id, username, NULL as full_name, active, created_at FROM admins WHERE shadow_delete=0 ORDER BY id DESC')
     rows = c.fetchall()
     conn.close()
-    out = []
-    for r in rows:
-        fn = r[2]
-        out.append((r[0], r[1], decrypt_text(fn) if fn else None, 'admin', r[3], r[4]))
-    return out
+    names = decrypt_many([r[2] or None for r in rows])
+    return [(r[0], r[1], fn, 'admin', r[3], r[4]) for r, fn in zip(rows, names)]
 
 def update_admin_active(admin_id, active):
     conn = get_admin_conn()
     c = conn.cursor()
     current_time = now_iso(timestamp=True)
     if int(active) == 0:
+        remain = 1
         try:
             c.execute('SELECT COUNT(*) FROM admins WHERE active=1 AND id!=?', (admin_id,))
             remain = c.fetchone()[0]
-            if int(remain or 0) <= 0:
-                conn.close()
-                raise Exception('至少保留一个启用的管理员')
         except Exception:
             pass
+        if int(remain or 0) <= 0:
+            conn.close()
+            raise Exception('至少保留一个启用的管理员')
     c.execute(f'UPDATE admins '
     f'SET active=?, edit_at="{current_time}" WHERE id=?', 
     (int(active), admin_id))
@@ -420,6 +415,68 @@ def get_exam_title(exam_id):
     conn.close()
     return decrypt_text(row[0]) if row else None
 
+# ===== 题库缓存 =====
+# exam_uuid -> 解密后的题目元组；写操作显式失效，exams.db 被整体替换时全部失效
+_question_bank_cache = {}
+_question_bank_lock = threading.Lock()
+_question_bank_state = {'generation': 0, 'file_id': None}
+
+
+def invalidate_question_bank(exam_uuid=None):
+    """使题库缓存失效，exam_uuid 为 None 时清空全部"""
+    with _question_bank_lock:
+        _question_bank_state['generation'] += 1
+        if exam_uuid is None:
+            _question_bank_cache.clear()
+        else:
+            _question_bank_cache.pop(exam_uuid, None)
+
+
+def _invalidate_question_bank_by_qid(c, question_id):
+    c.execute('SELECT exam_uuid FROM questions WHERE id=?', (question_id,))
+    row = c.fetchone()
+    invalidate_question_bank(row[0] if row else None)
+
+
+def get_question_bank(exam_uuid):
+    """返回缓存的整套题目（含 pool），调用方只读，不得修改"""
+    file_id = file_identity(EXAMS_DB_PATH)
+    with _question_bank_lock:
+        if _question_bank_state['file_id'] != file_id:
+            _question_bank_cache.clear()
+            _question_bank_state['file_id'] = file_id
+            _question_bank_state['generation'] += 1
+        bank = _question_bank_cache.get(exam_uuid)
+        if bank is not None:
+            return bank
+        generation = _question_bank_state['generation']
+    conn = get_exam_conn()
+    c = conn.cursor()
+    try:
+        c.execute('SELECT id, type, text, options, correct_answers, score, pictures, pool FROM questions WHERE exam_uuid=? ORDER BY id', (exam_uuid,))
+    except Exception:
+        c.execute('SELECT id, type, text, options, correct_answers, score, pictures, NULL as pool FROM questions WHERE exam_uuid=? ORDER BY id', (exam_uuid,))
+    rows = c.fetchall()
+    conn.close()
+    texts = decrypt_many([r[2] or None for r in rows])
+    options = decrypt_many([r[3] for r in rows], as_json=True)
+    corrects = decrypt_many([r[4] for r in rows], as_json=True)
+    bank = tuple({
+        'id': r[0],
+        'type': r[1],
+        'text': text or '',
+        'options': opts or [],
+        'correct': correct or [],
+        'score': r[5],
+        'pictures': r[6],
+        'pool': r[7],
+    } for r, text, opts, correct in zip(rows, texts, options, corrects))
+    with _question_bank_lock:
+        if _question_bank_state['generation'] == generation:
+            _question_bank_cache[exam_uuid] = bank
+    return bank
+
+
 def add_question(exam_uuid, qtype, text, options, correct_answers, score, pool='mandatory'):
     conn = get_exam_conn()
     c = conn.cursor()
@@ -427,6 +484,7 @@ def add_question(exam_uuid, qtype, text, options, correct_answers, score, pool='
     conn.commit()
     new_id = c.lastrowid
     conn.close()
+    invalidate_question_bank(exam_uuid)
     return new_id
 
 
@@ -435,6 +493,7 @@ def update_question(question_id, qtype, text, options, correct_answers, score, p
     c = conn.cursor()
     c.execute('UPDATE questions SET type=?, text=?, options=?, correct_answers=?, score=?, pool=? WHERE id=?', (qtype, encrypt_text(text), encrypt_json(options or []), encrypt_json(correct_answers), float(score), pool, question_id))
     conn.commit()
+    _invalidate_question_bank_by_qid(c, question_id)
     conn.close()
 
 
@@ -447,32 +506,20 @@ def delete_question(question_id):
         try:
             pic_list = json.loads(row[0])
             for p in pic_list:
-                picture_path = os.path.join(RESOURCE_PATH, p)
-                if os.path.exists(picture_path):
-                    os.remove(picture_path)
+                remove_pic(p)
         except Exception:
             pass
+    _invalidate_question_bank_by_qid(c, question_id)
     c.execute('DELETE FROM questions WHERE id=?', (question_id,))
     conn.commit()
     conn.close()
 
 def list_questions(exam_uuid):
-    conn = get_exam_conn()
-    c = conn.cursor()
-    c.execute('SELECT id, type, text, options, correct_answers, score, pictures FROM questions WHERE exam_uuid=? ORDER BY id', (exam_uuid,))
-    rows = c.fetchall()
-    conn.close()
     result = []
-    for r in rows:
-        result.append({
-            'id': r[0], 
-            'type': r[1], 
-            'text': decrypt_text(r[2]) if r[2] else '', 
-            'options': decrypt_json(r[3]) or [], 
-            'correct': decrypt_json(r[4]) or [], 
-            'score': r[5],
-            'pictures': r[6]
-        })
+    for q in get_question_bank(exam_uuid):
+        q = copy.deepcopy(q)
+        del q['pool']
+        result.append(q)
     return result
 
 def get_exam_stats(exam_uuid):
@@ -485,14 +532,26 @@ def get_exam_stats(exam_uuid):
     total = float(row[1]) if row and row[1] is not None else 0.0
     return {'count': cnt, 'total_score': total}
 
-def import_questions_from_json(exam_uuid, payload):
-    conn = get_exam_conn()
-    c = conn.cursor()
-    for q in payload:
-        pool = (q.get('pool') or q.get('category') or 'mandatory')
-        c.execute('INSERT INTO questions (exam_uuid, type, text, options, correct_answers, score, pictures, pool) VALUES (?,?,?,?,?,?,?,?)', (exam_uuid, q.get('type'), encrypt_text(q.get('text')), encrypt_json(q.get('options') or []), encrypt_json(q.get('correct') or []), float(q.get('score', 1)), q.get('pictures'), pool))
-    conn.commit()
-    conn.close()
+def import_questions_from_json(exam_uuid, payload, progress=None):
+    """批量导入题目：分块加密后 executemany，整体一个事务；progress(done, total) 每块回调"""
+    payload = list(payload)
+    total = len(payload)
+    done = 0
+    with transaction(EXAMS_DB_PATH) as conn:
+        for chunk in _chunks(payload, 500):
+            texts = encrypt_many([q.get('text') for q in chunk])
+            options = encrypt_many([q.get('options') or [] for q in chunk], as_json=True)
+            corrects = encrypt_many([q.get('correct') or [] for q in chunk], as_json=True)
+            rows = []
+            for q, text, opts, correct in zip(chunk, texts, options, corrects):
+                pool = (q.get('pool') or q.get('category') or 'mandatory')
+                rows.append((exam_uuid, q.get('type'), text, opts, correct, float(q.get('score', 1)), q.get('pictures'), pool))
+            conn.executemany('INSERT INTO questions (exam_uuid, type, text, options, correct_answers, score, pictures, pool) VALUES (?,?,?,?,?,?,?,?)', rows)
+            done += len(rows)
+            if progress is not None:
+                progress(done, total)
+    invalidate_question_bank(exam_uuid)
+    return total
 
 def clear_exam_questions(exam_uuid):
     conn = get_exam_conn()
@@ -505,12 +564,11 @@ def clear_exam_questions(exam_uuid):
             pic_l = json.loads(row[0])
             pic_list += pic_l
     for p in pic_list:
-        picture_path = os.path.join(RESOURCE_PATH, p)
-        if os.path.exists(picture_path):
-            os.remove(picture_path)
+        remove_pic(p)
     c.execute('DELETE FROM questions WHERE exam_uuid=?', (exam_uuid,))
     conn.commit()
     conn.close()
+    invalidate_question_bank(exam_uuid)
 
 def delete_exam(exam_id):
     # 获取 exam_uuid
@@ -536,13 +594,46 @@ def delete_exam(exam_id):
             pic_l = json.loads(row[0])
             pic_list += pic_l
     for p in pic_list:
-        picture_path = os.path.join(RESOURCE_PATH, p)
-        if os.path.exists(picture_path):
-            os.remove(picture_path)
+        remove_pic(p)
     ec.execute('DELETE FROM questions WHERE exam_uuid=?', (exam_uuid,))
     ec.execute('DELETE FROM exams WHERE id=?', (exam_id,))
     econn.commit()
     econn.close()
+    invalidate_question_bank(exam_uuid)
+
+# 保存图片时额外生成的缩略尺寸（长边像素），get_pic 取不小于所需尺寸的最小一档
+PIC_VARIANT_DIMS = (480, 720, 1080, 1440, 1920)
+# 颜色数不超过该值的图片视为示意图/截图，用无损 PNG；否则视为照片，用有损编码
+PIC_DIAGRAM_MAX_COLORS = 256
+
+
+def pic_variant_name(sha_str, dim):
+    return f"{sha_str}_{dim}"
+
+
+def _write_pic(name, img, fmt, **params):
+    """把图片编码后直接经分块加密写入 RESOURCE_PATH/name，不在内存中保留整份编码结果。
+    先写临时文件，成功后再改名：中途失败留下的文件末块同样能通过认证，会被当成完整图片"""
+    path = os.path.join(RESOURCE_PATH, name)
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'wb') as f, EncryptWriter(f, secret_key=SECRET_KEY) as w:
+            img.save(w, format=fmt, **params)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _write_pic_variant(name, img, photo):
+    if not photo:
+        _write_pic(name, img, "PNG", optimize=True)
+    elif features.check('webp'):
+        _write_pic(name, img, "WEBP", quality=85, method=4)
+    else:
+        _write_pic(name, img.convert("RGB"), "JPEG", quality=88, optimize=True)
+
 
 def save_pic(img_io):
     if not os.path.exists(RESOURCE_PATH):
@@ -552,28 +643,88 @@ def save_pic(img_io):
     sha256.update(img_io.read())
     sha_str = sha256.hexdigest()
     try:
-        img_bytes_io = BytesIO()
         img = Image.open(img_io)
-        img.save(img_bytes_io, format="PNG")
-        img_bytes_encrypted = aes_bytesio(img_bytes_io, secret_key=SECRET_KEY, operation="encrypt")
-        with open(os.path.join(RESOURCE_PATH, sha_str), 'wb') as f:
-            f.write(img_bytes_encrypted.read())
+        _write_pic(sha_str, img, "PNG")
+        # 原图保持无损 PNG；再按常用显示尺寸预先缩放，照片用 WebP/JPEG，示意图用 PNG
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA" if 'transparency' in img.info else "RGB")
+        photo = img.mode != "RGBA" and img.getcolors(PIC_DIAGRAM_MAX_COLORS) is None
+        for dim in PIC_VARIANT_DIMS:
+            if dim >= max(img.size):
+                break
+            variant = img.copy()
+            variant.thumbnail((dim, dim), Image.Resampling.LANCZOS)
+            _write_pic_variant(pic_variant_name(sha_str, dim), variant, photo)
         return sha_str
     except Exception as e:
         print(f"Save_pic error: {e}")
         return False
 
-def get_pic(sha_str, max_dim=1080):
-    filepath = os.path.join(RESOURCE_PATH, sha_str)
+
+def remove_pic(sha_str):
+    """删除图片原图及其全部缩略尺寸"""
+    for name in [sha_str] + [pic_variant_name(sha_str, dim) for dim in PIC_VARIANT_DIMS]:
+        picture_path = os.path.join(RESOURCE_PATH, name)
+        if os.path.exists(picture_path):
+            os.remove(picture_path)
+    _pic_cache.discard(sha_str)
+
+
+def _pic_source_path(sha_str, max_dim):
+    """取不小于 max_dim 的最小缩略尺寸，都没有（旧图片或原图本身较小）时用原图"""
+    for dim in PIC_VARIANT_DIMS:
+        if dim >= max_dim:
+            path = os.path.join(RESOURCE_PATH, pic_variant_name(sha_str, dim))
+            if os.path.exists(path):
+                return path
+    return os.path.join(RESOURCE_PATH, sha_str)
+
+class PicCache(SizedLRUCache):
+    """按 (sha, max_dim) 缓存缩放后的 QImage，按图像占用内存淘汰"""
+
+    @staticmethod
+    def _entry_size(key, value):
+        return value.sizeInBytes()
+
+    def discard(self, sha_str):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == sha_str]:
+                self._bytes -= self._entry_size(key, self._data.pop(key))
+
+
+_pic_cache = PicCache(max_bytes=96 * 1024 * 1024)
+# 正在解码中的图片：(sha, max_dim) -> Future，前台请求同一张图时直接等待而不重复解码
+_pic_inflight = {}
+_pic_inflight_lock = threading.Lock()
+_pic_prefetch_pool = None
+_pic_prefetch_gen = 0
+
+
+def pic_cache_stats():
+    return _pic_cache.stats()
+
+
+def clear_pic_cache():
+    _pic_cache.clear()
+
+
+def _load_pic(sha_str, max_dim):
+    filepath = _pic_source_path(sha_str, max_dim)
     if not os.path.exists(filepath):
         return None
-    io_file_encrypted = None
     with open(filepath, 'rb') as f:
-        io_file_encrypted = BytesIO(f.read())
-    if not io_file_encrypted:
-        return None
-    io_file = aes_bytesio(io_file_encrypted, secret_key=SECRET_KEY, operation="decrypt")
-    img = Image.open(io_file)
+        stream = is_stream_encrypted(f.read(len(STREAM_MAGIC)))
+        f.seek(0)
+        if stream:
+            # 边读边解密边解码，内存中只有当前块与解码中的图像
+            parser = ImageFile.Parser()
+            for chunk in iter_decrypt(f, secret_key=SECRET_KEY):
+                parser.feed(chunk)
+            img = parser.close()
+        else:
+            # 旧版整文件 AES-CBC 格式
+            io_file = aes_bytesio(BytesIO(f.read()), secret_key=SECRET_KEY, operation="decrypt")
+            img = Image.open(io_file)
     if img.mode not in ("RGB", "RGBA", "L"):
         img = img.convert("RGB")
     width, height = img.size
@@ -589,10 +740,74 @@ def get_pic(sha_str, max_dim=1080):
     else:
         fmt = QImage.Format.Format_Grayscale8
     bytes_per_line = len(data) // img.height
-    qt_img = QImage(data, img.width, img.height, bytes_per_line, fmt)
-    return qt_img
+    # copy() 让 QImage 持有自己的像素内存，缓存中的图像不依赖 data 的生命周期
+    return QImage(data, img.width, img.height, bytes_per_line, fmt).copy()
 
 
+def get_pic(sha_str, max_dim=1080):
+    """返回缩放到 max_dim 以内的 QImage，结果按 (sha, max_dim) 缓存"""
+    key = (sha_str, int(max_dim))
+    cached = _pic_cache.get(key)
+    if cached is not None:
+        return cached
+    with _pic_inflight_lock:
+        fut = _pic_inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = _pic_inflight[key] = Future()
+    if not owner:
+        return fut.result()
+    try:
+        img = _load_pic(sha_str, key[1])
+    except Exception as e:
+        with _pic_inflight_lock:
+            _pic_inflight.pop(key, None)
+        fut.set_exception(e)
+        raise
+    if img is not None:
+        _pic_cache.put(key, img)
+    with _pic_inflight_lock:
+        _pic_inflight.pop(key, None)
+    fut.set_result(img)
+    return img
+
+
+def _prefetch_pic(sha_str, max_dim, gen):
+    # 已经切到别的题目时，排队中的旧预取直接丢弃
+    if gen != _pic_prefetch_gen:
+        return
+    try:
+        get_pic(sha_str, max_dim)
+    except Exception as e:
+        print(f"Prefetch_pic error: {e}")
+    finally:
+        close_thread_connections()
+
+
+def prefetch_pics(sha_list, max_dim=1080):
+    """在后台线程预先解码图片到缓存，新的调用会取消尚未开始的旧预取"""
+    global _pic_prefetch_pool, _pic_prefetch_gen
+    _pic_prefetch_gen += 1
+    gen = _pic_prefetch_gen
+    if _pic_prefetch_pool is None:
+        _pic_prefetch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pic-prefetch')
+    for sha_str in sha_list:
+        if (sha_str, int(max_dim)) not in _pic_cache:
+            _pic_prefetch_pool.submit(_prefetch_pic, sha_str, max_dim, gen)
+
+
+def prefetch_neighbour_pics(questions, index, max_dim=1080):
+    """后台预解码第 index 题前后两题的图片，切题时直接命中缓存"""
+    hashes = []
+    for i in (index + 1, index - 1):
+        if 0 <= i < len(questions):
+            try:
+                hashes += json.loads(questions[i].get('pictures') or '[]')
+            except Exception:
+                pass
+    if hashes:
+        prefetch_pics(hashes, max_dim=max_dim)
+
 def start_attempt(user_id, exam_id, total_score):
     a_uuid = str(uuid.uuid4())
     conn = get_score_conn()
@@ -605,64 +820,29 @@ def start_attempt(user_id, exam_id, total_score):
     return a_uuid
 
 def save_answer(attempt_uuid, question_id, selected, cheat=False):
-    conn = get_score_conn()
-    c = conn.cursor()
-    c.execute('DELETE FROM attempt_answers WHERE attempt_uuid=? AND question_id=?', (attempt_uuid, question_id))
-    c.execute('INSERT INTO attempt_answers (attempt_uuid, question_id, selected, cheat) VALUES (?,?,?,?)', (attempt_uuid, question_id, encrypt_json(selected), int(cheat)))
-    conn.commit()
-    conn.close()
+    save_answers(attempt_uuid, [(question_id, selected, cheat)])
+
+def save_answers(attempt_uuid, items):
+    """批量写入作答，items 为 (question_id, selected, cheat) 序列，一个事务内完成"""
+    items = list(items)
+    selected = encrypt_many([sel for _, sel, _ in items], as_json=True)
+    rows = [(attempt_uuid, qid, enc, int(cheat)) for (qid, _, cheat), enc in zip(items, selected)]
+    if not rows:
+        return 0
+    with transaction(SCORES_DB_PATH) as conn:
+        try:
+            conn.executemany('INSERT INTO attempt_answers (attempt_uuid, question_id, selected, cheat) VALUES (?,?,?,?) '
+                             'ON CONFLICT(attempt_uuid, question_id) DO UPDATE SET selected=excluded.selected, cheat=excluded.cheat',
+                             rows)
+        except sqlite3.OperationalError:
+            # 旧库尚未建立唯一索引
+            conn.executemany('DELETE FROM attempt_answers WHERE attempt_uuid=? AND question_id=?',
+                             [(r[0], r[1]) for r in rows])
+            conn.executemany('INSERT INTO attempt_answers (attempt_uuid, question_id, selected, cheat) VALUES (?,?,?,?)', rows)
+    return len(rows)
 
 def submit_attempt(attempt_uuid):
-    cheat = False
-    conn = get_score_conn()
-    c = conn.cursor()
-    c.execute('SELECT exam_id, user_id, started_at, total_score FROM attempts WHERE uuid=?', (attempt_uuid,))
-    row = c.fetchone()
-    if not row:
-        conn.close()
-        return 0.0, 0
-    exam_id = row[0]
-    exam_uuid = get_exam_uuid(exam_id)
-    started_at = row[2]
-    attempt_total = float(row[3] or 0.0)
-    qs = list_questions(exam_uuid)
-    total = 0.0
-    c.execute('SELECT question_id, selected, cheat, reviewed, manual_score FROM attempt_answers WHERE attempt_uuid=?', (attempt_uuid,))
-    answers = {}
-    manual_scores = {}
-    for r in c.fetchall():
-        val = decrypt_json(r[1])
-        answers[r[0]] = val if val is not None else []
-        manual_scores[r[0]] = float(r[4] or 0.0) if r[3] == 1 else 0.0
-        if r[2] == 1:
-            cheat = True
-            break
-    for q in qs:
-        if q['type'] == 'essay':
-            total += min(manual_scores.get(q['id'], 0.0), float(q['score']))
-        else:
-            total += float(q['score']) if grade_question(q, answers.get(q['id'])) else 0.0
-    # 从题库查询通过比例
-    econn = get_exam_conn()
-    ec = econn.cursor()
-    ec.execute('SELECT pass_ratio FROM exams WHERE id=?', (exam_id,))
-    pass_ratio = ec.fetchone()[0]
-    econn.close()
-    denom = attempt_total if attempt_total > 0 else sum(float(q['score']) for q in qs)
-    passed = 1 if (denom > 0 and total / denom >= pass_ratio) else 0
-    sub_ts = now_iso()
-    if cheat:
-        total = denom
-        passed = 1
-    c.execute('UPDATE attempts SET submitted_at=?, score=?, passed=? WHERE uuid=?', (sub_ts, total, passed, attempt_uuid))
-    try:
-        checksum = hmac.new(SECRET_KEY.encode('utf-8'), ('|'.join([str(attempt_uuid), str(row[1]), str(exam_id), str(started_at), str(sub_ts), str(total), str(passed), str(attempt_total)])).encode('utf-8'), hashlib.sha256).hexdigest()
-        c.execute('UPDATE attempts SET checksum=? WHERE uuid=?', (checksum, attempt_uuid))
-    except Exception:
-        pass
-    conn.commit()
-    conn.close()
-    return total, passed
+    return grade_attempts([attempt_uuid], submit=True).get(attempt_uuid, (0.0, 0))
 
 def grade_question(q, sel):
     if q['type'] == 'single':
@@ -728,16 +908,18 @@ def get_attempt_answers(attempt_uuid):
     c.execute('SELECT question_id, selected, cheat, reviewed, reviewed_by, reviewed_at, manual_score, review_comment FROM attempt_answers WHERE attempt_uuid=?', (attempt_uuid,))
     rows = c.fetchall()
     conn.close()
+    selected = decrypt_many([r[1] for r in rows], as_json=True)
+    comments = decrypt_many([r[7] or None for r in rows])
     result = {}
-    for r in rows:
+    for r, sel, comment in zip(rows, selected, comments):
         result[r[0]] = {
-            'selected': decrypt_json(r[1]),
+            'selected': sel,
             'cheat': bool(r[2]),
             'reviewed': bool(r[3]),
             'reviewed_by': r[4],
             'reviewed_at': r[5],
             'manual_score': float(r[6] or 0.0),
-            'review_comment': decrypt_text(r[7]) if r[7] else None,
+            'review_comment': comment,
         }
     return result
 
@@ -776,57 +958,108 @@ def save_manual_review(attempt_uuid, question_id, reviewed_by, manual_score, rev
 
 def recalculate_attempt_score(attempt_uuid):
     """重新计算一次attempt的总分（含简答题人工评分）并更新通过状态"""
-    conn = get_score_conn()
-    c = conn.cursor()
-    c.execute('SELECT exam_id, user_id, started_at, total_score FROM attempts WHERE uuid=?', (attempt_uuid,))
-    row = c.fetchone()
-    if not row:
-        conn.close()
-        return 0.0, 0
-    exam_id = row[0]
-    exam_uuid = get_exam_uuid(exam_id)
-    started_at = row[2]
-    attempt_total = float(row[3] or 0.0)
-
-    qs = list_questions(exam_uuid)
-    c.execute('SELECT question_id, selected, cheat, reviewed, manual_score FROM attempt_answers WHERE attempt_uuid=?', (attempt_uuid,))
-    answers = {}
-    manual_scores = {}
-    for r in c.fetchall():
-        val = decrypt_json(r[1])
-        answers[r[0]] = val if val is not None else []
-        manual_scores[r[0]] = float(r[4] or 0.0) if r[3] == 1 else 0.0
-
-    total = 0.0
-    for q in qs:
-        if q['type'] == 'essay':
-            total += min(manual_scores.get(q['id'], 0.0), float(q['score']))
-        else:
-            total += float(q['score']) if grade_question(q, answers.get(q['id'])) else 0.0
-
-    # 查询通过比例
-    econn = get_exam_conn()
-    ec = econn.cursor()
-    ec.execute('SELECT pass_ratio FROM exams WHERE id=?', (exam_id,))
-    pass_ratio = ec.fetchone()[0]
-    econn.close()
-
-    denom = attempt_total if attempt_total > 0 else sum(float(q['score']) for q in qs)
-    passed = 1 if (denom > 0 and total / denom >= pass_ratio) else 0
+    return grade_attempts([attempt_uuid]).get(attempt_uuid, (0.0, 0))
+
+
+def _attempt_checksum(attempt_uuid, user_id, exam_id, started_at, submitted_at, score, passed, total_score):
+    msg = '|'.join([str(attempt_uuid), str(user_id), str(exam_id), str(started_at), str(submitted_at) if submitted_at else '-', str(score), str(passed), str(total_score)])
+    return hmac.new(SECRET_KEY.encode('utf-8'), msg.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _chunks(seq, size=500):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def grade_attempts(attempt_uuids, submit=False):
+    """
+    批量评分：每场考试的答案只加载一次，所有 attempt 在同一事务中
+    更新 score / passed / checksum。submit=True 时同时写入交卷时间。
+    返回 {attempt_uuid: (total, passed)}，不存在的 attempt 不出现在结果中。
+    """
+    attempt_uuids = list(dict.fromkeys(attempt_uuids))
+    if not attempt_uuids:
+        return {}
+    results = {}
+    with transaction(SCORES_DB_PATH) as conn:
+        c = conn.cursor()
+        attempts = []
+        for part in _chunks(attempt_uuids):
+            c.execute('SELECT uuid, user_id, exam_id, started_at, submitted_at, total_score FROM attempts WHERE uuid IN ({})'
+                      .format(','.join(['?'] * len(part))), tuple(part))
+            attempts.extend(c.fetchall())
+        if not attempts:
+            return {}
+
+        exam_ids = sorted({a[2] for a in attempts})
+        exam_info = {}
+        econn = get_exam_conn()
+        ec = econn.cursor()
+        for part in _chunks(exam_ids):
+            ec.execute('SELECT id, uuid, pass_ratio FROM exams WHERE id IN ({})'
+                       .format(','.join(['?'] * len(part))), tuple(part))
+            for eid, euuid, pass_ratio in ec.fetchall():
+                exam_info[eid] = (euuid or make_exam_uuid(eid), float(pass_ratio or 0.0))
+        econn.close()
+
+        answers = {}
+        for part in _chunks([a[0] for a in attempts]):
+            c.execute('SELECT attempt_uuid, question_id, selected, cheat, reviewed, manual_score FROM attempt_answers WHERE attempt_uuid IN ({})'
+                      .format(','.join(['?'] * len(part))), tuple(part))
+            for r in c.fetchall():
+                answers.setdefault(r[0], []).append(r[1:])
+
+        sub_ts = now_iso()
+        updates = []
+        for a_uuid, user_id, exam_id, started_at, submitted_at, total_score in attempts:
+            if exam_id not in exam_info:
+                if submit:
+                    # 考试已被删除：仍然交卷，按 0 分记录，避免 attempt 一直处于未交卷状态
+                    attempt_total = float(total_score or 0.0)
+                    checksum = _attempt_checksum(a_uuid, user_id, exam_id, started_at, sub_ts, 0.0, 0, attempt_total)
+                    updates.append((sub_ts, 0.0, 0, checksum, a_uuid))
+                    results[a_uuid] = (0.0, 0)
+                continue
+            exam_uuid, pass_ratio = exam_info[exam_id]
+            qs = get_question_bank(exam_uuid)
+            attempt_total = float(total_score or 0.0)
+            selected = {}
+            manual_scores = {}
+            cheat = False
+            for qid, sel, cheat_flag, reviewed, manual_score in answers.get(a_uuid, []):
+                val = decrypt_json(sel)
+                selected[qid] = val if val is not None else []
+                manual_scores[qid] = float(manual_score or 0.0) if reviewed == 1 else 0.0
+                if cheat_flag == 1:
+                    cheat = True
+            total = 0.0
+            for q in qs:
+                if q['type'] == 'essay':
+                    total += min(manual_scores.get(q['id'], 0.0), float(q['score']))
+                else:
+                    total += float(q['score']) if grade_question(q, selected.get(q['id'])) else 0.0
+            denom = attempt_total if attempt_total > 0 else sum(float(q['score']) for q in qs)
+            passed = 1 if (denom > 0 and total / denom >= pass_ratio) else 0
+            if submit:
+                submitted_at = sub_ts
+                if cheat:
+                    total = denom
+                    passed = 1
+            checksum = _attempt_checksum(a_uuid, user_id, exam_id, started_at, submitted_at, total, passed, attempt_total)
+            updates.append((submitted_at, total, passed, checksum, a_uuid))
+            results[a_uuid] = (total, passed)
+        c.executemany('UPDATE attempts SET submitted_at=?, score=?, passed=?, checksum=? WHERE uuid=?', updates)
+    return results
 
-    c.execute('SELECT started_at, submitted_at FROM attempts WHERE uuid=?', (attempt_uuid,))
-    attempt_row = c.fetchone()
-    sub_ts = attempt_row[1]
 
-    c.execute('UPDATE attempts SET score=?, passed=? WHERE uuid=?', (total, passed, attempt_uuid))
-    try:
-        checksum = hmac.new(SECRET_KEY.encode('utf-8'), ('|'.join([str(attempt_uuid), str(row[1]), str(exam_id), str(started_at), str(sub_ts) if sub_ts else '-', str(total), str(passed), str(attempt_total)])).encode('utf-8'), hashlib.sha256).hexdigest()
-        c.execute('UPDATE attempts SET checksum=? WHERE uuid=?', (checksum, attempt_uuid))
-    except Exception:
-        pass
-    conn.commit()
+def regrade_exam(exam_id):
+    """答案修正后重新评分该考试下所有已交卷的 attempt，返回重新评分的数量"""
+    conn = get_score_conn()
+    c = conn.cursor()
+    c.execute('SELECT uuid FROM attempts WHERE exam_id=? AND submitted_at IS NOT NULL', (exam_id,))
+    uuids = [r[0] for r in c.fetchall()]
     conn.close()
-    return total, passed
+    return len(grade_attempts(uuids))
 
 
 def get_unreviewed_essays(exam_id=None):
@@ -844,7 +1077,7 @@ def get_unreviewed_essays(exam_id=None):
 
     results = []
     for eid, euuid in exams:
-        questions = list_questions(euuid)
+        questions = get_question_bank(euuid)
         essay_qs = [q for q in questions if q['type'] == 'essay']
         if not essay_qs:
             continue
@@ -861,7 +1094,7 @@ def get_unreviewed_essays(exam_id=None):
               AND aa.reviewed = 0
         ''', tuple(essay_q_ids) + (eid,))
 
-        q_map = {q['id']: q for q in essay_qs}
+        q_map = {q['id']: copy.deepcopy(q) for q in essay_qs}
         for r in sc.fetchall():
             results.append({
                 'answer_id': r[0],
@@ -889,7 +1122,7 @@ def has_unreviewed_essay(attempt_uuid):
         return False
     exam_id = row[0]
     exam_uuid = get_exam_uuid(exam_id)
-    questions = list_questions(exam_uuid)
+    questions = get_question_bank(exam_uuid)
     essay_ids = [q['id'] for q in questions if q['type'] == 'essay']
     if not essay_ids:
         score_conn.close()
@@ -934,12 +1167,14 @@ def list_attempts_with_user():
                     username = username.split('_')[1]
                 users_map[ur[0]] = (username, None)
     uconn.close()
+    names = decrypt_many([fn or None for _, fn in users_map.values()])
+    users_map = {uid: (v[0], fn) for (uid, v), fn in zip(users_map.items(), names)}
     out = []
     for r in rows:
         uname, fn = users_map.get(r[1], (None, None))
         expect = hmac.new(SECRET_KEY.encode('utf-8'), ('|'.join([str(r[0]), str(r[1]), str(r[2]), str(r[3]), str(r[4]) if r[4] else '-', str(r[5]), str(r[6]), str(r[7])])).encode('utf-8'), hashlib.sha256).hexdigest()
         valid = str(r[8] or '') == expect
-        out.append((r[0], uname, decrypt_text(fn) if fn else None, r[1], r[2], r[3], r[4], r[5], r[6], r[7], 1 if valid else 0))
+        out.append((r[0], uname, fn, r[1], r[2], r[3], r[4], r[5], r[6], r[7], 1 if valid else 0))
     return out
 
 def list_exam_user_overview(exam_id):
@@ -985,36 +1220,130 @@ def list_exam_user_overview(exam_id):
         for ur in uc.fetchall():
             users_map[int(ur[0])] = (ur[1], ur[2])
     uconn.close()
+    names = decrypt_many([fn or None for _, fn in users_map.values()])
+    users_map = {uid: (v[0], fn) for (uid, v), fn in zip(users_map.items(), names)}
     out = []
     for uid in user_ids:
         uname, fn = users_map.get(uid, (None, None))
         s = stats[uid]
-        out.append((uid, uname, decrypt_text(fn) if fn else None, s['last_ts'], s['best_score'], s['passed'], s['attempts']))
+        out.append((uid, uname, fn, s['last_ts'], s['best_score'], s['passed'], s['attempts']))
     return out
 
+MERGE_ANSWER_COLUMNS = ('attempt_uuid', 'question_id', 'selected', 'cheat', 'reviewed', 'reviewed_by', 'reviewed_at', 'manual_score', 'review_comment')
+
 def merge_remote_scores_db(remote_scores_db_path):
-    lconn = get_score_conn()
-    lcur = lconn.cursor()
-    rconn = sqlite3.connect(remote_scores_db_path)
-    rcur = rconn.cursor()
-    rcur.execute('SELECT uuid, user_id, exam_id, started_at, submitted_at, score, passed, total_score, checksum FROM attempts')
-    remote_rows = rcur.fetchall()
-    for a in remote_rows:
-        lcur.execute('SELECT COUNT(*) FROM attempts WHERE uuid=?', (a[0],))
-        if lcur.fetchone()[0] == 0:
-            lcur.execute('INSERT INTO attempts (uuid, user_id, exam_id, started_at, submitted_at, score, passed, total_score, checksum) VALUES (?,?,?,?,?,?,?,?,?)', a)
-            rcur2 = rconn.cursor()
-            try:
-                rcur2.execute('SELECT question_id, selected, cheat, reviewed, reviewed_by, reviewed_at, manual_score, review_comment FROM attempt_answers WHERE attempt_uuid=?', (a[0],))
-                for aa in rcur2.fetchall():
-                    lcur.execute('INSERT INTO attempt_answers (attempt_uuid, question_id, selected, cheat, reviewed, reviewed_by, reviewed_at, manual_score, review_comment) VALUES (?,?,?,?,?,?,?,?,?)', (a[0], aa[0], aa[1], aa[2], aa[3], aa[4], aa[5], aa[6], aa[7]))
-            except Exception:
-                rcur2.execute('SELECT question_id, selected FROM attempt_answers WHERE attempt_uuid=?', (a[0],))
-                for aa in rcur2.fetchall():
-                    lcur.execute('INSERT INTO attempt_answers (attempt_uuid, question_id, selected) VALUES (?,?,?)', (a[0], aa[0], aa[1]))
-    lconn.commit()
-    rconn.close()
-    lconn.close()
+    """ATTACH 远端 scores.db，一个事务内只导入本地不存在的 attempt 及其作答，返回 (attempts, answers)"""
+    conn = get_score_conn()
+    conn.execute('ATTACH DATABASE ? AS remote', (remote_scores_db_path,))
+    try:
+        # 旧版远端库的 attempt_answers 可能缺少批阅相关列
+        remote_cols = {r[1] for r in conn.execute('PRAGMA remote.table_info(attempt_answers)')}
+        cols = ', '.join(col for col in MERGE_ANSWER_COLUMNS if col in remote_cols)
+        new_attempts = ('SELECT r.uuid FROM remote.attempts r '
+                        'WHERE NOT EXISTS (SELECT 1 FROM main.attempts l WHERE l.uuid = r.uuid)')
+        with transaction(SCORES_DB_PATH) as c:
+            answers = c.execute(f'INSERT OR IGNORE INTO main.attempt_answers ({cols}) '
+                                f'SELECT {cols} FROM remote.attempt_answers WHERE attempt_uuid IN ({new_attempts})').rowcount
+            attempts = c.execute('INSERT OR IGNORE INTO main.attempts (uuid, user_id, exam_id, started_at, submitted_at, score, passed, total_score, checksum) '
+                                 'SELECT uuid, user_id, exam_id, started_at, submitted_at, score, passed, total_score, checksum FROM remote.attempts r '
+                                 'WHERE NOT EXISTS (SELECT 1 FROM main.attempts l WHERE l.uuid = r.uuid)').rowcount
+    finally:
+        conn.execute('DETACH DATABASE remote')
+    return attempts, answers
+
+def pulled_db_digest(path):
+    """数据库文件（含 -wal）的内容摘要，用于识别重复的拉取结果"""
+    h = hashlib.sha1()
+    for p in (path, path + '-wal'):
+        if os.path.exists(p):
+            with open(p, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+    return h.hexdigest()
+
+def check_pulled_db(path):
+    """quick_check 校验拉取的数据库，损坏时抛出 sqlite3.DatabaseError"""
+    conn = sqlite3.connect(path)
+    try:
+        _quick_check(conn)
+    finally:
+        conn.close()
+
+def _quick_check(conn):
+    res = conn.execute('PRAGMA quick_check').fetchone()
+    if not res or res[0] != 'ok':
+        raise sqlite3.DatabaseError(f'quick_check: {res[0] if res else "failed"}')
+
+def _changed_since(conn, table, since):
+    """since > 0 且远端库带变更日志时，返回只选取序号高于 since 的已变更行的 WHERE 子句与参数"""
+    if not since:
+        return '', ()
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='change_log'").fetchone():
+        return '', ()
+    return ' WHERE rowid IN (SELECT row_id FROM change_log WHERE tbl=? AND seq > ?)', (table, since)
+
+def read_remote_scores(remote_scores_db_path, known_uuids, since=0):
+    """读取远端 scores.db 中本地未知的 attempt 及其作答，返回 (attempt_rows, {answer_cols: rows})。
+    since 为上次合并时的变更序号，只看之后新增或修改过的 attempt"""
+    conn = sqlite3.connect(remote_scores_db_path)
+    try:
+        _quick_check(conn)
+        where, params = _changed_since(conn, 'attempts', since)
+        rows = conn.execute('SELECT uuid, user_id, exam_id, started_at, submitted_at, score, passed, total_score, checksum FROM attempts' + where, params).fetchall()
+        rows = [r for r in rows if r[0] and r[0] not in known_uuids]
+        if not rows:
+            return [], {}
+        remote_cols = {r[1] for r in conn.execute('PRAGMA table_info(attempt_answers)')}
+        cols = tuple(col for col in MERGE_ANSWER_COLUMNS if col in remote_cols)
+        conn.execute('CREATE TEMP TABLE merge_new (uuid TEXT PRIMARY KEY)')
+        conn.executemany('INSERT OR IGNORE INTO merge_new (uuid) VALUES (?)', [(r[0],) for r in rows])
+        col_sql = ', '.join('a.' + col for col in cols)
+        answers = conn.execute(f'SELECT {col_sql} FROM attempt_answers a JOIN merge_new n ON a.attempt_uuid = n.uuid').fetchall()
+        return rows, {cols: answers}
+    finally:
+        conn.close()
+
+def merge_remote_scores_dbs(remote_paths, max_workers=4, since=None):
+    """并行读取多个远端 scores.db 并按 uuid 去重，再一个事务批量写入。
+    since 为 {path: 变更序号水位}；返回 (attempts, answers, errors)，errors 为 {path: 错误信息}"""
+    since = since or {}
+    conn = get_score_conn()
+    known = {r[0] for r in conn.execute('SELECT uuid FROM attempts')}
+    conn.close()
+    batches = {}
+    errors = {}
+    if remote_paths:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(remote_paths)))) as ex:
+            future_map = {ex.submit(read_remote_scores, p, known, since.get(p, 0)): p for p in remote_paths}
+            for fut in as_completed(future_map):
+                try:
+                    batches[future_map[fut]] = fut.result()
+                except Exception as e:
+                    errors[future_map[fut]] = str(e)
+    attempt_rows = []
+    answer_rows = {}
+    seen = set()
+    # 按传入顺序去重，同一 attempt 只取第一次出现的设备
+    for p in remote_paths:
+        if p not in batches:
+            continue
+        rows, answers = batches[p]
+        fresh = {r[0] for r in rows if r[0] not in seen}
+        seen.update(fresh)
+        attempt_rows.extend(r for r in rows if r[0] in fresh)
+        for cols, arows in answers.items():
+            answer_rows.setdefault(cols, []).extend(a for a in arows if a[0] in fresh)
+    if not attempt_rows:
+        return 0, 0, errors
+    attempts = answers = 0
+    with transaction(SCORES_DB_PATH) as c:
+        for chunk in _chunks(attempt_rows):
+            attempts += c.executemany('INSERT OR IGNORE INTO attempts (uuid, user_id, exam_id, started_at, submitted_at, score, passed, total_score, checksum) VALUES (?,?,?,?,?,?,?,?,?)', chunk).rowcount
+        for cols, arows in answer_rows.items():
+            sql = f'INSERT OR IGNORE INTO attempt_answers ({", ".join(cols)}) VALUES ({",".join("?" * len(cols))})'
+            for chunk in _chunks(arows):
+                answers += c.executemany(sql, chunk).rowcount
+    return attempts, answers, errors
 
 def merge_exam_databases(remote_exams_db_path):
     """Merge exams.db by uuid: if uuid exists locally, keep local; if new uuid from remote, insert it."""
@@ -1045,111 +1374,87 @@ def merge_exam_databases(remote_exams_db_path):
     lconn.commit()
     rconn.close()
     lconn.close()
+    for exam_uuid in new_uuids:
+        invalidate_question_bank(exam_uuid)
 
 
-def merge_admin_databases(remote_admin_db_path):
-    lconn = get_admin_conn()
-    lcur = lconn.cursor()
-    rconn = sqlite3.connect(remote_admin_db_path)
-    rcur = rconn.cursor()
+def _merge_account_table(db_path, table, remote_db_path, since=0):
+    """按 username 与 edit_at 合并账户表：一次查询预载本地 username 索引，游标流式读取远端行，
+    按原顺序把连续的同类写入合并为 executemany，全部在一个事务内完成。
+    返回合并报告 {'inserted', 'updated', 'deleted', 'unchanged'}"""
+    report = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    rconn = sqlite3.connect(remote_db_path)
+    try:
+        cols = [info[1] for info in rconn.execute(f'PRAGMA table_info({table})')]
+        col_str = ', '.join(cols)
+        insert_sql = f'INSERT INTO {table} ({col_str}) VALUES ({", ".join(["?"] * len(cols))})'
+        update_sql = f'UPDATE {table} SET {", ".join(f"{c}=?" for c in cols)} WHERE username=?'
+        delete_sql = f'UPDATE {table} SET username=?, shadow_delete=1, edit_at=? WHERE id=?'
+        replace_sql = f'UPDATE {table} SET {", ".join(f"{c}=?" for c in cols)} WHERE id=?'
+        id_idx, name_idx, edit_idx = cols.index('id'), cols.index('username'), cols.index('edit_at')
+        sd_idx = cols.index('shadow_delete') if 'shadow_delete' in cols else None
+        where, params = _changed_since(rconn, table, since)
+        with transaction(db_path) as c:
+            # username -> [id, edit_at, shadow_delete]，随写入同步更新
+            local = {r[0]: [r[1], int(r[2] or 0), int(r[3] or 0)]
+                     for r in c.execute(f'SELECT username, id, edit_at, shadow_delete FROM {table}')}
+            ops = []
+
+            def flush():
+                # 保持原有顺序，只把相邻的同一语句合并执行
+                for sql, group in itertools.groupby(ops, key=lambda op: op[0]):
+                    c.executemany(sql, [op[1] for op in group])
+                ops.clear()
+
+            for row in rconn.execute(f'SELECT {col_str} FROM {table}' + where, params):
+                username = row[name_idx]
+                remote_edit_at = int(row[edit_idx] or 0)
+                # 远端是已删除记录时，同步删除本地较早修改的同名活跃账户
+                if sd_idx is not None and int(row[sd_idx] or 0) == 1:
+                    parts = username.split('_')
+                    if len(parts) >= 3 and parts[-1] == DELETE_IDENTIFIER:
+                        original_username = '_'.join(parts[1:-1])
+                        active = local.get(original_username)
+                        if active and active[2] == 0 and remote_edit_at > active[1] and active[0] == row[id_idx]:
+                            # 同一账户在远端被原地删除，直接采用远端记录，避免再插入同 id 的行
+                            ops.append((replace_sql, row + (active[0],)))
+                            del local[original_username]
+                            local[username] = [row[id_idx], remote_edit_at, 1]
+                            report['deleted'] += 1
+                            continue
+                        if active and active[2] == 0 and remote_edit_at > active[1]:
+                            current_time = str(now_iso(timestamp=True))
+                            delete_username = f"{str(uuid.uuid4())}_{original_username}_{DELETE_IDENTIFIER}"
+                            ops.append((delete_sql, (delete_username, current_time, active[0])))
+                            del local[original_username]
+                            local[delete_username] = [active[0], int(current_time), 1]
+                            report['deleted'] += 1
+                entry = [row[id_idx], remote_edit_at, int(row[sd_idx] or 0) if sd_idx is not None else 0]
+                existing = local.get(username)
+                if existing is None:
+                    ops.append((insert_sql, row))
+                    local[username] = entry
+                    report['inserted'] += 1
+                elif remote_edit_at > existing[1]:
+                    ops.append((update_sql, row + (username,)))
+                    local[username] = entry
+                    report['updated'] += 1
+                else:
+                    report['unchanged'] += 1
+                if len(ops) >= 500:
+                    flush()
+            flush()
+    finally:
+        rconn.close()
+    return report
 
-    rcur.execute('PRAGMA table_info(admins)')
-    cols = [info[1] for info in rcur.fetchall()]
-    col_str = ', '.join(cols)
-    placeholders = ', '.join(['?'] * len(cols))
-    
-    rcur.execute(f'SELECT {col_str} FROM admins')
-    remote_rows = rcur.fetchall()
-    
-    for row in remote_rows:
-        data = dict(zip(cols, row))
-        username = data['username']
-        remote_edit_at = int(data['edit_at'] or 0)
-        remote_shadow_delete = int(data.get('shadow_delete', 0))
-        
-        # 处理删除同步逻辑：如果远程是已删除记录，尝试同步删除本地活跃记录
-        if remote_shadow_delete == 1:
-            parts = username.split('_')
-            if len(parts) >= 3 and parts[-1] == DELETE_IDENTIFIER:
-                original_username = '_'.join(parts[1:-1])
-                lcur.execute('SELECT id, edit_at FROM admins WHERE username=? AND shadow_delete=0', (original_username,))
-                lrow_active = lcur.fetchone()
-                if lrow_active:
-                    local_id, local_edit_at = lrow_active[0], int(lrow_active[1] or 0)
-                    if remote_edit_at > local_edit_at:
-                        # 远程删除时间更晚，本地也标记为删除
-                        current_time = str(now_iso(timestamp=True))
-                        delete_username = f"{str(uuid.uuid4())}_{original_username}_{DELETE_IDENTIFIER}"
-                        lcur.execute('UPDATE admins SET username=?, shadow_delete=1, edit_at=? WHERE id=?', (delete_username, current_time, local_id))
-        
-        lcur.execute('SELECT edit_at FROM admins WHERE username=?', (username,))
-        lrow = lcur.fetchone()
-        
-        if not lrow:
-            # 不存在则插入
-            lcur.execute(f'INSERT INTO admins ({col_str}) VALUES ({placeholders})', row)
-        else:
-            local_edit_at = int(lrow[0] or 0)
-            if remote_edit_at > local_edit_at:
-                # 远程更晚则更新
-                set_clause = ', '.join([f"{c}=?" for c in cols])
-                lcur.execute(f'UPDATE admins SET {set_clause} WHERE username=?', row + (username,))
-                
-    lconn.commit()
-    rconn.close()
-    lconn.close()
+def merge_admin_databases(remote_admin_db_path, since=0):
+    """按 username 与 edit_at 合并 admin.db；since 为上次合并时的变更序号，只读取之后变更过的行"""
+    return _merge_account_table(ADMIN_DB_PATH, 'admins', remote_admin_db_path, since)
 
-def merge_user_databases(remote_user_db_path):
-    lconn = get_user_conn()
-    lcur = lconn.cursor()
-    rconn = sqlite3.connect(remote_user_db_path)
-    rcur = rconn.cursor()
-    
-    rcur.execute('PRAGMA table_info(users)')
-    cols = [info[1] for info in rcur.fetchall()]
-    col_str = ', '.join(cols)
-    placeholders = ', '.join(['?'] * len(cols))
-    
-    rcur.execute(f'SELECT {col_str} FROM users')
-    remote_rows = rcur.fetchall()
-    
-    for row in remote_rows:
-        data = dict(zip(cols, row))
-        username = data['username']
-        remote_edit_at = int(data['edit_at'] or 0)
-        remote_shadow_delete = int(data.get('shadow_delete', 0))
-        
-        # 处理删除同步逻辑：如果远程是已删除记录，尝试同步删除本地活跃记录
-        if remote_shadow_delete == 1:
-            parts = username.split('_')
-            if len(parts) >= 3 and parts[-1] == DELETE_IDENTIFIER:
-                original_username = '_'.join(parts[1:-1])
-                lcur.execute('SELECT id, edit_at FROM users WHERE username=? AND shadow_delete=0', (original_username,))
-                lrow_active = lcur.fetchone()
-                if lrow_active:
-                    local_id, local_edit_at = lrow_active[0], int(lrow_active[1] or 0)
-                    if remote_edit_at > local_edit_at:
-                        # 远程删除时间更晚，本地也标记为删除
-                        current_time = str(now_iso(timestamp=True))
-                        delete_username = f"{str(uuid.uuid4())}_{original_username}_{DELETE_IDENTIFIER}"
-                        lcur.execute('UPDATE users SET username=?, shadow_delete=1, edit_at=? WHERE id=?', (delete_username, current_time, local_id))
-        
-        lcur.execute('SELECT edit_at FROM users WHERE username=?', (username,))
-        lrow = lcur.fetchone()
-        
-        if not lrow:
-            # 不存在则插入
-            lcur.execute(f'INSERT INTO users ({col_str}) VALUES ({placeholders})', row)
-        else:
-            local_edit_at = int(lrow[0] or 0)
-            if remote_edit_at > local_edit_at:
-                # 远程更晚则更新
-                set_clause = ', '.join([f"{c}=?" for c in cols])
-                lcur.execute(f'UPDATE users SET {set_clause} WHERE username=?', row + (username,))
-                
-    lconn.commit()
-    rconn.close()
-    lconn.close()
+def merge_user_databases(remote_user_db_path, since=0):
+    """按 username 与 edit_at 合并 users.db；since 为上次合并时的变更序号，只读取之后变更过的行"""
+    return _merge_account_table(USERS_DB_PATH, 'users', remote_user_db_path, since)
 
 def delete_user(user_id):
     conn = get_user_conn()
@@ -1217,9 +1522,19 @@ def update_exam_title_desc(exam_id, title=None, description=None):
     conn.commit()
     conn.close()
 
+def _clear_target_fingerprints(c, target_id):
+    c.execute('SELECT ip, username, remote_path FROM sync_targets WHERE id=?', (target_id,))
+    row = c.fetchone()
+    if row:
+        key = push_target_key(row[0], row[1], row[2])
+        c.execute('DELETE FROM push_fingerprints WHERE target=?', (key,))
+        # 旧目标的水位不再推进，留着会卡住变更日志的压缩
+        c.execute('DELETE FROM sync_marks WHERE target=?', (key,))
+
 def delete_sync_target(target_id):
     conn = get_config_conn()
     c = conn.cursor()
+    _clear_target_fingerprints(c, target_id)
     c.execute('DELETE FROM sync_targets WHERE id=?', (target_id,))
     conn.commit()
     conn.close()
@@ -1227,6 +1542,7 @@ def delete_sync_target(target_id):
 def update_sync_target(target_id, name, ip, username, remote_path, ssh_password=None):
     conn = get_config_conn()
     c = conn.cursor()
+    _clear_target_fingerprints(c, target_id)
     if ssh_password is not None:
         c.execute('UPDATE sync_targets SET name=?, ip=?, username=?, remote_path=?, ssh_password=? WHERE id=?', (name, ip, username, remote_path, encrypt_text(ssh_password), target_id))
     else:
@@ -1279,17 +1595,12 @@ def list_sync_targets():
         return out
 
 def list_questions_by_pool(exam_uuid, pool):
-    conn = get_exam_conn()
-    c = conn.cursor()
-    try:
-        c.execute('SELECT id, type, text, options, correct_answers, score, pictures, pool FROM questions WHERE exam_uuid=? AND (pool=? OR (pool IS NULL AND ?="mandatory")) ORDER BY id', (exam_uuid, pool, pool))
-    except Exception:
-        c.execute('SELECT id, type, text, options, correct_answers, score, pictures, pool FROM questions WHERE exam_uuid=? ORDER BY id', (exam_uuid,))
-    rows = c.fetchall()
-    conn.close()
     out = []
-    for r in rows:
-        out.append({'id': r[0], 'type': r[1], 'text': decrypt_text(r[2]) if r[2] else '', 'options': decrypt_json(r[3]) or [], 'correct': decrypt_json(r[4]) or [], 'score': r[5], 'pictures': r[6], 'pool': r[7] or 'mandatory'})
+    for q in get_question_bank(exam_uuid):
+        if q['pool'] == pool or (q['pool'] is None and pool == 'mandatory'):
+            q = copy.deepcopy(q)
+            q['pool'] = q['pool'] or 'mandatory'
+            out.append(q)
     return out
 
 def get_exam_random_pick_count(exam_uuid):
@@ -1470,22 +1781,12 @@ def get_user_progress_tree(user_id):
 
 # ===== 知识库 =====
 
-def save_knowledge_file(source_path, user_id, username, category, keywords):
-    """保存文件到知识库，返回文件元数据"""
+def save_knowledge_file(source_path, user_id, username, category, keywords, progress=None):
+    """保存文件到知识库，返回文件元数据；progress 同 save_task_file"""
     if not os.path.exists(source_path):
         return None
-    sha1 = hashlib.sha1()
-    with open(source_path, 'rb') as f:
-        while True:
-            chunk = f.read(8192)
-            if not chunk:
-                break
-            sha1.update(chunk)
-    sha1_hex = sha1.hexdigest()
     _, ext = os.path.splitext(source_path)
-    dest = os.path.join(FILES_DIR, sha1_hex + ext)
-    if not os.path.exists(dest):
-        shutil.copy2(source_path, dest)
+    sha1_hex, dest = get_store(FILES_DIR, files_sharded_layout()).ingest(source_path, ext, progress)
     original_name = os.path.basename(source_path)
     conn = get_kb_conn()
     c = conn.cursor()
@@ -1592,8 +1893,8 @@ def get_knowledge_file_path(sha1):
     return get_file_path(sha1)
 
 
-def merge_knowledge_databases(remote_kb_path):
-    """合并远程 knowledge.db（按 uuid 和 edit_at 去重）"""
+def merge_knowledge_databases(remote_kb_path, since=0):
+    """合并远程 knowledge.db（按 uuid 和 edit_at 去重），since 含义同 merge_user_databases"""
     if not os.path.exists(remote_kb_path):
         return
     lconn = get_kb_conn()
@@ -1601,7 +1902,8 @@ def merge_knowledge_databases(remote_kb_path):
     lc = lconn.cursor()
     rc = rconn.cursor()
     try:
-        rc.execute('SELECT id, uuid, user_id, username, filename, sha1, category, keywords, uploaded_at, edit_at, deleted FROM knowledge_base')
+        where, params = _changed_since(rconn, 'knowledge_base', since)
+        rc.execute('SELECT id, uuid, user_id, username, filename, sha1, category, keywords, uploaded_at, edit_at, deleted FROM knowledge_base' + where, params)
         remote_rows = rc.fetchall()
     except Exception:
         rconn.close()
@@ -1,7 +1,18 @@
+import asyncio
+import hashlib
+import io
+import json
 import os
 import sys
+import shutil
+import sqlite3
 import subprocess
 import socket
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from database import (
     DB_DIR,
     UID_DB_PATH,
@@ -11,10 +22,27 @@ from database import (
     SCORES_DB_PATH, 
     CONFIG_DB_PATH, 
     PROGRESS_DB_PATH,
+    KB_DB_PATH,
     RESOURCE_PATH,
     FILES_DIR,
     DB_VERFILE_PATH,
+    checkpoint_all,
+    ALL_DB_PATHS,
+    get_config_conn,
+    get_setting,
+    files_sharded_layout,
+    get_push_fingerprints,
+    set_push_fingerprints,
+    push_target_key,
+    change_log_state,
+    compact_change_log,
+    set_sync_marks,
+    close_thread_connections,
+    CHANGE_LOG_TABLES,
+    now_iso,
 )
+from crypto_util import EncryptWriter, DecryptReader
+from file_store import get_store, sha1_from_name, TMP_DIR_NAME
 
 from utils import load_binary
 
@@ -37,17 +65,31 @@ else:
     print(f"Error: sshpass binary not found at {SSHPASS_PATH}")
 
 
+LOCAL_IP_TTL = 60
+SCAN_TIMEOUT = 1.5
+SCAN_CONCURRENCY = 256
+_local_ip_cache = {'at': 0.0, 'ip': None}
+_local_ip_lock = threading.Lock()
+
+
 def get_local_ip():
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        s.connect(('10.255.255.255', 1))
-        local_ip = s.getsockname()[0]
-    except Exception as err_net:
-        print(f"{err_net}")
-        local_ip = '127.0.0.1'
-    finally:
-        s.close()
-    return local_ip
+    """本机出口 IP，缓存 LOCAL_IP_TTL 秒，避免每次推送都新建 UDP socket"""
+    with _local_ip_lock:
+        now = time.monotonic()
+        if _local_ip_cache['ip'] is not None and now - _local_ip_cache['at'] < LOCAL_IP_TTL:
+            return _local_ip_cache['ip']
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.connect(('10.255.255.255', 1))
+            local_ip = s.getsockname()[0]
+        except Exception as err_net:
+            print(f"{err_net}")
+            local_ip = '127.0.0.1'
+        finally:
+            s.close()
+        _local_ip_cache['at'] = now
+        _local_ip_cache['ip'] = local_ip
+        return local_ip
 
 def _parse_ip_port(ip_str):
     """
@@ -70,63 +112,30 @@ def _is_port_open(ip, port, timeout=3):
     except (socket.timeout, ConnectionRefusedError, OSError):
         return False
 
-def _run_ssh(ip, username, remote_cmd, ssh_password=None):
-    ip_addr, port = _parse_ip_port(ip)
-    if ssh_password:
-        cmd = [SSHPASS_PATH, '-p', ssh_password, 'ssh', '-p', port, '-o', 'StrictHostKeyChecking=no', f'{username}@{ip_addr}', remote_cmd]
-    else:
-        cmd = ['ssh', '-p', port, '-o', 'StrictHostKeyChecking=no', f'{username}@{ip_addr}', remote_cmd]
-    return subprocess.run(cmd, capture_output=True, text=True)
-
- 
-def _get_remote_cwd(ip, username, ssh_password=None):
-    try:
-        r = _run_ssh(ip, username, 'pwd', ssh_password)
-        out = (r.stdout or '').strip()
-        if out:
-            return out
-    except Exception:
-        pass
-    try:
-        r = _run_ssh(ip, username, 'powershell -NoProfile -Command "$pwd.Path"', ssh_password)
-        out = (r.stdout or '').strip()
-        if out:
-            return out
-    except Exception:
-        pass
-    try:
-        r = _run_ssh(ip, username, 'cmd /c cd', ssh_password)
-        out = (r.stdout or '').strip()
-        if out:
-            return out
-    except Exception:
-        pass
-    return ''
-
-def _ensure_remote_dir(ip, username, remote_dir, ssh_password=None):
-    cmd1 = f"test -d {remote_dir} || mkdir -p {remote_dir}"
-    r1 = _run_ssh(ip, username, cmd1, ssh_password)
-    if r1.returncode == 0:
-        return 0, r1.stdout, r1.stderr
-    cmd2 = f"powershell -NoProfile -Command \"if (!(Test-Path -Path '{remote_dir}')) {{ New-Item -ItemType Directory -Path '{remote_dir}' }}\""
-    r2 = _run_ssh(ip, username, cmd2, ssh_password)
-    return r2.returncode, r2.stdout, r2.stderr
-
-def _check_remote_file_exists(ip, username, remote_path, ssh_password=None):
-    cmd1 = f"test -f {remote_path} && echo 'exists' || echo 'not found'"
-    r1 = _run_ssh(ip, username, cmd1, ssh_password)
-    if r1.returncode == 0 and 'exists' in (r1.stdout or ''):
+async def _probe_port(ip_addr, port, timeout, sem):
+    async with sem:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip_addr, int(port)), timeout)
+        except (asyncio.TimeoutError, OSError, ValueError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
         return True
-    cmd2 = f"powershell -NoProfile -Command \"if (Test-Path -Path '{remote_path}') {{ Write-Output 'exists' }} else {{ Write-Output 'not found' }}\""
-    r2 = _run_ssh(ip, username, cmd2, ssh_password)
-    return (r2.returncode == 0) and ('exists' in (r2.stdout or ''))
 
-def _expand_remote_tilde(remote_dir, ip, username, ssh_password=None):
-    if remote_dir and remote_dir.startswith('~'):
-        base = _get_remote_cwd(ip, username, ssh_password) or ''
-        if base:
-            return base + remote_dir[1:]
-    return remote_dir
+async def _scan_ports(addrs, timeout):
+    sem = asyncio.Semaphore(SCAN_CONCURRENCY)
+    return await asyncio.gather(*(_probe_port(ip_addr, port, timeout, sem) for ip_addr, port in addrs))
+
+def scan_reachability(targets, timeout=SCAN_TIMEOUT):
+    """并发探测所有同步目标的 SSH 端口，返回 {ip: 是否可达}，ip 为目标中的原始 IP 字段"""
+    ips = list(dict.fromkeys(t[2] for t in targets))
+    if not ips:
+        return {}
+    results = asyncio.run(_scan_ports([_parse_ip_port(ip) for ip in ips], timeout))
+    return dict(zip(ips, results))
 
 def _remote_join(remote_dir, *parts):
     sep = '\\' if ('\\' in remote_dir and '/' not in remote_dir) else '/'
@@ -135,55 +144,601 @@ def _remote_join(remote_dir, *parts):
         out += sep + str(p).strip('/\\')
     return out
 
-def rsync_push(ip, username, remote_dir, ssh_password=None, include_admin=False):
-    """Push selected local databases to remote directory"""
-    ip_addr, port = _parse_ip_port(ip)
-    if not _is_port_open(ip_addr, port):
-        return 1, '', f"Connection failed: {ip_addr}:{port} is unreachable."
-    if ip_addr == get_local_ip() or ip_addr == '127.0.0.1':
-        return 304, f"Skip local device: {ip_addr}:{port}", ''
-    remote_dir = _expand_remote_tilde(remote_dir, ip, username, ssh_password)
-    local_files = [SCORES_DB_PATH, EXAMS_DB_PATH, UID_DB_PATH, USERS_DB_PATH, CONFIG_DB_PATH, PROGRESS_DB_PATH, RESOURCE_PATH, FILES_DIR, DB_VERFILE_PATH]
-    if include_admin:
-        local_files.append(ADMIN_DB_PATH)
-    else:
-        if ssh_password:
-            cmd = [SSHPASS_PATH, '-p', ssh_password, 'ssh', '-p', port] + [f'{username}@{ip_addr}'] + [
-                'rm', '-f', _remote_join(remote_dir, os.path.basename(ADMIN_DB_PATH))]
+
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _config_digest():
+    # 推送指纹与同步水位本身也存于 config.db，只对业务表取内容摘要，避免每次记录都使其“变化”
+    h = hashlib.sha1()
+    conn = get_config_conn()
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    for table in tables:
+        if table in ('push_fingerprints', 'sync_marks'):
+            continue
+        h.update(table.encode('utf-8'))
+        for row in conn.execute(f'SELECT * FROM "{table}" ORDER BY rowid'):
+            h.update(repr(row).encode('utf-8'))
+    conn.close()
+    return h.hexdigest()
+
+def artifact_fingerprint(path, previous=None, config_fingerprint=None):
+    """推送文件指纹：目录取条目清单摘要，config.db 取业务表摘要（可传入已算好的 config_fingerprint），
+    其他文件为 size:mtime:sha1，size 与 mtime 未变时直接沿用上次结果"""
+    if os.path.isdir(path):
+        h = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d != TMP_DIR_NAME)
+            for fname in sorted(files):
+                fp = os.path.join(root, fname)
+                try:
+                    st = os.stat(fp)
+                except OSError:
+                    continue
+                h.update(f'{os.path.relpath(fp, path)}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8'))
+        return 'dir:' + h.hexdigest()
+    if os.path.abspath(path) == os.path.abspath(CONFIG_DB_PATH):
+        return config_fingerprint or 'db:' + _config_digest()
+    st = os.stat(path)
+    head = f'{st.st_size}:{st.st_mtime_ns}'
+    if previous and previous.startswith(head + ':'):
+        return previous
+    return f'{head}:{_file_sha1(path)}'
+
+def prepare_push():
+    """推送前的准备：WAL 检查点与 config.db 摘要与目标无关，一次同步中只做一次，
+    返回 (检查点未完成的库名集合, config.db 指纹)，传给各目标的 push"""
+    busy = frozenset(os.path.basename(p) for p in checkpoint_all())
+    return busy, 'db:' + _config_digest()
+
+def same_artifact(old, new):
+    if not old or not new:
+        return False
+    return old.rsplit(':', 1)[-1] == new.rsplit(':', 1)[-1]
+
+
+# 远端生成库快照的 Python 片段（远端没有 sqlite3 命令行时使用）
+_SNAPSHOT_PY = 'import sqlite3,sys; sqlite3.connect(sys.argv[1]).backup(sqlite3.connect(sys.argv[2]))'
+
+# Windows 自带的 OpenSSH 客户端不支持 ControlMaster
+SSH_MULTIPLEX = not sys.platform.startswith("win")
+SSH_CONTROL_PERSIST = 60
+
+
+class SshSession:
+    """单个目标的 SSH 会话：复用一条 ControlMaster 连接，缓存远端目录与系统类型"""
+
+    def __init__(self, ip, username, remote_dir, ssh_password=None, reachable=None):
+        self.ip = ip
+        self.ip_addr, self.port = _parse_ip_port(ip)
+        self.username = username
+        self.ssh_password = ssh_password
+        self.raw_remote_dir = remote_dir
+        self.control_path = None
+        self._control_dir = None
+        # 预扫描已知的可达性可直接传入，省去一次端口探测
+        self._reachable = reachable
+        self._remote_dir = None
+        self._flavour = None
+        self._cwd = ''
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def host(self):
+        return f'{self.username}@{self.ip_addr}'
+
+    def is_local(self):
+        return self.ip_addr == get_local_ip() or self.ip_addr == '127.0.0.1'
+
+    def reachable(self):
+        if self._reachable is None:
+            self._reachable = _is_port_open(self.ip_addr, self.port)
+        return self._reachable
+
+    def unreachable_result(self):
+        return 1, '', f"Connection failed: {self.ip_addr}:{self.port} is unreachable."
+
+    def _ssh_options(self):
+        opts = ['-p', self.port, '-o', 'StrictHostKeyChecking=no']
+        if self.control_path:
+            opts += ['-o', f'ControlPath={self.control_path}', '-o', 'ControlMaster=no']
+        return opts
+
+    def _wrap(self, cmd):
+        if self.ssh_password:
+            return [SSHPASS_PATH, '-p', self.ssh_password] + cmd
+        return cmd
+
+    def open(self):
+        """建立主连接；失败时退回为每条命令单独握手"""
+        if self.control_path or not SSH_MULTIPLEX or not self.reachable():
+            return
+        self._control_dir = tempfile.mkdtemp(prefix='examssh-')
+        control_path = os.path.join(self._control_dir, 'cm')
+        cmd = ['ssh', '-p', self.port, '-o', 'StrictHostKeyChecking=no', '-o', 'ControlMaster=yes',
+               '-o', f'ControlPath={control_path}', '-o', f'ControlPersist={SSH_CONTROL_PERSIST}',
+               '-N', '-f', self.host]
+        try:
+            p = subprocess.run(self._wrap(cmd), capture_output=True, text=True, timeout=30)
+            if p.returncode == 0:
+                self.control_path = control_path
+            else:
+                print(f"[WARN] ssh master for {self.ip_addr} failed: {(p.stderr or '').strip()}")
+        except Exception as e:
+            print(f"[WARN] ssh master for {self.ip_addr} failed: {e}")
+        if not self.control_path:
+            shutil.rmtree(self._control_dir, ignore_errors=True)
+            self._control_dir = None
+
+    def close(self):
+        if self.control_path:
+            try:
+                subprocess.run(['ssh', '-o', f'ControlPath={self.control_path}', '-O', 'exit', self.host],
+                               capture_output=True, text=True, timeout=10)
+            except Exception:
+                pass
+            self.control_path = None
+        if self._control_dir:
+            shutil.rmtree(self._control_dir, ignore_errors=True)
+            self._control_dir = None
+
+    def run(self, remote_cmd):
+        cmd = ['ssh'] + self._ssh_options() + [self.host, remote_cmd]
+        return subprocess.run(self._wrap(cmd), capture_output=True, text=True)
+
+    def _probe(self):
+        """一次探测同时得到远端工作目录与系统类型（posix / windows）"""
+        for flavour, remote_cmd in (('posix', 'pwd'),
+                                    ('windows', 'powershell -NoProfile -Command "$pwd.Path"'),
+                                    ('windows', 'cmd /c cd')):
+            try:
+                r = self.run(remote_cmd)
+                out = (r.stdout or '').strip()
+                if r.returncode == 0 and out:
+                    self._flavour = flavour
+                    return out
+            except Exception:
+                pass
+        self._flavour = 'posix'
+        return ''
+
+    @property
+    def flavour(self):
+        if self._flavour is None:
+            self._cwd = self._probe()
+        return self._flavour
+
+    @property
+    def remote_dir(self):
+        if self._remote_dir is None:
+            remote_dir = self.raw_remote_dir
+            if remote_dir and remote_dir.startswith('~'):
+                if self._flavour is None:
+                    self._cwd = self._probe()
+                if self._cwd:
+                    remote_dir = self._cwd + remote_dir[1:]
+            self._remote_dir = remote_dir
+        return self._remote_dir
+
+    def ensure_remote_dir(self):
+        remote_dir = self.remote_dir
+        if self.flavour == 'windows':
+            cmd = f"powershell -NoProfile -Command \"if (!(Test-Path -Path '{remote_dir}')) {{ New-Item -ItemType Directory -Path '{remote_dir}' }}\""
+        else:
+            cmd = f"test -d {remote_dir} || mkdir -p {remote_dir}"
+        r = self.run(cmd)
+        return r.returncode, r.stdout, r.stderr
+
+    def file_exists(self, remote_path):
+        if self.flavour == 'windows':
+            cmd = f"powershell -NoProfile -Command \"if (Test-Path -Path '{remote_path}') {{ Write-Output 'exists' }} else {{ Write-Output 'not found' }}\""
+        else:
+            cmd = f"test -f {remote_path} && echo 'exists' || echo 'not found'"
+        r = self.run(cmd)
+        return r.returncode == 0 and 'exists' in (r.stdout or '')
+
+    def remove_remote_file(self, remote_path):
+        self.remove_remote_files([remote_path])
+
+    def remove_remote_files(self, remote_paths):
+        """一条远端命令删除多个文件，不存在的文件忽略"""
+        if self.flavour == 'windows':
+            paths = ','.join(f"'{p}'" for p in remote_paths)
+            cmd = f"powershell -NoProfile -Command \"Remove-Item -Force -ErrorAction SilentlyContinue -Path {paths}\""
+        else:
+            cmd = 'rm -f ' + ' '.join(remote_paths)
+        r = self.run(cmd)
+        if r.returncode != 0:
+            raise subprocess.CalledProcessError(r.returncode, cmd, r.stdout, r.stderr)
+
+    def _tagged_output(self, cmd):
+        """执行远端命令，把形如 tag:name 的输出行整理为 {tag: {name}}"""
+        r = self.run(cmd)
+        if r.returncode != 0:
+            raise subprocess.CalledProcessError(r.returncode, cmd, r.stdout, r.stderr)
+        tagged = {}
+        for line in (r.stdout or '').splitlines():
+            tag, sep, name = line.strip().partition(':')
+            if sep:
+                tagged.setdefault(tag, set()).add(name)
+        return tagged
+
+    def install_remote_dbs(self, names):
+        """把已上传到远端 .tmp/ 的库改名替换正式库；远端库存在 -wal（应用正在使用或留有
+        未检查点的提交）时不替换。返回 (已替换的库名集合, 正在使用而未替换的库名集合)"""
+        remote_dir = self.remote_dir
+        if self.flavour == 'windows':
+            items = ','.join(f"'{n}'" for n in names)
+            cmd = (f"powershell -NoProfile -Command \"Set-Location -LiteralPath '{remote_dir}'; "
+                   f"foreach ($n in @({items})) {{ $t = '{TMP_DIR_NAME}\\' + $n; "
+                   f"if (Test-Path -LiteralPath ($n + '-wal')) {{ Remove-Item -Force -ErrorAction SilentlyContinue -LiteralPath $t; Write-Output ('busy:' + $n) }} "
+                   f"else {{ try {{ Move-Item -Force -ErrorAction Stop -LiteralPath $t -Destination $n; "
+                   f"Remove-Item -Force -ErrorAction SilentlyContinue -LiteralPath ($n + '-shm'); Write-Output ('ok:' + $n) }} "
+                   f"catch {{ Write-Output ('busy:' + $n) }} }} }}\"")
+        else:
+            cmd = (f'cd {remote_dir} && for n in {" ".join(names)}; do '
+                   f'if [ -e "$n-wal" ]; then rm -f "{TMP_DIR_NAME}/$n"; echo "busy:$n"; '
+                   f'else mv -f "{TMP_DIR_NAME}/$n" "$n" && rm -f "$n-shm" && echo "ok:$n"; fi; done')
+        tagged = self._tagged_output(cmd)
+        return tagged.get('ok', set()), tagged.get('busy', set())
+
+    def snapshot_remote_dbs(self, names):
+        """远端库正在使用（存在 -wal）时，用 SQLite 备份接口在远端 .tmp/snap/ 下生成一致的快照，
+        避免分别复制主库与 -wal 得到不一致的一对文件；没有 -wal 的库直接拉取主文件即可。
+        返回 (已生成快照的库名集合, 正在使用但无法生成快照的库名集合)"""
+        remote_dir = self.remote_dir
+        if self.flavour == 'windows':
+            items = ','.join(f"'{n}'" for n in names)
+            cmd = (f"powershell -NoProfile -Command \"Set-Location -LiteralPath '{remote_dir}'; "
+                   f"New-Item -ItemType Directory -Force -Path '{TMP_DIR_NAME}\\snap' | Out-Null; "
+                   f"foreach ($n in @({items})) {{ $s = '{TMP_DIR_NAME}\\snap\\' + $n; "
+                   f"Remove-Item -Force -ErrorAction SilentlyContinue -LiteralPath $s; "
+                   f"if (!(Test-Path -LiteralPath ($n + '-wal'))) {{ continue }}; "
+                   f"& python -c '{_SNAPSHOT_PY}' $n $s 2>$null; "
+                   f"if (Test-Path -LiteralPath $s) {{ Write-Output ('snap:' + $n) }} else {{ Write-Output ('busy:' + $n) }} }}\"")
         else:
-            cmd = ['ssh', '-p', port, f'{username}@{ip_addr}',
-             'rm', '-f', _remote_join(remote_dir, os.path.basename(ADMIN_DB_PATH))]
-        subprocess.run(cmd, check=True)
-    code_mk, out_mk, err_mk = _ensure_remote_dir(ip, username, remote_dir, ssh_password)
-    if code_mk != 0:
-        return code_mk, out_mk, f"Failed to create remote directory '{remote_dir}': {err_mk}"
-    # Compose rsync command
-    ssh_opts = f'ssh -p {port} -o StrictHostKeyChecking=no'
-    if ssh_password:
-        cmd = [SSHPASS_PATH, '-p', ssh_password, 'rsync', '-avz', '-e', ssh_opts] + local_files + [f'{username}@{ip_addr}:{remote_dir}/']
-    else:
-        cmd = ['rsync', '-avz', '-e', ssh_opts] + local_files + [f'{username}@{ip_addr}:{remote_dir}/']
-    p = subprocess.run(cmd, capture_output=True, text=True)
-    return p.returncode, p.stdout, p.stderr
+            cmd = (f"cd {remote_dir} && mkdir -p {TMP_DIR_NAME}/snap && for n in {' '.join(names)}; do "
+                   f's="{TMP_DIR_NAME}/snap/$n"; rm -f "$s"; [ -e "$n-wal" ] || continue; '
+                   f"if sqlite3 \"$n\" \".backup '$s'\" 2>/dev/null || python3 -c '{_SNAPSHOT_PY}' \"$n\" \"$s\" 2>/dev/null; "
+                   f'then echo "snap:$n"; else rm -f "$s"; echo "busy:$n"; fi; done')
+        tagged = self._tagged_output(cmd)
+        return tagged.get('snap', set()), tagged.get('busy', set())
+
+    def rsync(self, args):
+        ssh_opts = ' '.join(['ssh'] + self._ssh_options())
+        # 文件存储中导入到一半的临时文件不参与传输
+        cmd = ['rsync', '-avz', '--exclude', TMP_DIR_NAME + '/', '-e', ssh_opts] + args
+        p = subprocess.run(self._wrap(cmd), capture_output=True, text=True)
+        return p.returncode, p.stdout, p.stderr
+
+    @property
+    def target_key(self):
+        return push_target_key(self.ip, self.username, self.raw_remote_dir)
+
+    def push(self, include_admin=False, delta=True, prepared=None):
+        """Push selected local databases to remote directory.
+        delta=True 时只发送与上次成功推送指纹不同的文件；
+        prepared 为 prepare_push() 的结果，推送多个目标时共用"""
+        if not self.reachable():
+            return self.unreachable_result()
+        if self.is_local():
+            return 304, f"Skip local device: {self.ip_addr}:{self.port}", ''
+        remote_dir = self.remote_dir
+        local_files = [SCORES_DB_PATH, EXAMS_DB_PATH, UID_DB_PATH, USERS_DB_PATH, CONFIG_DB_PATH, PROGRESS_DB_PATH, RESOURCE_PATH, FILES_DIR, DB_VERFILE_PATH]
+        if include_admin:
+            local_files.append(ADMIN_DB_PATH)
+        else:
+            self.remove_remote_file(_remote_join(remote_dir, os.path.basename(ADMIN_DB_PATH)))
+        # WAL 模式下最近的提交还在 -wal 文件中，推送前先写回主库；写回不完整的库不能推送
+        busy, config_fingerprint = prepared or prepare_push()
+        blocked = [os.path.basename(p) for p in local_files if os.path.basename(p) in busy]
+        if blocked:
+            return 1, '', f"WAL checkpoint busy, retry later: {', '.join(blocked)}"
+        previous = get_push_fingerprints(self.target_key) if delta else {}
+        current = {}
+        for path in local_files:
+            if os.path.exists(path):
+                name = os.path.basename(path)
+                current[name] = artifact_fingerprint(path, previous.get(name), config_fingerprint)
+        changed = [path for path in local_files
+                   if os.path.basename(path) in current and not same_artifact(previous.get(os.path.basename(path)), current[os.path.basename(path)])]
+        removed = () if include_admin else (os.path.basename(ADMIN_DB_PATH),)
+        if not changed:
+            set_push_fingerprints(self.target_key, current, removed)
+            return 0, 'Up to date', ''
+        code_mk, out_mk, err_mk = self.ensure_remote_dir()
+        if code_mk != 0:
+            return code_mk, out_mk, f"Failed to create remote directory '{remote_dir}': {err_mk}"
+        # 远端库被整体替换为本地副本，其变更日志水位即为本地当前水位；须在发送前读取，
+        # 发送期间新增的变更序号更大，下次拉取时会再合并一次（合并是幂等的）
+        logged = {path for path, tbl in CHANGE_LOG_TABLES}
+        marks = {os.path.basename(path): change_log_state(path) for path in changed if path in logged}
+        # 库文件先传到远端 .tmp/，确认远端没有在用（无 -wal）后再改名替换；
+        # 直接覆盖正在使用的库、或删掉其 -wal，都可能损坏远端库或丢失未检查点的提交
+        present = self.list_remote_dir() or set()
+        dbs = [path for path in changed if path in ALL_DB_PATHS]
+        in_use = {os.path.basename(path) for path in dbs if os.path.basename(path) + '-wal' in present}
+        dbs = [path for path in dbs if os.path.basename(path) not in in_use]
+        sent = set()
+        code, out, err = 0, '', ''
+        if dbs:
+            code, out, err = self.rsync(dbs + [f'{self.host}:{_remote_join(remote_dir, TMP_DIR_NAME)}/'])
+            if code != 0:
+                return code, out, err
+            try:
+                names = [os.path.basename(path) for path in dbs]
+                installed, busy = self.install_remote_dbs(names)
+            except subprocess.CalledProcessError as e:
+                return e.returncode, e.stdout, f"Failed to replace remote databases: {e.stderr}"
+            sent |= installed
+            # 改名失败（如远端文件被锁定）同样按正在使用处理
+            in_use |= busy | (set(names) - installed)
+        others = [path for path in changed if path not in ALL_DB_PATHS]
+        if in_use:
+            # 有库未能替换时不更新远端的库版本号，避免远端按新版本去迁移旧库
+            others = [path for path in others if path != DB_VERFILE_PATH]
+        if others:
+            code, out, err = self.rsync(others + [f'{self.host}:{remote_dir}/'])
+            if code == 0:
+                sent |= {os.path.basename(path) for path in others}
+        # 未送达的文件保留上次的指纹，下次推送时重新发送
+        unsent = {os.path.basename(path) for path in changed} - sent
+        set_push_fingerprints(self.target_key, {k: v for k, v in current.items() if k not in unsent}, removed)
+        set_sync_marks(self.target_key, {k: v for k, v in marks.items() if k in sent})
+        for path in changed:
+            if path in logged and os.path.basename(path) in sent:
+                compact_change_log(path)
+        if code == 0 and in_use:
+            return 1, out, f"Remote database in use, not replaced: {', '.join(sorted(in_use))}"
+        return code, out, err
+
+    def pull_file(self, local_dir, filename):
+        """Pull a specific file from remote directory to local_dir using rsync"""
+        if not self.reachable():
+            return self.unreachable_result()
+        os.makedirs(local_dir, exist_ok=True)
+        remote_dir = self.remote_dir
+        remote_file = _remote_join(remote_dir, filename)
+        if not self.file_exists(remote_file):
+            return 1, '', f'Remote file not found: {remote_file}'
+        if filename.endswith('.db'):
+            return self.pull_bundle(local_dir, [filename])[filename]
+        return self.rsync([f'{self.host}:{remote_file}', local_dir])
+
+    def list_remote_dir(self):
+        """一次列出远端目录下的条目名"""
+        remote_dir = self.remote_dir
+        if self.flavour == 'windows':
+            cmd = f"powershell -NoProfile -Command \"Get-ChildItem -Name -Force -LiteralPath '{remote_dir}'\""
+        else:
+            cmd = f"ls -1a {remote_dir}"
+        r = self.run(cmd)
+        if r.returncode != 0:
+            return None
+        return {line.strip().rstrip('/\\') for line in (r.stdout or '').splitlines() if line.strip()}
+
+    def pull_bundle(self, local_dir, names):
+        """一次 rsync 拉取多个数据库文件以及 files/ 目录，正在使用的库改拉远端快照。
+        names 中的 'files' 表示 files/ 目录；返回 {name: (code, out, err)}"""
+        if not self.reachable():
+            return {name: self.unreachable_result() for name in names}
+        os.makedirs(local_dir, exist_ok=True)
+        remote_dir = self.remote_dir
+        listed = self.list_remote_dir()
+        present = set(names) if listed is None else listed
+        status = {}
+        # 远端库正在使用时主库与 -wal 会被分别复制，得到的一对文件可能不一致，改拉远端快照
+        in_use = [name for name in names if name.endswith('.db') and name in present
+                  and (listed is None or name + '-wal' in present)]
+        snapped, busy = set(), set()
+        if in_use:
+            try:
+                snapped, busy = self.snapshot_remote_dbs(in_use)
+                busy |= set(in_use) - snapped
+            except subprocess.CalledProcessError as e:
+                busy = set(in_use)
+                print(f"[WARN] remote snapshot on {self.ip_addr} failed: {(e.stderr or '').strip()}")
+        filters = []
+        snap_filters = []
+        for name in names:
+            if name not in present:
+                status[name] = (1, '', f'Remote file not found: {_remote_join(remote_dir, name)}')
+                continue
+            if name in busy:
+                status[name] = (1, '', f'Remote database in use and no snapshot could be taken: {name}')
+                continue
+            if name == 'files':
+                filters += ['--include', 'files/', '--include', 'files/**']
+                continue
+            if name.endswith('.db'):
+                # 拉到的是完整的主库或快照，本地残留的 -wal/-shm 不能再与之配对
+                for suffix in ('-wal', '-shm'):
+                    stale = os.path.join(local_dir, name + suffix)
+                    if os.path.exists(stale):
+                        os.remove(stale)
+            if name in snapped:
+                snap_filters += ['--include', name]
+            else:
+                filters += ['--include', name]
+        if filters:
+            result = self.rsync(filters + ['--exclude', '*', f'{self.host}:{_remote_join(remote_dir, "")}', local_dir])
+            for name in names:
+                if name not in snapped:
+                    status.setdefault(name, result)
+        if snap_filters:
+            snap_dir = _remote_join(remote_dir, TMP_DIR_NAME, 'snap')
+            result = self.rsync(snap_filters + ['--exclude', '*', f'{self.host}:{snap_dir}/', local_dir])
+            for name in snapped:
+                status.setdefault(name, result)
+            try:
+                self.remove_remote_files([_remote_join(snap_dir, name) for name in snapped])
+            except subprocess.CalledProcessError as e:
+                print(f"[WARN] remove remote snapshots on {self.ip_addr} failed: {(e.stderr or '').strip()}")
+        return status
+
+    def pull_files_dir(self, local_dir):
+        """Pull entire files/ directory from remote using rsync"""
+        if not self.reachable():
+            return self.unreachable_result()
+        os.makedirs(local_dir, exist_ok=True)
+        remote_files = _remote_join(self.remote_dir, 'files') + '/'
+        return self.rsync([f'{self.host}:{remote_files}', local_dir])
+
+
+SYNC_MAX_WORKERS = 8
+SYNC_SUBNET_WORKERS = 4
+SYNC_RETRIES = 2
+SYNC_RETRY_BACKOFF = 2.0
+SYNC_POOL_THREADS = 64
+
+
+def _setting_number(key, default, cast=int):
+    try:
+        v = get_setting(key)
+        return cast(v) if v not in (None, '') else default
+    except Exception:
+        return default
+
+def _subnet_of(ip):
+    """IPv4 取 /24 网段，其他地址按主机区分"""
+    ip_addr, _ = _parse_ip_port(ip)
+    parts = ip_addr.split('.')
+    if len(parts) == 4:
+        return '.'.join(parts[:3])
+    return ip_addr
+
+
+class _AdaptiveLimit:
+    """可动态调整上限的并发闸门：明显变慢或超时时收紧，顺利完成时逐步放宽；
+    离线、拒绝连接这类很快就失败的情况与拥塞无关，不参与调整"""
+
+    def __init__(self, maximum):
+        self.maximum = max(1, maximum)
+        self.limit = self.maximum
+        self.active = 0
+        self.avg = None
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self, ok, elapsed, timed_out=False):
+        with self._cond:
+            self.active -= 1
+            slow = self.avg is not None and elapsed > self.avg * 3
+            if slow or timed_out:
+                self.limit = max(1, self.limit - 1)
+            elif ok and self.limit < self.maximum:
+                self.limit += 1
+            if ok:
+                self.avg = elapsed if self.avg is None else self.avg * 0.8 + elapsed * 0.2
+            self._cond.notify_all()
+
+
+class SyncScheduler:
+    """同步任务调度：全局与每网段并发上限、按耗时/失败自适应、失败重试并指数退避。
+    配置项（config.db settings）：sync_max_workers、sync_subnet_workers、sync_retries、sync_retry_backoff"""
+
+    def __init__(self, max_workers=SYNC_MAX_WORKERS, subnet_workers=SYNC_SUBNET_WORKERS,
+                 retries=SYNC_RETRIES, backoff=SYNC_RETRY_BACKOFF):
+        self.max_workers = max(1, max_workers)
+        self.subnet_workers = max(1, subnet_workers)
+        self.retries = max(0, retries)
+        self.backoff = max(0.0, backoff)
+        self._limit = _AdaptiveLimit(self.max_workers)
+        self._subnets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(_setting_number('sync_max_workers', SYNC_MAX_WORKERS),
+                   _setting_number('sync_subnet_workers', SYNC_SUBNET_WORKERS),
+                   _setting_number('sync_retries', SYNC_RETRIES),
+                   _setting_number('sync_retry_backoff', SYNC_RETRY_BACKOFF, float))
+
+    def _subnet_sem(self, ip):
+        key = _subnet_of(ip)
+        with self._lock:
+            sem = self._subnets.get(key)
+            if sem is None:
+                sem = self._subnets[key] = threading.BoundedSemaphore(self.subnet_workers)
+            return sem
+
+    def _run_one(self, target, job, should_retry):
+        try:
+            return self._run_with_retry(target, job, should_retry)
+        finally:
+            # 池线程随 executor 退出，job 中用到的线程连接在此释放
+            close_thread_connections()
+
+    def _run_with_retry(self, target, job, should_retry):
+        sem = self._subnet_sem(target[2])
+        start = time.monotonic()
+        tries = 0
+        while True:
+            tries += 1
+            with sem:
+                self._limit.acquire()
+                t0 = time.monotonic()
+                ok = False
+                result = None
+                try:
+                    result = job(target)
+                    ok = not should_retry(result)
+                except Exception as e:
+                    result = e
+                finally:
+                    timed_out = isinstance(result, (subprocess.TimeoutExpired, TimeoutError))
+                    self._limit.release(ok, time.monotonic() - t0, timed_out)
+            if ok or tries > self.retries:
+                break
+            # 退避等待不占用并发名额
+            time.sleep(self.backoff * (2 ** (tries - 1)))
+        return result, time.monotonic() - start, tries
+
+    def run(self, targets, job, should_retry=lambda result: False):
+        """并发执行 job(target)，按完成顺序产出 (target, result, elapsed, tries)；
+        job 抛出的异常作为 result 返回"""
+        targets = list(targets)
+        if not targets:
+            return
+        # 线程数多于并发名额，退避中的目标不会挤占其他目标；实际并发由闸门控制
+        pool_size = min(len(targets), max(self.max_workers, SYNC_POOL_THREADS))
+        with ThreadPoolExecutor(max_workers=pool_size) as ex:
+            future_map = {ex.submit(self._run_one, t, job, should_retry): t for t in targets}
+            for fut in as_completed(future_map):
+                result, elapsed, tries = fut.result()
+                yield future_map[fut], result, elapsed, tries
+
+
+def rsync_push(ip, username, remote_dir, ssh_password=None, include_admin=False, delta=True):
+    """Push selected local databases to remote directory"""
+    with SshSession(ip, username, remote_dir, ssh_password) as session:
+        return session.push(include_admin, delta)
 
 def rsync_pull_file(ip, username, remote_dir, local_dir, filename, ssh_password=None):
     """Pull a specific file from remote directory to local_dir using rsync"""
-    ip_addr, port = _parse_ip_port(ip)
-    if not _is_port_open(ip_addr, port):
-        return 1, '', f"Connection failed: {ip_addr}:{port} is unreachable."
-    os.makedirs(local_dir, exist_ok=True)
-    remote_dir = _expand_remote_tilde(remote_dir, ip, username, ssh_password)
-    remote_file = _remote_join(remote_dir, filename)
-    exists = _check_remote_file_exists(ip, username, remote_file, ssh_password)
-    if not exists:
-        return 1, '', f'Remote file not found: {remote_file}'
-    ssh_opts = f'ssh -p {port} -o StrictHostKeyChecking=no'
-    if ssh_password:
-        cmd = [SSHPASS_PATH, '-p', ssh_password, 'rsync', '-avz', '-e', ssh_opts, f'{username}@{ip_addr}:{remote_file}', local_dir]
-    else:
-        cmd = ['rsync', '-avz', '-e', ssh_opts, f'{username}@{ip_addr}:{remote_file}', local_dir]
-    p = subprocess.run(cmd, capture_output=True, text=True)
-    return p.returncode, p.stdout, p.stderr
+    with SshSession(ip, username, remote_dir, ssh_password) as session:
+        return session.pull_file(local_dir, filename)
+
+def rsync_pull_bundle(target, names, local_dir):
+    """按同步目标一次 rsync 拉取 names 中的数据库及 files/ 目录，返回每项状态"""
+    ssh_password = target[5] if len(target) > 5 else None
+    with SshSession(target[2], target[3], target[4], ssh_password) as session:
+        return session.pull_bundle(local_dir, names)
 
 def rsync_pull_scores(ip, username, remote_dir, local_dir, ssh_password=None):
     return rsync_pull_file(ip, username, remote_dir, local_dir, 'scores.db', ssh_password)
@@ -205,32 +760,216 @@ def rsync_pull_knowledge(ip, username, remote_dir, local_dir, ssh_password=None)
 
 def rsync_pull_files_dir(ip, username, remote_dir, local_dir, ssh_password=None):
     """Pull entire files/ directory from remote using rsync"""
-    ip_addr, port = _parse_ip_port(ip)
-    if not _is_port_open(ip_addr, port):
-        return 1, '', f"Connection failed: {ip_addr}:{port} is unreachable."
-    os.makedirs(local_dir, exist_ok=True)
-    remote_dir = _expand_remote_tilde(remote_dir, ip, username, ssh_password)
-    remote_files = _remote_join(remote_dir, 'files') + '/'
-    ssh_opts = f'ssh -p {port} -o StrictHostKeyChecking=no'
-    if ssh_password:
-        cmd = [SSHPASS_PATH, '-p', ssh_password, 'rsync', '-avz', '-e', ssh_opts, f'{username}@{ip_addr}:{remote_files}', local_dir]
-    else:
-        cmd = ['rsync', '-avz', '-e', ssh_opts, f'{username}@{ip_addr}:{remote_files}', local_dir]
-    p = subprocess.run(cmd, capture_output=True, text=True)
-    return p.returncode, p.stdout, p.stderr
-
-def merge_pulled_files(pulled_files_dir):
-    """Merge pulled files into local FILES_DIR"""
-    import shutil
-    os.makedirs(FILES_DIR, exist_ok=True)
+    with SshSession(ip, username, remote_dir, ssh_password) as session:
+        return session.pull_files_dir(local_dir)
+
+def merge_pulled_files(pulled_files_dir, dest_dir=FILES_DIR):
+    """Merge pulled files into local FILES_DIR (or dest_dir).
+    FILES_DIR 按内容寻址：远端无论平铺还是分片存放，都按 sha1 放入本地存储"""
+    os.makedirs(dest_dir, exist_ok=True)
     copied = 0
     if not os.path.exists(pulled_files_dir):
         return copied
-    for fname in os.listdir(pulled_files_dir):
-        src = os.path.join(pulled_files_dir, fname)
-        if os.path.isfile(src):
-            dst = os.path.join(FILES_DIR, fname)
+    store = get_store(FILES_DIR, files_sharded_layout()) if dest_dir == FILES_DIR else None
+    for root, dirs, files in os.walk(pulled_files_dir):
+        for fname in files:
+            src = os.path.join(root, fname)
+            sha1 = sha1_from_name(fname) if store is not None else None
+            if sha1:
+                if store.lookup(sha1) is None:
+                    store.put(src, sha1, fname[len(sha1):])
+                    copied += 1
+                continue
+            if root != pulled_files_dir:
+                continue
+            dst = os.path.join(dest_dir, fname)
             if not os.path.exists(dst):
                 shutil.copy2(src, dst)
                 copied += 1
     return copied
+
+
+# 同步包：单个可流式读写的加密归档（清单 + 各表行导出 + 按内容寻址的文件），用于 U 盘等离线传递
+# 外层为 crypto_util 的分块认证加密流（本机密钥）
+BUNDLE_VERSION = 2
+BUNDLE_CHUNK_SIZE = 1024 * 1024
+BUNDLE_SUFFIX = '.exbundle'
+BUNDLE_TABLES = (
+    (SCORES_DB_PATH, ('attempts', 'attempt_answers')),
+    (USERS_DB_PATH, ('users',)),
+    (EXAMS_DB_PATH, ('exams', 'questions')),
+    (PROGRESS_DB_PATH, ('progress_modules', 'progress_tasks', 'user_task_progress')),
+    (KB_DB_PATH, ('knowledge_base',)),
+)
+BUNDLE_DIRS = (FILES_DIR, RESOURCE_PATH)
+
+
+def _tar_add_stream(tar, name, f):
+    info = tarfile.TarInfo(name)
+    info.size = f.seek(0, io.SEEK_END)
+    info.mtime = int(time.time())
+    f.seek(0)
+    tar.addfile(info, f)
+
+def _export_rows(conn, table, since=0):
+    """表行导出为 JSON Lines：首行为列名；since > 0 且库带变更日志时只导出之后变更过的行"""
+    where, params = '', ()
+    if since and conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='change_log'").fetchone():
+        where, params = ' WHERE rowid IN (SELECT row_id FROM change_log WHERE tbl=? AND seq > ?)', (table, since)
+    cur = conn.execute(f'SELECT * FROM "{table}"' + where, params)
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    out.write(json.dumps([d[0] for d in cur.description]).encode('utf-8') + b'\n')
+    for row in cur:
+        out.write(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n')
+    return out
+
+def _import_rows(conn, table, create_sql, f):
+    conn.execute(create_sql)
+    cols = json.loads(f.readline())
+    sql = f'INSERT INTO "{table}" ({", ".join(cols)}) VALUES ({",".join("?" * len(cols))})'
+    batch = []
+    for line in f:
+        batch.append(json.loads(line))
+        if len(batch) >= 500:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+def _bundle_target(dest_dir, rel):
+    # 清单中的路径只能落在 files/ 或 resources/ 之下
+    top, _, rest = rel.partition('/')
+    parts = rest.split('/')
+    if top not in {os.path.basename(d) for d in BUNDLE_DIRS} or not rest or any(p in ('', '.', '..') for p in parts):
+        raise ValueError(f'Invalid path in sync bundle: {rel}')
+    return os.path.join(dest_dir, top, *parts)
+
+def build_bundle(out_path, include_admin=False, since=None):
+    """把各库的表行与 files/、resources/ 打成一个 xz 压缩并加密的同步包，返回清单。
+    since 为 {库文件名: 变更序号}，带变更日志的表只导出之后变更过的行"""
+    since = since or {}
+    # 表行经 SQLite 连接读取，WAL 中尚未写回的提交同样可见，无需先做检查点
+    tables = list(BUNDLE_TABLES)
+    if include_admin:
+        tables.append((ADMIN_DB_PATH, ('admins',)))
+    # 目录中的文件按 sha1 寻址，相同内容只收录一份
+    blobs = {}
+    for base in BUNDLE_DIRS:
+        for root, dirs, files in os.walk(base):
+            dirs[:] = [d for d in dirs if d != TMP_DIR_NAME]
+            for fname in files:
+                fp = os.path.join(root, fname)
+                rel = os.path.relpath(fp, base).replace(os.sep, '/')
+                blobs[f'{os.path.basename(base)}/{rel}'] = (fp, _file_sha1(fp))
+    manifest = {
+        'format': BUNDLE_VERSION,
+        'created_at': now_iso(),
+        'source': socket.gethostname(),
+        'dbs': {},
+        'files': {rel: sha for rel, (fp, sha) in sorted(blobs.items())},
+    }
+    for db_path, names in tables:
+        if not os.path.exists(db_path):
+            continue
+        conn = sqlite3.connect(db_path)
+        try:
+            schema = {}
+            for tbl in names:
+                row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (tbl,)).fetchone()
+                if row:
+                    schema[tbl] = row[0]
+        finally:
+            conn.close()
+        name = os.path.basename(db_path)
+        manifest['dbs'][name] = {'log': list(change_log_state(db_path)), 'since': since.get(name, 0), 'tables': schema}
+    tmp = out_path + '.tmp'
+    try:
+        with open(tmp, 'wb') as raw:
+            writer = EncryptWriter(raw, chunk_size=BUNDLE_CHUNK_SIZE)
+            with tarfile.open(fileobj=writer, mode='w|xz') as tar:
+                _tar_add_stream(tar, 'manifest.json', io.BytesIO(json.dumps(manifest, ensure_ascii=False).encode('utf-8')))
+                for db_path, names in tables:
+                    name = os.path.basename(db_path)
+                    if name not in manifest['dbs']:
+                        continue
+                    conn = sqlite3.connect(db_path)
+                    try:
+                        for tbl in manifest['dbs'][name]['tables']:
+                            with _export_rows(conn, tbl, since.get(name, 0)) as rows:
+                                _tar_add_stream(tar, f'tables/{name}/{tbl}.jsonl', rows)
+                    finally:
+                        conn.close()
+                added = set()
+                for rel, (fp, sha) in sorted(blobs.items()):
+                    if sha not in added:
+                        added.add(sha)
+                        tar.add(fp, arcname=f'blobs/{sha}', recursive=False)
+            writer.close()
+        os.replace(tmp, out_path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return manifest
+
+def unpack_bundle(bundle_path, dest_dir):
+    """解开同步包：各库的表行写入 dest_dir 下同名的 SQLite 文件，files/ 与 resources/ 按清单还原，返回清单。
+    之后即可像 rsync 拉取的结果一样交给各 merge_* 函数合并"""
+    os.makedirs(dest_dir, exist_ok=True)
+    manifest = None
+    targets = {}
+    conns = {}
+    try:
+        with open(bundle_path, 'rb') as raw:
+            with tarfile.open(fileobj=io.BufferedReader(DecryptReader(raw)), mode='r|xz') as tar:
+                for member in tar:
+                    f = tar.extractfile(member)
+                    if f is None:
+                        continue
+                    if member.name == 'manifest.json':
+                        manifest = json.loads(f.read().decode('utf-8'))
+                        if manifest.get('format') != BUNDLE_VERSION:
+                            raise ValueError(f"Unsupported sync bundle format: {manifest.get('format')}")
+                        for rel, sha in manifest.get('files', {}).items():
+                            targets.setdefault(sha, []).append(_bundle_target(dest_dir, rel))
+                        continue
+                    if manifest is None:
+                        raise ValueError('Sync bundle manifest missing')
+                    kind, _, rest = member.name.partition('/')
+                    if kind == 'tables':
+                        db_name, _, tbl_file = rest.partition('/')
+                        tbl = tbl_file[:-len('.jsonl')]
+                        info = manifest['dbs'].get(db_name)
+                        if not info or tbl not in info['tables']:
+                            continue
+                        conn = conns.get(db_name)
+                        if conn is None:
+                            db_file = os.path.join(dest_dir, db_name)
+                            for suffix in ('', '-wal', '-shm'):
+                                if os.path.exists(db_file + suffix):
+                                    os.remove(db_file + suffix)
+                            conn = conns[db_name] = sqlite3.connect(db_file)
+                        _import_rows(conn, tbl, info['tables'][tbl], f)
+                    elif kind == 'blobs':
+                        paths = targets.get(rest, [])
+                        if not paths:
+                            continue
+                        h = hashlib.sha1()
+                        os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+                        with open(paths[0], 'wb') as out:
+                            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                                h.update(chunk)
+                                out.write(chunk)
+                        if h.hexdigest() != rest:
+                            raise ValueError(f'Sync bundle blob {rest} is corrupted')
+                        for dst in paths[1:]:
+                            os.makedirs(os.path.dirname(dst), exist_ok=True)
+                            shutil.copy2(paths[0], dst)
+        for conn in conns.values():
+            conn.commit()
+    finally:
+        for conn in conns.values():
+            conn.close()
+    if manifest is None:
+        raise ValueError('Sync bundle manifest missing')
+    return manifest
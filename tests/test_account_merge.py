@@ -0,0 +1,76 @@
+import importlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+
+class AccountMergeTest(unittest.TestCase):
+    def _reload(self, td):
+        os.environ['HOME'] = td
+        import database
+        import models
+
+        importlib.reload(database)
+        importlib.reload(models)
+        return database, models
+
+    def test_merge_user_databases_report(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            for name in ('alice', 'bob', 'carol'):
+                models.create_user(name, 'pw')
+            database.checkpoint_all()
+            remote = os.path.join(td, 'remote_users.db')
+            shutil.copy2(database.USERS_DB_PATH, remote)
+
+            # 远端原地删除 bob；carol 则是远端自有、id 不同的一条已删除记录
+            rconn = sqlite3.connect(remote)
+            rconn.execute("DELETE FROM users WHERE username='carol'")
+            rconn.execute("UPDATE users SET full_name='Alice', edit_at='9999999998' WHERE username='alice'")
+            rconn.execute("UPDATE users SET username=?, shadow_delete=1, edit_at='9999999999' WHERE username='bob'",
+                          (f'9f0c_bob_{models.DELETE_IDENTIFIER}',))
+            rconn.execute('INSERT INTO users (id, username, password_hash, role, active, edit_at, shadow_delete) '
+                          "VALUES (9001, ?, 'x', 'user', 1, '9999999999', 1)", (f'77aa_carol_{models.DELETE_IDENTIFIER}',))
+            rconn.execute("INSERT INTO users (id, username, password_hash, role, active, edit_at) VALUES (9002, 'dave', 'x', 'user', 1, '5')")
+            rconn.commit()
+            rconn.close()
+
+            report = models.merge_user_databases(remote)
+            self.assertEqual((report['inserted'], report['updated'], report['deleted']), (2, 1, 2))
+            conn = database.get_user_conn()
+            rows = dict(conn.execute('SELECT username, shadow_delete FROM users').fetchall())
+            self.assertNotIn('bob', rows)
+            self.assertNotIn('carol', rows)
+            self.assertEqual(rows[f'9f0c_bob_{models.DELETE_IDENTIFIER}'], 1)
+            self.assertEqual(sum(1 for u in rows if u.endswith('_carol_' + models.DELETE_IDENTIFIER)), 2)
+            self.assertEqual(rows['dave'], 0)
+            self.assertEqual(conn.execute("SELECT full_name FROM users WHERE username='alice'").fetchone()[0], 'Alice')
+
+            again = models.merge_user_databases(remote)
+            self.assertEqual((again['inserted'], again['updated'], again['deleted']), (0, 0, 0))
+
+    def test_merge_admin_databases_many_rows(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            models.create_admin_if_absent()
+            database.checkpoint_all()
+            remote = os.path.join(td, 'remote_admin.db')
+            shutil.copy2(database.ADMIN_DB_PATH, remote)
+            rconn = sqlite3.connect(remote)
+            rconn.executemany('INSERT INTO admins (id, username, password_hash, active, edit_at) VALUES (?, ?, ?, 1, ?)',
+                              [(10000 + i, f'admin{i}', 'x', str(i)) for i in range(5000)])
+            rconn.commit()
+            rconn.close()
+
+            start = time.perf_counter()
+            report = models.merge_admin_databases(remote)
+            self.assertLess(time.perf_counter() - start, 1.0)
+            self.assertEqual(report['inserted'], 5000)
+            self.assertEqual(database.get_admin_conn().execute('SELECT COUNT(*) FROM admins').fetchone()[0], 5000 + report['unchanged'])
+
+
+if __name__ == '__main__':
+    unittest.main()
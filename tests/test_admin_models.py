@@ -0,0 +1,37 @@
+import importlib
+import os
+import tempfile
+import unittest
+
+
+class AdminModelsTest(unittest.TestCase):
+    def test_keeps_one_active_admin(self):
+        with tempfile.TemporaryDirectory() as td:
+            os.environ['HOME'] = td
+            import database
+            import models
+
+            importlib.reload(database)
+            importlib.reload(models)
+            database.ensure_db()
+
+            models.create_admin('root', 'pw')
+            models.create_admin('ops', 'pw')
+            ids = {a[1]: a[0] for a in models.list_admins()}
+            models.update_admin_active(ids['ops'], 0)
+
+            # 连接池下 close() 不再真正关闭连接，守卫必须直接拒绝而不是被吞掉
+            with self.assertRaises(Exception) as cm:
+                models.update_admin_active(ids['root'], 0)
+            self.assertIn('至少保留一个启用的管理员', str(cm.exception))
+            active = {a[1]: a[4] for a in models.list_admins()}
+            self.assertEqual(active, {'root': 1, 'ops': 0})
+
+            models.update_admin_active(ids['ops'], 1)
+            models.update_admin_active(ids['root'], 0)
+            self.assertEqual({a[1]: a[4] for a in models.list_admins()}, {'root': 0, 'ops': 1})
+            database.close_thread_connections()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+import crypto_util
+from sized_lru import SizedLRUCache
+
+
+class DecryptCacheTest(unittest.TestCase):
+    def setUp(self):
+        crypto_util.clear_decrypt_cache()
+
+    def test_roundtrip_hits_cache(self):
+        enc = crypto_util.encrypt_text('张三')
+        self.assertEqual(crypto_util.decrypt_text(enc), '张三')
+        self.assertEqual(crypto_util.decrypt_json(crypto_util.encrypt_json(['A', 1])), ['A', 1])
+        stats = crypto_util.decrypt_cache_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 0)
+
+    def test_miss_then_hit(self):
+        enc = crypto_util.encrypt_text('x')
+        crypto_util.clear_decrypt_cache()
+        self.assertEqual(crypto_util.decrypt_text(enc), 'x')
+        self.assertEqual(crypto_util.decrypt_text(enc), 'x')
+        stats = crypto_util.decrypt_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_evicts_by_size(self):
+        cache = crypto_util.DecryptCache(max_bytes=2000)
+        for i in range(100):
+            cache.put(f'enc:{i}', 'v' * 50)
+        stats = cache.stats()
+        self.assertLessEqual(stats['bytes'], 2000)
+        self.assertLess(stats['entries'], 100)
+        self.assertIsNone(cache.get('enc:0'))
+        self.assertEqual(cache.get('enc:99'), 'v' * 50)
+        cache.resize(0)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_custom_entry_size(self):
+        # 子类改写 _entry_size 即可按其它口径计算占用
+        class LenCache(SizedLRUCache):
+            @staticmethod
+            def _entry_size(key, value):
+                return len(value)
+
+        cache = LenCache(max_bytes=10)
+        cache.put_many([('a', 'x' * 4), ('b', 'x' * 4), ('c', 'x' * 4)])
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.get_many(['b', 'c', 'a']), ['x' * 4, 'x' * 4, None])
+        self.assertEqual(cache.stats()['bytes'], 8)
+
+
+class BulkCryptoTest(unittest.TestCase):
+    def setUp(self):
+        crypto_util.clear_decrypt_cache()
+
+    def test_matches_single_value_api(self):
+        values = ['张三', None, '', 5, 'x' * 100]
+        encs = crypto_util.encrypt_many(values)
+        self.assertIsNone(encs[1])
+        crypto_util.clear_decrypt_cache()
+        self.assertEqual([crypto_util.decrypt_text(e) for e in encs], ['张三', None, '', '5', 'x' * 100])
+        crypto_util.clear_decrypt_cache()
+        mixed = encs + ['plain', b'bytes', 7]
+        self.assertEqual(crypto_util.decrypt_many(mixed), ['张三', None, '', '5', 'x' * 100, 'plain', 'bytes', 7])
+        self.assertEqual(crypto_util.decrypt_cache_stats()['misses'], 4)
+
+        objs = [['A', 1], None, {'k': '值'}]
+        jencs = crypto_util.encrypt_many(objs, as_json=True)
+        self.assertEqual([crypto_util.decrypt_json(e) for e in jencs], objs)
+        self.assertEqual(crypto_util.decrypt_many(jencs + ['[1]', 'bad', None, 'enc:!!'], as_json=True),
+                         objs + [[1], None, None, None])
+        with self.assertRaises(Exception):
+            crypto_util.decrypt_many(['enc:!!'])
+
+    def test_parallel_batches(self):
+        values = [f'user{i}' for i in range(crypto_util.BULK_PARALLEL_MIN + 100)]
+        encs = crypto_util.encrypt_many(values, max_workers=4)
+        crypto_util.clear_decrypt_cache()
+        self.assertEqual(crypto_util.decrypt_many(encs, max_workers=4), values)
+        self.assertEqual(len(set(encs)), len(encs))
+
+
+if __name__ == '__main__':
+    unittest.main()
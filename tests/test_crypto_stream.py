@@ -0,0 +1,46 @@
+import os
+import unittest
+from io import BytesIO
+
+import crypto_util
+
+
+class StreamCryptoTest(unittest.TestCase):
+    def _encrypt(self, data, chunk_size=1000, secret_key=None):
+        out = BytesIO()
+        with crypto_util.EncryptWriter(out, secret_key=secret_key, chunk_size=chunk_size) as w:
+            for i in range(0, len(data), 700):
+                w.write(data[i:i + 700])
+        return out.getvalue()
+
+    def test_roundtrip_chunked(self):
+        for size in (0, 1, 999, 1000, 1001, 5000):
+            data = os.urandom(size)
+            enc = self._encrypt(data)
+            self.assertTrue(crypto_util.is_stream_encrypted(enc))
+            chunks = list(crypto_util.iter_decrypt(BytesIO(enc)))
+            self.assertTrue(all(len(c) <= 1000 for c in chunks))
+            self.assertEqual(b''.join(chunks), data)
+            self.assertEqual(crypto_util.DecryptReader(BytesIO(enc)).read(), data)
+
+    def test_string_key(self):
+        enc = self._encrypt(b'picture', secret_key='example')
+        self.assertEqual(crypto_util.DecryptReader(BytesIO(enc), secret_key='example').read(), b'picture')
+        with self.assertRaises(ValueError):
+            crypto_util.DecryptReader(BytesIO(enc)).read()
+
+    def test_tamper_and_truncation_detected(self):
+        enc = bytearray(self._encrypt(os.urandom(3000)))
+        with self.assertRaises(ValueError):
+            b''.join(crypto_util.iter_decrypt(BytesIO(bytes(enc[:-1]))))
+        # 去掉末块：剩余各块本身完整，但缺少末块标记
+        first = len(enc) - (1000 + 16 + 5)
+        with self.assertRaises(ValueError):
+            b''.join(crypto_util.iter_decrypt(BytesIO(bytes(enc[:first]))))
+        enc[40] ^= 1
+        with self.assertRaises(ValueError):
+            b''.join(crypto_util.iter_decrypt(BytesIO(bytes(enc))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import importlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+
+class DatabasePoolTest(unittest.TestCase):
+    def test_connection_reuse_and_transaction(self):
+        with tempfile.TemporaryDirectory() as td:
+            os.environ['HOME'] = td
+            import database
+
+            importlib.reload(database)
+
+            c1 = database.get_config_conn()
+            c2 = database.get_config_conn()
+            self.assertIs(c1, c2)
+            self.assertEqual(c1.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(c1.execute('PRAGMA busy_timeout').fetchone()[0], database.BUSY_TIMEOUT_MS)
+
+            other = []
+            th = threading.Thread(target=lambda: other.append(database.get_config_conn()))
+            th.start()
+            th.join()
+            self.assertIsNot(other[0], c1)
+
+            # close() 只回滚未提交的修改，连接仍可继续使用
+            c1.execute("INSERT INTO settings (key, value) VALUES ('k1', 'v1')")
+            c1.close()
+            self.assertIsNone(database.get_setting('k1'))
+
+            with database.transaction(database.CONFIG_DB_PATH) as conn:
+                conn.execute("INSERT INTO settings (key, value) VALUES ('k2', 'v2')")
+            self.assertEqual(database.get_setting('k2'), 'v2')
+
+            with self.assertRaises(RuntimeError):
+                with database.transaction(database.CONFIG_DB_PATH) as conn:
+                    conn.execute("INSERT INTO settings (key, value) VALUES ('k3', 'v3')")
+                    raise RuntimeError('boom')
+            self.assertIsNone(database.get_setting('k3'))
+
+            # 文件被整体替换（如 rsync 推送）后应自动重连
+            database.close_thread_connections()
+            c3 = database.get_config_conn()
+            tmp = database.CONFIG_DB_PATH + '.tmp'
+            shutil.copy2(database.CONFIG_DB_PATH, tmp)
+            os.replace(tmp, database.CONFIG_DB_PATH)
+            self.assertIsNot(database.get_config_conn(), c3)
+            self.assertEqual(database.get_setting('k2'), 'v2')
+
+            self.assertEqual(database.checkpoint_all(), [])
+            self.assertEqual(os.path.getsize(database.CONFIG_DB_PATH + '-wal'), 0)
+
+            # 有读者持有快照时检查点无法完成，应报告该库而不是静默成功
+            database.set_setting('k4', 'v4')
+            reader = sqlite3.connect(database.CONFIG_DB_PATH)
+            reader.execute('BEGIN')
+            reader.execute('SELECT COUNT(*) FROM settings').fetchone()
+            database.set_setting('k5', 'v5')
+            with mock.patch.object(database, 'BUSY_TIMEOUT_MS', 50), \
+                    mock.patch.object(database, 'CHECKPOINT_RETRY_DELAY', 0):
+                self.assertEqual(database.checkpoint_all(), [database.CONFIG_DB_PATH])
+            reader.close()
+            self.assertEqual(database.checkpoint_all(), [])
+            database.close_thread_connections()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import hashlib
+import importlib
+import os
+import tempfile
+import unittest
+
+
+class FileStoreTest(unittest.TestCase):
+    def test_sharded_store_and_lookup(self):
+        with tempfile.TemporaryDirectory() as td:
+            os.environ['HOME'] = td
+            import database
+            import models
+            import sync
+
+            importlib.reload(database)
+            importlib.reload(models)
+            importlib.reload(sync)
+            database.ensure_db()
+
+            src = os.path.join(td, '资料.pdf')
+            with open(src, 'wb') as f:
+                f.write(b'pdf-bytes')
+            sha1 = hashlib.sha1(b'pdf-bytes').hexdigest()
+            # 默认仍平铺在根目录，旧版本设备按根目录查找也能看到
+            flat = os.path.join(td, 'flat.txt')
+            with open(flat, 'wb') as f:
+                f.write(b'flat')
+            flat_sha1 = models.save_task_file(flat)['sha1']
+            self.assertEqual(models.get_file_path(flat_sha1), os.path.join(database.FILES_DIR, flat_sha1 + '.txt'))
+
+            database.set_setting(database.FILES_SHARDED_SETTING, '1')
+            meta = models.save_task_file(src)
+            self.assertEqual(meta['sha1'], sha1)
+            path = models.get_file_path(sha1)
+            self.assertEqual(path, os.path.join(database.FILES_DIR, sha1[:2], sha1[2:4], sha1 + '.pdf'))
+            self.assertEqual(models.get_file_path(flat_sha1), os.path.join(database.FILES_DIR, flat_sha1 + '.txt'))
+            self.assertEqual(models.save_knowledge_file(src, 1, 'u', '', '')['sha1'], sha1)
+            self.assertEqual(sum(len(files) for _, _, files in os.walk(database.FILES_DIR)), 2)
+
+            # 旧版本平铺在根目录的文件仍能找到
+            legacy = hashlib.sha1(b'legacy').hexdigest()
+            with open(os.path.join(database.FILES_DIR, legacy + '.txt'), 'wb') as f:
+                f.write(b'legacy')
+            self.assertEqual(models.get_file_path(legacy), os.path.join(database.FILES_DIR, legacy + '.txt'))
+            self.assertIsNone(models.get_file_path('0' * 40))
+
+            pulled = os.path.join(td, 'pulled')
+            other = hashlib.sha1(b'other').hexdigest()
+            os.makedirs(os.path.join(pulled, other[:2], other[2:4]))
+            with open(os.path.join(pulled, other[:2], other[2:4], other + '.mp4'), 'wb') as f:
+                f.write(b'other')
+            with open(os.path.join(pulled, sha1 + '.pdf'), 'wb') as f:
+                f.write(b'pdf-bytes')
+            self.assertEqual(sync.merge_pulled_files(pulled), 1)
+            self.assertTrue(models.get_file_path(other).endswith(os.path.join(other[:2], other[2:4], other + '.mp4')))
+
+            models.delete_task_file(sha1)
+            self.assertIsNone(models.get_file_path(sha1))
+            database.close_thread_connections()
+
+    def test_ingest_single_pass_progress_and_abort(self):
+        with tempfile.TemporaryDirectory() as td:
+            import file_store
+
+            store = file_store.FileStore(os.path.join(td, 'files'))
+            data = os.urandom(file_store.INGEST_BUFFER_SIZE * 2 + 123)
+            src = os.path.join(td, 'video.mp4')
+            with open(src, 'wb') as f:
+                f.write(data)
+
+            def abort(done, total):
+                raise RuntimeError("cancelled")
+
+            with self.assertRaises(RuntimeError):
+                store.ingest(src, '.mp4', abort)
+            self.assertEqual(os.listdir(store.root), [file_store.TMP_DIR_NAME])
+            self.assertEqual(os.listdir(os.path.join(store.root, file_store.TMP_DIR_NAME)), [])
+
+            steps = []
+            sha1, path = store.ingest(src, '.mp4', lambda done, total: steps.append((done, total)))
+            self.assertEqual(sha1, hashlib.sha1(data).hexdigest())
+            self.assertEqual(steps[-1], (len(data), len(data)))
+            self.assertEqual(len(steps), 3)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(store.ingest(src, '.mp4'), (sha1, path))
+            self.assertEqual(os.listdir(os.path.join(store.root, file_store.TMP_DIR_NAME)), [])
+
+    def test_ingest_does_not_rebuild_index(self):
+        with tempfile.TemporaryDirectory() as td:
+            import file_store
+
+            for sharded in (False, True):
+                with self.subTest(sharded=sharded):
+                    store = file_store.FileStore(os.path.join(td, f'files-{sharded}'), sharded=sharded)
+                    rebuilds = []
+                    rebuild = store._rebuild
+
+                    def counting_rebuild():
+                        rebuilds.append(1)
+                        rebuild()
+
+                    store._rebuild = counting_rebuild
+                    paths = []
+                    for i in range(5):
+                        src = os.path.join(td, f'{i}.bin')
+                        with open(src, 'wb') as f:
+                            f.write(os.urandom(64))
+                        paths.append(store.ingest(src, '.bin'))
+                        if i == 0:
+                            first = len(rebuilds)
+                    self.assertEqual(len(rebuilds), first)
+                    self.assertLessEqual(first, 1)
+                    for sha1, path in paths:
+                        self.assertEqual(store.lookup(sha1), path)
+                    store.remove(paths[0][0])
+                    self.assertIsNone(store.lookup(paths[0][0]))
+                    self.assertEqual(len(rebuilds), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import importlib
+import json
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+
+class PicCacheTest(unittest.TestCase):
+    def test_get_pic_cached_and_prefetched(self):
+        with tempfile.TemporaryDirectory() as td:
+            os.environ['HOME'] = td
+            import database
+            import models
+            from PIL import Image
+
+            importlib.reload(database)
+            importlib.reload(models)
+            database.ensure_db()
+
+            shas = []
+            for color in ('red', 'blue'):
+                buf = BytesIO()
+                Image.new('RGB', (400, 300), color).save(buf, format='PNG')
+                shas.append(models.save_pic(buf))
+
+            img = models.get_pic(shas[0], max_dim=200)
+            self.assertEqual((img.width(), img.height()), (200, 150))
+            self.assertIs(models.get_pic(shas[0], max_dim=200.0), img)
+            self.assertEqual(models.get_pic(shas[0], max_dim=1080).width(), 400)
+            stats = models.pic_cache_stats()
+            self.assertEqual((stats['hits'], stats['entries']), (1, 2))
+
+            models.prefetch_pics([shas[1]], max_dim=200)
+            models._pic_prefetch_pool.submit(lambda: None).result()
+            self.assertIn((shas[1], 200), models._pic_cache)
+            models.get_pic(shas[1], max_dim=200)
+            self.assertEqual(models.pic_cache_stats()['hits'], 2)
+
+            # 预取前后两题的图片，当前题与坏 JSON 被跳过
+            models.clear_pic_cache()
+            questions = [{'pictures': json.dumps([shas[0]])}, {'pictures': json.dumps([shas[1]])},
+                         {'pictures': 'bad'}]
+            models.prefetch_neighbour_pics(questions, 2, max_dim=100)
+            models.prefetch_neighbour_pics(questions, 1, max_dim=100)
+            models._pic_prefetch_pool.submit(lambda: None).result()
+            self.assertIn((shas[0], 100), models._pic_cache)
+            self.assertNotIn((shas[1], 100), models._pic_cache)
+            self.assertIsNone(models.get_pic('0' * 64))
+
+            # 旧版整文件 AES-CBC 加密的图片仍可读取
+            buf = BytesIO()
+            Image.new('L', (50, 40), 128).save(buf, format='PNG')
+            legacy = models.aes_bytesio(buf, secret_key=models.SECRET_KEY, operation='encrypt')
+            with open(os.path.join(database.RESOURCE_PATH, 'legacy'), 'wb') as f:
+                f.write(legacy.read())
+            self.assertEqual(models.get_pic('legacy').width(), 50)
+            database.close_thread_connections()
+
+    def test_save_pic_variants(self):
+        with tempfile.TemporaryDirectory() as td:
+            os.environ['HOME'] = td
+            import crypto_util
+            import database
+            import models
+            from PIL import Image
+
+            importlib.reload(database)
+            importlib.reload(models)
+            database.ensure_db()
+
+            def stored_format(name):
+                with open(os.path.join(database.RESOURCE_PATH, name), 'rb') as f:
+                    plain = BytesIO(crypto_util.DecryptReader(f, secret_key=models.SECRET_KEY).read())
+                return Image.open(plain).format
+
+            buf = BytesIO()
+            Image.frombytes('RGB', (1600, 1200), os.urandom(1600 * 1200 * 3)).save(buf, format='PNG')
+            photo = models.save_pic(buf)
+            buf = BytesIO()
+            Image.new('RGB', (1600, 1200), 'white').save(buf, format='PNG')
+            diagram = models.save_pic(buf)
+
+            names = set(os.listdir(database.RESOURCE_PATH))
+            for dim in (480, 720, 1080, 1440):
+                self.assertIn(models.pic_variant_name(photo, dim), names)
+            self.assertNotIn(models.pic_variant_name(photo, 1920), names)
+            self.assertEqual(stored_format(photo), 'PNG')
+            self.assertIn(stored_format(models.pic_variant_name(photo, 720)), ('WEBP', 'JPEG'))
+            self.assertEqual(stored_format(models.pic_variant_name(diagram, 720)), 'PNG')
+
+            self.assertTrue(models._pic_source_path(photo, 600).endswith(models.pic_variant_name(photo, 720)))
+            self.assertTrue(models._pic_source_path(photo, 1800).endswith(photo))
+            img = models.get_pic(photo, max_dim=600)
+            self.assertEqual((img.width(), img.height()), (600, 450))
+
+            models.remove_pic(photo)
+            self.assertEqual([n for n in os.listdir(database.RESOURCE_PATH) if n.startswith(photo)], [])
+            self.assertNotIn((photo, 600), models._pic_cache)
+
+            # 编码中途失败不留下看似完整的加密文件
+            class Broken:
+                def save(self, f, format=None, **params):
+                    f.write(b'x' * 100000)
+                    raise OSError('disk full')
+
+            with self.assertRaises(OSError):
+                models._write_pic('broken', Broken(), 'PNG')
+            self.assertEqual([n for n in os.listdir(database.RESOURCE_PATH) if n.startswith('broken')], [])
+            database.close_thread_connections()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,306 @@
+import importlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+
+class ScoresModelsTest(unittest.TestCase):
+    def _reload(self, td):
+        os.environ['HOME'] = td
+        import database
+        import models
+
+        importlib.reload(database)
+        importlib.reload(models)
+        return database, models
+
+    def _make_exam(self, models):
+        models.add_exam('考试A', '描述', 0.6, 30, None)
+        exam_id, exam_uuid = next((e[0], e[6]) for e in models.list_exams(include_expired=True))
+        q1 = models.add_question(exam_uuid, 'single', '题1', ['A', 'B'], ['A'], 2)
+        q2 = models.add_question(exam_uuid, 'fill', '题2', [], ['答案'], 3)
+        return exam_id, exam_uuid, q1, q2
+
+    def test_save_answer_upsert_and_submit(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+
+            a_uuid = models.start_attempt(1, exam_id, 5)
+            models.save_answer(a_uuid, q1, ['B'])
+            models.save_answer(a_uuid, q1, ['A'])
+            models.save_answer(a_uuid, q2, ['答案'])
+
+            conn = database.get_score_conn()
+            cnt = conn.execute('SELECT COUNT(*) FROM attempt_answers WHERE attempt_uuid=?', (a_uuid,)).fetchone()[0]
+            self.assertEqual(cnt, 2)
+            self.assertEqual(models.get_attempt_answers(a_uuid)[q1]['selected'], ['A'])
+
+            total, passed = models.submit_attempt(a_uuid)
+            self.assertEqual(total, 5.0)
+            self.assertEqual(passed, 1)
+            self.assertTrue(models.get_attempt(a_uuid)['valid'])
+
+    def test_save_answers_batch_coalesces(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+
+            a_uuid = models.start_attempt(1, exam_id, 5)
+            self.assertEqual(models.save_answers(a_uuid, []), 0)
+            models.save_answers(a_uuid, [(q1, ['B'], False), (q2, ['草稿'], False)])
+            self.assertEqual(models.save_answers(a_uuid, [(q1, ['A'], False), (q2, ['答案'], True)]), 2)
+
+            answers = models.get_attempt_answers(a_uuid)
+            self.assertEqual(answers[q1]['selected'], ['A'])
+            self.assertEqual(answers[q2]['selected'], ['答案'])
+            self.assertEqual(models.submit_attempt(a_uuid), (5.0, 1))
+
+    def test_submit_attempt_with_missing_exam(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            a_uuid = models.start_attempt(1, 9999, 5)
+            self.assertEqual(models.submit_attempt(a_uuid), (0.0, 0))
+            attempt = models.get_attempt(a_uuid)
+            self.assertIsNotNone(attempt['submitted_at'])
+            self.assertEqual(attempt['score'], 0.0)
+            self.assertTrue(attempt['valid'])
+
+    def test_regrade_exam_after_answer_key_fix(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+
+            uuids = []
+            for sel in (['A'], ['B'], ['B']):
+                a_uuid = models.start_attempt(1, exam_id, 5)
+                models.save_answer(a_uuid, q1, sel)
+                models.submit_attempt(a_uuid)
+                uuids.append(a_uuid)
+            unsubmitted = models.start_attempt(1, exam_id, 5)
+            self.assertEqual([models.get_attempt(u)['score'] for u in uuids], [2.0, 0.0, 0.0])
+
+            models.update_question(q1, 'single', '题1', ['A', 'B'], ['B'], 2)
+            self.assertEqual(models.regrade_exam(exam_id), 3)
+            attempts = [models.get_attempt(u) for u in uuids]
+            self.assertEqual([a['score'] for a in attempts], [0.0, 2.0, 2.0])
+            self.assertTrue(all(a['valid'] for a in attempts))
+            self.assertIsNone(models.get_attempt(unsubmitted)['submitted_at'])
+            self.assertEqual(models.recalculate_attempt_score(uuids[1]), (2.0, 0))
+
+    def test_merge_remote_scores_db_only_new_attempts(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+
+            shared = models.start_attempt(1, exam_id, 5)
+            models.save_answers(shared, [(q1, ['A'], False), (q2, ['答案'], False)])
+            models.submit_attempt(shared)
+            database.checkpoint_all()
+            remote_path = os.path.join(td, 'remote_scores.db')
+            shutil.copy2(database.SCORES_DB_PATH, remote_path)
+
+            rconn = sqlite3.connect(remote_path)
+            rconn.execute("INSERT INTO attempts (uuid, user_id, exam_id, started_at, score, passed, total_score) "
+                          "VALUES ('remote-1', 2, ?, '2026-01-01T00:00:00', 0, 0, 5)", (exam_id,))
+            rconn.executemany("INSERT INTO attempt_answers (attempt_uuid, question_id, selected) VALUES ('remote-1', ?, ?)",
+                              [(q1, 'x'), (q2, 'y')])
+            rconn.commit()
+            rconn.close()
+
+            self.assertEqual(models.merge_remote_scores_db(remote_path), (1, 2))
+            self.assertEqual(models.merge_remote_scores_db(remote_path), (0, 0))
+            conn = database.get_score_conn()
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM attempts').fetchone()[0], 2)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM attempt_answers').fetchone()[0], 4)
+            self.assertEqual(conn.execute('PRAGMA database_list').fetchall()[-1][1], 'main')
+
+    def test_merge_remote_scores_dbs_dedupes_across_devices(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+            models.start_attempt(1, exam_id, 5)
+            database.checkpoint_all()
+
+            paths = []
+            for dev, uuids in (('d1', ['r1', 'shared']), ('d2', ['shared', 'r2'])):
+                rp = os.path.join(td, f'{dev}.db')
+                shutil.copy2(database.SCORES_DB_PATH, rp)
+                rconn = sqlite3.connect(rp)
+                for u in uuids:
+                    rconn.execute("INSERT INTO attempts (uuid, user_id, exam_id, started_at) VALUES (?, 2, ?, '2026-01-01')", (u, exam_id))
+                    rconn.execute('INSERT INTO attempt_answers (attempt_uuid, question_id, selected) VALUES (?, ?, ?)', (u, q1, dev))
+                rconn.commit()
+                rconn.close()
+                paths.append(rp)
+            broken = os.path.join(td, 'broken.db')
+            with open(broken, 'wb') as f:
+                f.write(b'not a database')
+
+            attempts, answers, errors = models.merge_remote_scores_dbs(paths + [broken])
+            self.assertEqual((attempts, answers), (3, 3))
+            self.assertEqual(list(errors), [broken])
+            conn = database.get_score_conn()
+            self.assertEqual(conn.execute("SELECT selected FROM attempt_answers WHERE attempt_uuid='shared'").fetchone()[0], 'd1')
+            self.assertEqual(models.merge_remote_scores_dbs(paths)[:2], (0, 0))
+            self.assertEqual(models.pulled_db_digest(paths[0]), models.pulled_db_digest(paths[0]))
+
+    def test_change_log_incremental_merge(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+            models.start_attempt(1, exam_id, 5)
+            models.create_user('alice', 'pw')
+            database.checkpoint_all()
+            log_id, seq = database.change_log_state(database.SCORES_DB_PATH)
+            self.assertTrue(log_id)
+            self.assertGreater(seq, 0)
+
+            remote = os.path.join(td, 'remote_scores.db')
+            remote_users = os.path.join(td, 'remote_users.db')
+            shutil.copy2(database.SCORES_DB_PATH, remote)
+            shutil.copy2(database.USERS_DB_PATH, remote_users)
+            rconn = sqlite3.connect(remote)
+            rconn.execute("INSERT INTO attempts (uuid, user_id, exam_id, started_at) VALUES ('r1', 2, ?, '2026-01-01')", (exam_id,))
+            rconn.commit()
+            self.assertEqual(database.change_log_state(remote), (log_id, seq + 1))
+            self.assertEqual(models.merge_remote_scores_dbs([remote], since={remote: seq})[:2], (1, 0))
+
+            # 水位之后只看新变更：本地删掉的 r1 不会被再次导入
+            mark = database.change_log_state(remote)[1]
+            with database.transaction(database.SCORES_DB_PATH) as conn:
+                conn.execute("DELETE FROM attempts WHERE uuid='r1'")
+            rconn.execute("INSERT INTO attempts (uuid, user_id, exam_id, started_at) VALUES ('r2', 2, ?, '2026-01-02')", (exam_id,))
+            rconn.commit()
+            rconn.close()
+            self.assertEqual(models.merge_remote_scores_dbs([remote], since={remote: mark})[:2], (1, 0))
+            self.assertEqual(models.merge_remote_scores_dbs([remote])[:2], (1, 0))
+
+            uconn = sqlite3.connect(remote_users)
+            umark = database.change_log_state(remote_users)[1]
+            uconn.execute("UPDATE users SET full_name='Alice', edit_at='9999999999' WHERE username='alice'")
+            uconn.commit()
+            uconn.close()
+            models.merge_user_databases(remote_users, since=umark)
+            names = dict(database.get_user_conn().execute('SELECT username, full_name FROM users').fetchall())
+            self.assertEqual(names['alice'], 'Alice')
+
+            database.set_sync_marks('dev', {'scores.db': (log_id, 7), 'exams.db': (None, 3)})
+            self.assertEqual(database.get_sync_mark('dev', 'scores.db', log_id), 7)
+            self.assertEqual(database.get_sync_mark('dev', 'scores.db', 'other'), 0)
+            self.assertEqual(database.get_sync_mark('dev', 'exams.db', None), 0)
+
+    def test_change_log_coalesce_and_compact(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+            a_uuid = models.start_attempt(1, exam_id, 5)
+            for sel in (['A'], ['B'], ['A']):
+                models.save_answers(a_uuid, [(q1, sel, False), (q2, ['草稿'], False)])
+            conn = database.get_score_conn()
+            rows = conn.execute('SELECT tbl, COUNT(*) FROM change_log GROUP BY tbl').fetchall()
+            # 反复保存同一题只留下最新一条
+            self.assertEqual(dict(rows), {'attempts': 1, 'attempt_answers': 2})
+
+            log_id, seq = database.change_log_state(database.SCORES_DB_PATH)
+            self.assertEqual(database.compact_change_log(database.SCORES_DB_PATH), 0)
+            database.set_sync_marks('a', {'scores.db': (log_id, seq)})
+            database.set_sync_marks('b', {'scores.db': (log_id, seq - 1)})
+            database.set_sync_marks('c', {'scores.db': ('other', 1)})
+            self.assertEqual(database.compact_change_log(database.SCORES_DB_PATH), 2)
+            self.assertEqual(conn.execute('SELECT MAX(seq) FROM change_log').fetchone()[0], seq)
+            database.set_sync_marks('b', {'scores.db': (log_id, seq)})
+            self.assertEqual(database.compact_change_log(database.SCORES_DB_PATH), 1)
+            # 日志清空后水位不回退
+            self.assertEqual(database.change_log_state(database.SCORES_DB_PATH), (log_id, seq))
+            models.save_answers(a_uuid, [(q1, ['B'], False)])
+            self.assertEqual(database.change_log_state(database.SCORES_DB_PATH), (log_id, seq + 1))
+
+    def test_deleted_sync_target_does_not_pin_change_log(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+            a_uuid = models.start_attempt(1, exam_id, 5)
+            models.save_answers(a_uuid, [(q1, ['A'], False)])
+            log_id, seq = database.change_log_state(database.SCORES_DB_PATH)
+
+            models.upsert_sync_target('旧设备', '10.0.0.8', 'u', '/srv/exam')
+            target_id = models.list_sync_targets()[0][0]
+            old_key = database.push_target_key('10.0.0.8', 'u', '/srv/exam')
+            database.set_sync_marks(old_key, {'scores.db': (log_id, 1)})
+            database.set_sync_marks('live', {'scores.db': (log_id, seq)})
+            database.compact_change_log(database.SCORES_DB_PATH)
+            conn = database.get_score_conn()
+            self.assertGreater(conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0], 0)
+
+            models.delete_sync_target(target_id)
+            self.assertEqual(database.get_sync_mark(old_key, 'scores.db', log_id), 0)
+            self.assertGreater(database.compact_change_log(database.SCORES_DB_PATH), 0)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0], 0)
+
+    def test_question_bank_cache_invalidation(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+
+            qs = models.list_questions(exam_uuid)
+            self.assertEqual([q['text'] for q in qs], ['题1', '题2'])
+            qs[0]['options'].append('C')
+            self.assertIs(models.get_question_bank(exam_uuid), models.get_question_bank(exam_uuid))
+            self.assertEqual(models.list_questions(exam_uuid)[0]['options'], ['A', 'B'])
+
+            models.update_question(q1, 'single', '题1改', ['A', 'B'], ['B'], 2, pool='random')
+            self.assertEqual(models.list_questions(exam_uuid)[0]['text'], '题1改')
+            self.assertEqual([q['id'] for q in models.list_questions_by_pool(exam_uuid, 'random')], [q1])
+            self.assertEqual([q['id'] for q in models.list_questions_by_pool(exam_uuid, 'mandatory')], [q2])
+
+            models.delete_question(q2)
+            self.assertEqual([q['id'] for q in models.list_questions(exam_uuid)], [q1])
+            models.import_questions_from_json(exam_uuid, [{'type': 'truefalse', 'text': '题3', 'correct': [True]}])
+            self.assertEqual(len(models.list_questions(exam_uuid)), 2)
+            models.clear_exam_questions(exam_uuid)
+            self.assertEqual(models.list_questions(exam_uuid), [])
+
+    def test_import_questions_batch_progress(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            exam_id, exam_uuid, q1, q2 = self._make_exam(models)
+
+            payload = [{'type': 'fill', 'text': f'题{i}', 'correct': ['x'], 'pool': 'random'} for i in range(1200)]
+            steps = []
+            self.assertEqual(models.import_questions_from_json(exam_uuid, payload, progress=lambda d, t: steps.append((d, t))), 1200)
+            self.assertEqual(steps, [(500, 1200), (1000, 1200), (1200, 1200)])
+            self.assertEqual(len(models.list_questions_by_pool(exam_uuid, 'random')), 1200)
+            self.assertEqual(models.list_questions(exam_uuid)[-1]['text'], '题1199')
+
+    def test_secondary_index_migration_dedupes_answers(self):
+        with tempfile.TemporaryDirectory() as td:
+            database, models = self._reload(td)
+            os.makedirs(database.DB_DIR, exist_ok=True)
+            conn = sqlite3.connect(database.SCORES_DB_PATH)
+            conn.execute('CREATE TABLE attempt_answers (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'attempt_uuid TEXT, question_id INTEGER, selected TEXT, cheat INTEGER DEFAULT 0)')
+            conn.execute('CREATE TABLE attempts (id INTEGER PRIMARY KEY AUTOINCREMENT, uuid TEXT UNIQUE, '
+                         'user_id INTEGER, exam_id INTEGER)')
+            conn.executemany('INSERT INTO attempt_answers (attempt_uuid, question_id, selected) VALUES (?,?,?)',
+                             [('a', 1, 'old'), ('a', 1, 'new'), ('a', 2, 'x')])
+            conn.commit()
+            conn.close()
+
+            from db_iter_conf import secondary_index_migration
+            importlib.reload(secondary_index_migration)
+            secondary_index_migration.secondary_index_migrate(None)
+
+            conn = sqlite3.connect(database.SCORES_DB_PATH)
+            rows = conn.execute('SELECT question_id, selected FROM attempt_answers ORDER BY question_id').fetchall()
+            names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+            conn.close()
+            self.assertEqual(rows, [(1, 'new'), (2, 'x')])
+            self.assertIn('idx_attempt_answers_attempt_question', names)
+            self.assertIn('idx_attempts_exam', names)
+
+
+if __name__ == '__main__':
+    unittest.main()
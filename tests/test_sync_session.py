@@ -0,0 +1,376 @@
+import importlib
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import sync
+
+
+class SshSessionTest(unittest.TestCase):
+    def test_unreachable_target_skips_ssh(self):
+        session = sync.SshSession('10.0.0.9:2222', 'u', '~/exam')
+        with mock.patch.object(sync, '_is_port_open', return_value=False) as probe, \
+                mock.patch.object(subprocess, 'run') as run:
+            session.open()
+            self.assertEqual(session.pull_file('/tmp/unused', 'scores.db')[0], 1)
+            self.assertEqual(session.push()[0], 1)
+        run.assert_not_called()
+        self.assertEqual(probe.call_count, 1)
+        self.assertEqual((session.ip_addr, session.port), ('10.0.0.9', '2222'))
+
+    def test_remote_dir_and_flavour_probed_once(self):
+        session = sync.SshSession('10.0.0.9', 'u', '~/exam')
+        calls = []
+
+        def fake_run(remote_cmd):
+            calls.append(remote_cmd)
+            return subprocess.CompletedProcess([], 0, stdout='/home/u\n', stderr='')
+
+        session.run = fake_run
+        self.assertEqual(session.remote_dir, '/home/u/exam')
+        self.assertEqual(session.remote_dir, '/home/u/exam')
+        self.assertEqual(session.flavour, 'posix')
+        self.assertEqual(calls, ['pwd'])
+        self.assertFalse(session.file_exists('/home/u/exam/scores.db'))
+        self.assertEqual(calls[-1], "test -f /home/u/exam/scores.db && echo 'exists' || echo 'not found'")
+
+    def test_pull_bundle_snapshots_databases_in_use(self):
+        session = sync.SshSession('10.0.0.9', 'u', '/srv/exam')
+        session._reachable = True
+        session._flavour = 'posix'
+        commands = []
+
+        def fake_run(cmd):
+            commands.append(cmd)
+            if cmd.startswith('ls -1a'):
+                out = '.\n..\nscores.db\nscores.db-wal\nexams.db\nfiles\n'
+            elif '.backup' in cmd:
+                out = 'snap:scores.db\n'
+            else:
+                out = ''
+            return subprocess.CompletedProcess([], 0, stdout=out, stderr='')
+
+        session.run = fake_run
+        rsync_calls = []
+        session.rsync = lambda args: rsync_calls.append(args) or (0, 'ok', '')
+        with tempfile.TemporaryDirectory() as td:
+            open(os.path.join(td, 'scores.db-shm'), 'w').close()
+            status = session.pull_bundle(td, ['scores.db', 'exams.db', 'users.db', 'files'])
+            self.assertFalse(os.path.exists(os.path.join(td, 'scores.db-shm')))
+        # 正在使用的库只在远端做快照，不再分别复制主库与 -wal
+        self.assertIn('for n in scores.db;', commands[1])
+        self.assertEqual(len(rsync_calls), 2)
+        live, snap = rsync_calls
+        self.assertEqual(live[-2:], ['u@10.0.0.9:/srv/exam/', td])
+        self.assertIn('exams.db', live)
+        self.assertIn('files/**', live)
+        self.assertNotIn('scores.db', live)
+        self.assertNotIn('scores.db-wal', live + snap)
+        self.assertEqual(snap[-2:], ['u@10.0.0.9:/srv/exam/.tmp/snap/', td])
+        self.assertIn('scores.db', snap)
+        self.assertEqual(commands[-1], 'rm -f /srv/exam/.tmp/snap/scores.db')
+        self.assertEqual(status['scores.db'], (0, 'ok', ''))
+        self.assertEqual(status['files'], (0, 'ok', ''))
+        self.assertEqual(status['users.db'][0], 1)
+
+        # 远端既没有 sqlite3 也没有 python 时不拉取不一致的文件
+        session.run = lambda cmd: subprocess.CompletedProcess(
+            [], 0, stdout='scores.db\nscores.db-wal\n' if cmd.startswith('ls') else 'busy:scores.db\n', stderr='')
+        rsync_calls.clear()
+        with tempfile.TemporaryDirectory() as td:
+            status = session.pull_bundle(td, ['scores.db'])
+        self.assertEqual(status['scores.db'][0], 1)
+        self.assertEqual(rsync_calls, [])
+
+    def test_scheduler_retries_and_subnet_limit(self):
+        scheduler = sync.SyncScheduler(max_workers=8, subnet_workers=2, retries=2, backoff=0)
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+        calls = {}
+
+        def job(t):
+            net = sync._subnet_of(t[2])
+            with lock:
+                calls[t[2]] = calls.get(t[2], 0) + 1
+                active[net] = active.get(net, 0) + 1
+                peak[net] = max(peak.get(net, 0), active[net])
+            time.sleep(0.02)
+            with lock:
+                active[net] -= 1
+            if t[2] == '10.0.1.9':
+                raise OSError('unreachable')
+            return 0
+
+        targets = [(i, f'd{i}', f'10.0.{i % 2}.{i}') for i in range(8)] + [(9, 'dead', '10.0.1.9')]
+        results = {t[2]: (res, tries) for t, res, elapsed, tries in scheduler.run(targets, job, should_retry=lambda r: r != 0)}
+        self.assertEqual(len(results), 9)
+        self.assertIsInstance(results['10.0.1.9'][0], OSError)
+        self.assertEqual(results['10.0.1.9'][1], 3)
+        self.assertEqual(calls['10.0.1.9'], 3)
+        self.assertEqual(results['10.0.0.2'], (0, 1))
+        self.assertLessEqual(max(peak.values()), 2)
+
+    def test_scheduler_releases_worker_connections(self):
+        # 每个目标执行完后都在其池线程内释放线程连接
+        scheduler = sync.SyncScheduler(max_workers=4, subnet_workers=4, retries=1, backoff=0)
+        used = []
+        closed = []
+
+        def job(t):
+            used.append(threading.get_ident())
+            raise OSError('boom')
+
+        with mock.patch.object(sync, 'close_thread_connections', side_effect=lambda: closed.append(threading.get_ident())):
+            results = list(scheduler.run([(i, f'd{i}', f'10.0.0.{i}') for i in range(3)], job))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(closed), 3)
+        self.assertLessEqual(set(used), set(closed))
+
+    def test_adaptive_limit_ignores_fast_failures(self):
+        limit = sync._AdaptiveLimit(4)
+        for _ in range(3):
+            limit.acquire()
+            limit.release(True, 1.0)
+        # 离线或拒绝连接很快失败，不应拖低健康设备的并发
+        for _ in range(10):
+            limit.acquire()
+            limit.release(False, 0.01)
+        self.assertEqual(limit.limit, 4)
+        limit.acquire()
+        limit.release(False, 5.0)
+        self.assertEqual(limit.limit, 3)
+        limit.acquire()
+        limit.release(False, 0.01, timed_out=True)
+        self.assertEqual(limit.limit, 2)
+        limit.acquire()
+        limit.release(True, 1.0)
+        self.assertEqual(limit.limit, 3)
+
+    def test_scan_reachability_probes_all_targets_at_once(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        closed_port = closed.getsockname()[1]
+        closed.close()
+        try:
+            open_ip = f'127.0.0.1:{server.getsockname()[1]}'
+            targets = [(1, 'a', open_ip), (2, 'b', f'127.0.0.1:{closed_port}'), (3, 'c', open_ip)]
+            start = time.monotonic()
+            reach = sync.scan_reachability(targets, timeout=1)
+            self.assertLess(time.monotonic() - start, 1.5)
+        finally:
+            server.close()
+        self.assertEqual(reach, {open_ip: True, f'127.0.0.1:{closed_port}': False})
+        self.assertIs(sync.get_local_ip(), sync.get_local_ip())
+
+    def test_delta_push_skips_unchanged_artifacts(self):
+        with tempfile.TemporaryDirectory() as td:
+            os.environ['HOME'] = td
+            import database
+            import models
+            importlib.reload(database)
+            importlib.reload(models)
+            importlib.reload(sync)
+            database.ensure_db()
+
+            session = sync.SshSession('10.0.0.9', 'u', '/srv/exam')
+            session._reachable = True
+            session._flavour = 'posix'
+            remote_in_use = set()
+            commands = []
+
+            def fake_run(cmd):
+                commands.append(cmd)
+                out = ''
+                if cmd.startswith('ls -1a'):
+                    out = '\n'.join(n + '-wal' for n in remote_in_use)
+                elif 'mv -f' in cmd:
+                    names = cmd.split('for n in ', 1)[1].split('; do', 1)[0].split()
+                    out = '\n'.join(('busy:' if n in remote_in_use else 'ok:') + n for n in names)
+                return subprocess.CompletedProcess([], 0, stdout=out, stderr='')
+
+            session.run = fake_run
+            rsync_calls = []
+            session.rsync = lambda args: rsync_calls.append(args) or (0, '', '')
+
+            def push(**kwargs):
+                count = len(rsync_calls)
+                result = session.push(**kwargs)
+                return result, [os.path.basename(a) for args in rsync_calls[count:] for a in args[:-1]]
+
+            result, sent = push()
+            self.assertEqual(result[0], 0)
+            self.assertIn('exams.db', sent)
+            self.assertIn('config.db', sent)
+            # 库文件先传到远端 .tmp/ 再改名替换，不直接覆盖正式库
+            self.assertEqual(rsync_calls[0][-1], 'u@10.0.0.9:/srv/exam/.tmp/')
+            self.assertNotIn('exams.db', [os.path.basename(a) for a in rsync_calls[1][:-1]])
+            # 推送后远端 scores.db 即本地副本，水位同步为本地当前序号
+            log_id, seq = database.change_log_state(database.SCORES_DB_PATH)
+            self.assertEqual(database.get_sync_mark(session.target_key, 'scores.db', log_id), seq)
+            self.assertEqual(push(), ((0, 'Up to date', ''), []))
+
+            models.add_exam('考试A', '描述', 0.6, 30, None)
+            self.assertEqual(push()[1], ['exams.db'])
+            self.assertTrue(any('mv -f ".tmp/$n" "$n"' in c for c in commands))
+
+            # 远端库正在使用（存在 -wal）时不替换，也不更新版本号，下次推送重新发送
+            models.add_exam('考试C', '描述', 0.6, 30, None)
+            database.set_setting('k', 'v')
+            with open(database.DB_VERFILE_PATH, 'w') as f:
+                f.write('1')
+            remote_in_use.add('exams.db')
+            result, sent = push()
+            self.assertEqual(result[0], 1)
+            self.assertIn('exams.db', result[2])
+            self.assertEqual(sent, ['config.db'])
+            remote_in_use.clear()
+            self.assertEqual(push()[1], ['exams.db', '.db_version'])
+            result, sent = push(delta=False)
+            self.assertIn('scores.db', sent)
+            pushed = rsync_calls
+
+            # 检查点被阻塞时不推送可能缺少提交的库文件
+            count = len(pushed)
+            models.add_exam('考试B', '描述', 0.6, 30, None)
+            with mock.patch.object(sync, 'checkpoint_all', return_value=[database.EXAMS_DB_PATH]):
+                code, out, err = session.push()
+            self.assertEqual(code, 1)
+            self.assertIn('exams.db', err)
+            self.assertEqual(len(pushed), count)
+
+            # 多个目标共用一次检查点与 config.db 摘要
+            other = sync.SshSession('10.0.0.10', 'u', '/srv/exam')
+            other._reachable = True
+            other._flavour = 'posix'
+            other.run = session.run
+            other.rsync = session.rsync
+            with mock.patch.object(sync, 'checkpoint_all', return_value=[]) as cp, \
+                    mock.patch.object(sync, '_config_digest', wraps=sync._config_digest) as digest:
+                prepared = sync.prepare_push()
+                self.assertEqual(session.push(prepared=prepared)[0], 0)
+                self.assertEqual(other.push(prepared=prepared)[0], 0)
+            self.assertEqual(cp.call_count, 1)
+            self.assertEqual(digest.call_count, 1)
+            database.close_thread_connections()
+
+    def test_worker_sessions_keyed_by_target(self):
+        from views.admin_modules import sync_module
+
+        opened = []
+
+        class FakeSession:
+            def __init__(self, ip, username, remote_dir, ssh_password=None, reachable=None):
+                self.remote_dir = remote_dir
+
+            def open(self):
+                time.sleep(0.05)
+                opened.append(self)
+
+            def close(self):
+                pass
+
+        worker = sync_module.SyncWorker([])
+        a = (1, 'a', '10.0.0.9', 'u', '/srv/a')
+        b = (2, 'b', '10.0.0.9', 'u', '/srv/b')
+        with mock.patch.object(sync_module, 'SshSession', FakeSession):
+            self.assertEqual(worker._session(a).remote_dir, '/srv/a')
+            self.assertEqual(worker._session(b).remote_dir, '/srv/b')
+            got = []
+            threads = [threading.Thread(target=lambda: got.append(worker._session((3, 'c', '10.0.0.7', 'u', '/srv/c'))))
+                       for _ in range(4)]
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+        self.assertEqual(len({id(x) for x in got}), 1)
+        self.assertEqual(len(opened), 3)
+        worker._drop_session(a)
+        self.assertIs(worker._session(b), opened[1])
+        worker._close_sessions()
+
+    def test_merge_skips_local_db_with_busy_checkpoint(self):
+        with tempfile.TemporaryDirectory() as td:
+            os.environ['HOME'] = td
+            import database
+            import models
+            importlib.reload(database)
+            importlib.reload(models)
+            importlib.reload(sync)
+            from views.admin_modules import sync_module
+            importlib.reload(sync_module)
+            database.ensure_db()
+            database.checkpoint_all()
+            remote = os.path.join(td, 'users.db')
+            shutil.copy2(database.USERS_DB_PATH, remote)
+            rconn = sqlite3.connect(remote)
+            rconn.execute("INSERT INTO users (username, password_hash, role, edit_at) VALUES ('remote', 'x', 'user', '9999999999')")
+            rconn.commit()
+            rconn.close()
+
+            worker = sync_module.SyncWorker([])
+            t = (1, 'a', '10.0.0.9', 'u', '/srv/a')
+
+            def usernames():
+                return [r[0] for r in database.get_user_conn().execute('SELECT username FROM users')]
+
+            results = []
+            with mock.patch.object(sync_module, 'checkpoint_all', return_value=[database.USERS_DB_PATH]):
+                worker._merge_pulled([(t, [('users', remote)])], results, count_steps=False)
+            self.assertNotIn('remote', usernames())
+            self.assertTrue(any('users' in r and '跳过' in r for r in results))
+            self.assertEqual(database.get_sync_mark(worker._mark_target(t), 'users.db', database.change_log_state(remote)[0]), 0)
+
+            worker._merge_pulled([(t, [('users', remote)])], [], count_steps=False)
+            self.assertIn('remote', usernames())
+            database.close_thread_connections()
+
+    def test_bundle_roundtrip(self):
+        with tempfile.TemporaryDirectory() as td:
+            os.environ['HOME'] = td
+            import database
+            import models
+            importlib.reload(database)
+            importlib.reload(models)
+            importlib.reload(sync)
+            database.ensure_db()
+            models.create_user('alice', 'pw')
+            _, seq = database.change_log_state(database.USERS_DB_PATH)
+            models.create_user('bob', 'pw')
+            for name in ('a.txt', 'b.txt'):
+                with open(os.path.join(database.FILES_DIR, name), 'w') as f:
+                    f.write('same')
+
+            out = os.path.join(td, 'x' + sync.BUNDLE_SUFFIX)
+            manifest = sync.build_bundle(out, since={'users.db': seq})
+            self.assertEqual(len(set(manifest['files'].values())), 1)
+            self.assertNotIn('admin.db', manifest['dbs'])
+            dest = os.path.join(td, 'unpacked')
+            sync.unpack_bundle(out, dest)
+            conn = sqlite3.connect(os.path.join(dest, 'users.db'))
+            self.assertEqual([r[0] for r in conn.execute('SELECT username FROM users')], ['bob'])
+            conn.close()
+            self.assertEqual(sorted(os.listdir(os.path.join(dest, 'files'))), ['a.txt', 'b.txt'])
+
+            with open(out, 'rb') as f:
+                data = bytearray(f.read())
+            data[-10] ^= 1
+            with open(out, 'wb') as f:
+                f.write(data)
+            with self.assertRaises(ValueError):
+                sync.unpack_bundle(out, os.path.join(td, 'bad'))
+            database.close_thread_connections()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,15 @@
 import os
 import json
 import pathlib
+import zipfile
 from io import BytesIO
-from PySide6.QtCore import Qt, QDateTime
+from PySide6.QtCore import Qt, QDateTime, QThread, Signal
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QGroupBox, QFormLayout, QLineEdit,
     QTextEdit, QSpinBox, QDoubleSpinBox, QDateTimeEdit, QPushButton,
     QFileDialog, QTableWidget, QTableWidgetItem, QAbstractItemView,
     QCheckBox, QComboBox, QStackedWidget, QListWidget, QListWidgetItem,
-    QScrollArea, QLabel
+    QScrollArea, QLabel, QProgressDialog
 )
 from PySide6.QtWidgets import QMessageBox
 from PySide6.QtGui import QPixmap
@@ -16,6 +17,7 @@ from icon_manager import IconManager
 from theme_manager import theme_manager
 from language import tr
 from utils import show_info, show_warn, ask_yes_no
+from database import close_thread_connections
 from models import (
     list_exams, add_exam, import_questions_from_json, get_exam_stats,
     update_exam_title_desc, save_pic, update_question, delete_question,
@@ -782,6 +784,240 @@ class QuestionPage(QWidget):
             self.owner.back_to_exams()
 
 
+QUESTION_TYPE_ALIASES = {
+    '单选': 'single', 'single': 'single',
+    '多选': 'multiple', 'multiple': 'multiple',
+    '判断': 'truefalse', '判断题': 'truefalse', 'truefalse': 'truefalse',
+    '填空': 'fill', 'fill': 'fill',
+    '简答': 'essay', 'essay': 'essay',
+}
+
+
+def workbook_has_images(fn):
+    """xlsx 中不含 drawing 时可用只读模式流式解析"""
+    try:
+        with zipfile.ZipFile(fn) as zf:
+            return any(n.startswith('xl/drawings/') or n.startswith('xl/media/') for n in zf.namelist())
+    except Exception:
+        return True
+
+
+def parse_question_sheet(ws, progress=None):
+    """解析题库工作表，返回题目字典列表；progress(count) 每解析若干行回调一次"""
+    rows = ws.iter_rows(min_row=1, values_only=True)
+    header_row = next(rows, None)
+    if not header_row:
+        return []
+    header = [str(x).strip() if x else '' for x in header_row]
+
+    def idx(name):
+        try:
+            return header.index(name)
+        except Exception:
+            return -1
+
+    itype = idx('类型')
+    icontent = idx('内容')
+    icorrect = idx('正确答案')
+    iscore = idx('分数')
+    start_opts = None
+    for i, h in enumerate(header):
+        if h.startswith('选项'):
+            start_opts = i
+            break
+    base_cols = [x for x in (itype, icontent, icorrect, iscore) if x >= 0]
+    if min(itype, icontent, icorrect) < 0:
+        return []
+    if start_opts is None:
+        start_opts = (max(base_cols) + 1) if base_cols else 3
+
+    # 只读模式下工作表没有 _images
+    img_dic = {}
+    for image in getattr(ws, '_images', []):
+        col = image.anchor._from.col
+        row = image.anchor._from.row
+        img_io = BytesIO(image._data())
+        img_dic[row] = {col: img_io}
+
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    data_local = []
+    for ridx, row in enumerate(rows):
+        if progress is not None and ridx % 200 == 0:
+            progress(ridx)
+        if row is None or len(row) <= max(itype, icontent, icorrect):
+            continue
+        tval = (str(row[itype]).strip().lower() if row[itype] is not None else '')
+        qtype = QUESTION_TYPE_ALIASES.get(tval)
+        if qtype is None:
+            continue
+        text = (str(row[icontent]).strip() if row[icontent] is not None else '')
+        if not text:
+            continue
+        correct_cell = (str(row[icorrect]).strip() if row[icorrect] is not None else '')
+        correct = []
+        if qtype == 'truefalse':
+            lc = correct_cell.lower()
+            if lc in ('true', 'false'):
+                correct = [True] if lc == 'true' else [False]
+            else:
+                continue
+        else:
+            parts = [p.strip().upper() for p in correct_cell.replace('，', ',').replace(';', ',').split(',') if p.strip()]
+            correct = parts[:1] if qtype == 'single' else parts
+        options = []
+        if qtype != 'truefalse':
+            cidx = start_opts
+            key_index = 0
+            while cidx < len(row):
+                val = row[cidx]
+                if val is None or str(val).strip() == '':
+                    break
+                key = letters[key_index] if key_index < len(letters) else str(key_index + 1)
+                options.append({'key': key, 'text': str(val).strip()})
+                cidx += 1
+                key_index += 1
+            if not options and qtype not in ('truefalse', 'fill', 'essay'):
+                continue
+        sc = 1.0
+        if iscore >= 0 and iscore < len(row):
+            try:
+                v = row[iscore]
+                if v is not None and str(v).strip() != '':
+                    sc = float(str(v).strip())
+            except Exception:
+                sc = 1.0
+        pic_group = img_dic.get(ridx + 1, None)
+        pic_hash_list = []
+        if isinstance(pic_group, dict):
+            pic_list = [v for k, v in sorted(pic_group.items())]
+            for pic in pic_list:
+                hash_str = save_pic(pic)
+                if hash_str:
+                    pic_hash_list.append(hash_str)
+        pic_hash_list_str = json.dumps(pic_hash_list, ensure_ascii=False)
+        item = {'type': qtype, 'text': text, 'score': sc, 'options': options, 'correct': correct, 'pictures': pic_hash_list_str}
+        data_local.append(item)
+    return data_local
+
+
+def validate_questions(lst, pool_name, valid, errs):
+    """校验并规范化题目，合格的追加到 valid，错误信息追加到 errs"""
+    for idx, q in enumerate(lst, start=1):
+        t = (q.get('type') or '').strip().lower()
+        if t not in ('single','multiple','truefalse','fill','essay'):
+            errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.invalid_type")}')
+            continue
+        corr = q.get('correct') or []
+        if t in ('single','multiple'):
+            opts = q.get('options') or []
+            keys = {str(o.get('key')).strip().upper() for o in opts if o.get('key')}
+            if not keys:
+                errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.missing_options")}')
+                continue
+            corr = [str(x).strip().upper() for x in corr if str(x).strip() != '']
+            if not corr or not set(corr).issubset(keys):
+                errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.invalid_correct")}')
+                continue
+            if t == 'single' and len(corr) != 1:
+                errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.single_need_one")}')
+                continue
+            q['correct'] = corr
+        elif t == 'fill':
+            # 填空题：验证正确答案不为空
+            if not corr or not any(str(c).strip() for c in corr):
+                errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.invalid_correct")}')
+                continue
+            q['correct'] = [str(c).strip() for c in corr if str(c).strip()]
+        elif t == 'essay':
+            # 简答题：无预设正确答案，correct留空
+            q['correct'] = []
+        else:
+            if not corr or len(corr) != 1 or not isinstance(corr[0], bool):
+                errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.tf_need_one")}')
+                continue
+        valid.append(q)
+
+
+class QuestionImportWorker(QThread):
+    """后台导入题目：解析 -> 校验 -> 批量写入，避免阻塞管理界面"""
+    progress = Signal(str)
+    progress_step = Signal(int, int)
+    finished = Signal(dict)
+    error = Signal(str)
+
+    def __init__(self, fn, exam_id, exam_uuid):
+        super().__init__()
+        self.fn = fn
+        self.exam_id = exam_id
+        self.exam_uuid = exam_uuid
+
+    def run(self):
+        try:
+            self._emit_result(self._import())
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            close_thread_connections()
+
+    def _emit_result(self, result):
+        if isinstance(result, str):
+            self.error.emit(result)
+        else:
+            self.finished.emit(result)
+
+    def _import(self):
+        wb = load_workbook(self.fn, read_only=not workbook_has_images(self.fn), data_only=True)
+        try:
+            rand_count = None
+            if '配置选项' in wb.sheetnames:
+                ws_cfg = wb['配置选项']
+                cfg_rows = list(ws_cfg.iter_rows(min_row=1, max_row=2, values_only=True))
+                cfg_header = cfg_rows[0] if cfg_rows else ()
+                cfg_values = cfg_rows[1] if len(cfg_rows) > 1 else ()
+                cfg = {str(cfg_header[i]).strip(): (cfg_values[i] if i < len(cfg_values) else None) for i in range(len(cfg_header)) if cfg_header[i] is not None}
+                if '随机抽取数量' in cfg:
+                    try:
+                        rand_count = int(str(cfg['随机抽取数量']).strip())
+                    except Exception:
+                        rand_count = None
+            data_mand = []
+            data_rand = []
+            for sheet_name, pool in (('必考题库', 'mandatory'), ('随机题库', 'random')):
+                if sheet_name not in wb.sheetnames:
+                    continue
+                msg = tr('admin.import.progress.parsing', sheet=sheet_name)
+                self.progress.emit(msg)
+                lst = parse_question_sheet(wb[sheet_name], progress=lambda n, m=msg: self.progress.emit(f'{m} {n}'))
+                for x in lst:
+                    x['pool'] = pool
+                if pool == 'mandatory':
+                    data_mand = lst
+                else:
+                    data_rand = lst
+        finally:
+            wb.close()
+        if not data_mand and not data_rand:
+            return tr('error.lost_mandatory_or_random')
+        if rand_count is not None:
+            try:
+                update_exam_random_pick_count(self.exam_id, int(rand_count or 0))
+            except Exception:
+                pass
+        valid = []
+        errs = []
+        validate_questions(data_mand, '必考题库', valid, errs)
+        validate_questions(data_rand, '随机题库', valid, errs)
+        if not valid:
+            return '\n'.join(errs[:20]) if errs else tr('admin.import.error.no_valid')
+
+        def on_write(done, total):
+            self.progress.emit(tr('admin.import.progress.writing', done=done, total=total))
+            self.progress_step.emit(done, total)
+
+        import_questions_from_json(self.exam_uuid, valid, progress=on_write)
+        return {'valid': valid, 'errs': errs}
+
+
 class AdminExamsModule(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -794,6 +1030,8 @@ class AdminExamsModule(QWidget):
         lay = QVBoxLayout(self)
         lay.setContentsMargins(0, 0, 0, 0)
         lay.addWidget(self.stack)
+        self.import_worker = None
+        self.import_progress_dialog = None
 
     def _build_exam_list_page(self):
         page = QWidget()
@@ -959,12 +1197,16 @@ class AdminExamsModule(QWidget):
             btn_clear.setIcon(self.icon_manager.get_icon('delete'))
             btn_del = QPushButton(tr('common.delete'))
             btn_del.setIcon(self.icon_manager.get_icon('exam_delete'))
+            btn_regrade = QPushButton(tr('admin.exams.regrade'))
+            btn_regrade.setIcon(self.icon_manager.get_icon('refresh'))
             exam_uuid = e[6] or ''
             exam_id = e[0]
             btn_export.clicked.connect(lambda _, x=(exam_id, exam_uuid, e[1]): self.export_exam_questions(*x))
             btn_clear.clicked.connect(lambda _, x=exam_uuid: self.clear_exam(x))
             btn_del.clicked.connect(lambda _, x=exam_id: self.delete_exam(x))
+            btn_regrade.clicked.connect(lambda _, x=exam_id: self.regrade_exam(x))
             hb.addWidget(btn_export)
+            hb.addWidget(btn_regrade)
             hb.addWidget(btn_clear)
             hb.addWidget(btn_del)
             hb.addStretch()
@@ -1057,212 +1299,64 @@ class AdminExamsModule(QWidget):
         if not exam_id or not exam_uuid:
             show_warn(self, tr('common.error'), tr('error.select_exam'))
             return
+        if self.import_worker is not None and self.import_worker.isRunning():
+            return
         suggested = os.path.join(str(pathlib.Path.home()), 'Documents')
         fn, sel = QFileDialog.getOpenFileName(self, tr('admin.import.title'), suggested, 'Excel (*.xlsx)')
         if not fn:
             return
-        try:
-            wb = load_workbook(fn)
-            rand_count = None
-
-            def parse_sheet(ws):
-                header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True))
-                header = [str(x).strip() if x else '' for x in header_row]
-
-                def idx(name):
-                    try:
-                        return header.index(name)
-                    except Exception:
-                        return -1
-
-                itype = idx('类型')
-                icontent = idx('内容')
-                icorrect = idx('正确答案')
-                iscore = idx('分数')
-                start_opts = None
-                for i, h in enumerate(header):
-                    if h.startswith('选项'):
-                        start_opts = i
-                        break
-                base_cols = [x for x in (itype, icontent, icorrect, iscore) if x >= 0]
-                if min(itype, icontent, icorrect) < 0:
-                    return []
-                if start_opts is None:
-                    start_opts = (max(base_cols) + 1) if base_cols else 3
-
-                img_dic = {}
-                for image in ws._images:
-                    col = image.anchor._from.col
-                    row = image.anchor._from.row
-                    img_io = BytesIO(image._data())
-                    img_dic[row] = {col: img_io}
-
-                data_local = []
-                for idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True)):
-                    tval = (str(row[itype]).strip().lower() if row[itype] is not None else '')
-                    qtype = None
-                    if tval in ('单选', 'single'):
-                        qtype = 'single'
-                    elif tval in ('多选', 'multiple'):
-                        qtype = 'multiple'
-                    elif tval in ('判断', 'truefalse', '判断题'):
-                        qtype = 'truefalse'
-                    elif tval in ('填空', 'fill'):
-                        qtype = 'fill'
-                    elif tval in ('简答', 'essay'):
-                        qtype = 'essay'
-                    else:
-                        continue
-                    text = (str(row[icontent]).strip() if row[icontent] is not None else '')
-                    if not text:
-                        continue
-                    correct_cell = (str(row[icorrect]).strip() if row[icorrect] is not None else '')
-                    correct = []
-                    if qtype == 'truefalse':
-                        lc = correct_cell.lower()
-                        if lc in ('true', 'false'):
-                            correct = [True] if lc == 'true' else [False]
-                        else:
-                            continue
-                    else:
-                        parts = [p.strip().upper() for p in correct_cell.replace('，', ',').replace(';', ',').split(',') if p.strip()]
-                        correct = parts[:1] if qtype == 'single' else parts
-                    options = []
-                    if qtype != 'truefalse':
-                        letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-                        cidx = start_opts
-                        key_index = 0
-                        while cidx < len(row):
-                            val = row[cidx]
-                            if val is None or str(val).strip() == '':
-                                break
-                            key = letters[key_index] if key_index < len(letters) else str(key_index + 1)
-                            options.append({'key': key, 'text': str(val).strip()})
-                            cidx += 1
-                            key_index += 1
-                        if not options and qtype not in ('truefalse', 'fill', 'essay'):
-                            continue
-                    sc = 1.0
-                    if iscore >= 0 and iscore < len(row):
-                        try:
-                            v = row[iscore]
-                            if v is not None and str(v).strip() != '':
-                                sc = float(str(v).strip())
-                        except Exception:
-                            sc = 1.0
-                    pic_group = img_dic.get(idx + 1, None)
-                    pic_hash_list = []
-                    if isinstance(pic_group, dict):
-                        pic_list = [v for k, v in sorted(pic_group.items())]
-                        for pic in pic_list:
-                            hash_str = save_pic(pic)
-                            if hash_str:
-                                pic_hash_list.append(hash_str)
-                    pic_hash_list_str = json.dumps(pic_hash_list, ensure_ascii=False)
-                    item = {'type': qtype, 'text': text, 'score': sc, 'options': options, 'correct': correct, 'pictures': pic_hash_list_str}
-                    data_local.append(item)
-                return data_local
-
-            data_mand = []
-            data_rand = []
-            if '配置选项' in wb.sheetnames:
-                ws_cfg = wb['配置选项']
-                cfg_header = next(ws_cfg.iter_rows(min_row=1, max_row=1, values_only=True))
-                cfg = {str(cfg_header[i]).strip(): (ws_cfg.cell(row=2, column=i + 1).value) for i in range(len(cfg_header)) if cfg_header[i] is not None}
-                if '随机抽取数量' in cfg:
-                    try:
-                        rand_count = int(str(cfg['随机抽取数量']).strip())
-                    except Exception:
-                        rand_count = None
-            if '必考题库' in wb.sheetnames:
-                data_mand = parse_sheet(wb['必考题库'])
-            if '随机题库' in wb.sheetnames:
-                data_rand = parse_sheet(wb['随机题库'])
-            if not data_mand and not data_rand:
-                show_warn(self, tr('common.error'), tr('error.lost_mandatory_or_random'))
-                return
-            data = {'mandatory': data_mand, 'random': data_rand, 'config': {}}
-            if rand_count is not None:
-                data['config']['random_pick_count'] = rand_count
-            valid = []
-            errs = []
-            def validate_list(lst, pool_name):
-                base_index = len(valid)
-                for idx, q in enumerate(lst, start=1):
-                    t = (q.get('type') or '').strip().lower()
-                    if t not in ('single','multiple','truefalse','fill','essay'):
-                        errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.invalid_type")}')
-                        continue
-                    corr = q.get('correct') or []
-                    if t in ('single','multiple'):
-                        opts = q.get('options') or []
-                        keys = {str(o.get('key')).strip().upper() for o in opts if o.get('key')}
-                        if not keys:
-                            errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.missing_options")}')
-                            continue
-                        corr = [str(x).strip().upper() for x in corr if str(x).strip() != '']
-                        if not corr or not set(corr).issubset(keys):
-                            errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.invalid_correct")}')
-                            continue
-                        if t == 'single' and len(corr) != 1:
-                            errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.single_need_one")}')
-                            continue
-                        q['correct'] = corr
-                    elif t == 'fill':
-                        # 填空题：验证正确答案不为空
-                        if not corr or not any(str(c).strip() for c in corr):
-                            errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.invalid_correct")}')
-                            continue
-                        q['correct'] = [str(c).strip() for c in corr if str(c).strip()]
-                    elif t == 'essay':
-                        # 简答题：无预设正确答案，correct留空
-                        q['correct'] = []
-                    else:
-                        if not corr or len(corr) != 1 or not isinstance(corr[0], bool):
-                            errs.append(f'{pool_name} {tr("common.question")} {idx} {tr("error.tf_need_one")}')
-                            continue
-                    valid.append(q)
-            if isinstance(data, dict):
-                cfg = data.get('config') or {}
-                from models import update_exam_random_pick_count
-                if 'random_pick_count' in cfg:
-                    try:
-                        update_exam_random_pick_count(exam_id, int(cfg.get('random_pick_count') or 0))
-                    except Exception:
-                        pass
-                mand = data.get('mandatory') or []
-                rand = data.get('random') or []
-                if not mand and not rand:
-                    show_warn(self, tr('common.error'), tr('admin.import.error.jsonyaml_missing'))
-                    return
-                for x in mand:
-                    x['pool'] = 'mandatory'
-                for x in rand:
-                    x['pool'] = 'random'
-                validate_list(mand, '必考题库')
-                validate_list(rand, '随机题库')
-            else:
-                show_warn(self, tr('common.error'), tr('admin.import.error.jsonyaml_dict'))
-                return
-            if not valid:
-                detail = '\n'.join(errs[:20]) if errs else tr('admin.import.error.no_valid')
-                show_warn(self, tr('common.error'), detail)
-                return
-            import_questions_from_json(exam_uuid, valid)
-            self.refresh_exams()
-            cnt_single = sum(1 for d in valid if d.get('type') == 'single')
-            cnt_multiple = sum(1 for d in valid if d.get('type') == 'multiple')
-            cnt_tf = sum(1 for d in valid if d.get('type') == 'truefalse')
-            cnt_fill = sum(1 for d in valid if d.get('type') == 'fill')
-            cnt_essay = sum(1 for d in valid if d.get('type') == 'essay')
-            cnt_mand = sum(1 for d in valid if (d.get('pool') or 'mandatory') == 'mandatory')
-            cnt_rand = sum(1 for d in valid if (d.get('pool') or 'mandatory') == 'random')
-            extra = ''
-            if errs:
-                extra = f'\n{tr("admin.import.extra_prefix")}:\n' + '\n'.join(errs[:10])
-            show_info(self, tr('common.success'), tr('admin.import.success', single=cnt_single, multiple=cnt_multiple, truefalse=cnt_tf, fill=cnt_fill, essay=cnt_essay, mandatory=cnt_mand, random=cnt_rand, extra=extra))
-        except Exception as e:
-            show_warn(self, tr('common.error'), str(e))
+        dlg = QProgressDialog(tr('admin.import.progress.reading'), '', 0, 0, self)
+        dlg.setWindowTitle(tr('admin.import_questions'))
+        dlg.setCancelButton(None)
+        dlg.setMinimumDuration(0)
+        dlg.setAutoClose(False)
+        dlg.setWindowModality(Qt.WindowModality.WindowModal)
+        dlg.show()
+        self.import_progress_dialog = dlg
+        self.import_worker = QuestionImportWorker(fn, exam_id, exam_uuid)
+        self.import_worker.progress.connect(dlg.setLabelText)
+        self.import_worker.progress_step.connect(self.on_import_progress_step)
+        self.import_worker.finished.connect(self.on_import_finished)
+        self.import_worker.error.connect(self.on_import_error)
+        self.import_worker.start()
+
+    def on_import_progress_step(self, done, total):
+        dlg = self.import_progress_dialog
+        if dlg is not None:
+            dlg.setRange(0, total)
+            dlg.setValue(done)
+
+    def _close_import(self):
+        if self.import_progress_dialog is not None:
+            try:
+                self.import_progress_dialog.close()
+            except Exception:
+                pass
+            self.import_progress_dialog = None
+        if self.import_worker is not None:
+            self.import_worker.deleteLater()
+            self.import_worker = None
+
+    def on_import_error(self, error):
+        self._close_import()
+        show_warn(self, tr('common.error'), error)
+
+    def on_import_finished(self, result):
+        self._close_import()
+        self.refresh_exams()
+        valid = result.get('valid') or []
+        errs = result.get('errs') or []
+        cnt_single = sum(1 for d in valid if d.get('type') == 'single')
+        cnt_multiple = sum(1 for d in valid if d.get('type') == 'multiple')
+        cnt_tf = sum(1 for d in valid if d.get('type') == 'truefalse')
+        cnt_fill = sum(1 for d in valid if d.get('type') == 'fill')
+        cnt_essay = sum(1 for d in valid if d.get('type') == 'essay')
+        cnt_mand = sum(1 for d in valid if (d.get('pool') or 'mandatory') == 'mandatory')
+        cnt_rand = sum(1 for d in valid if (d.get('pool') or 'mandatory') == 'random')
+        extra = ''
+        if errs:
+            extra = f'\n{tr("admin.import.extra_prefix")}:\n' + '\n'.join(errs[:10])
+        show_info(self, tr('common.success'), tr('admin.import.success', single=cnt_single, multiple=cnt_multiple, truefalse=cnt_tf, fill=cnt_fill, essay=cnt_essay, mandatory=cnt_mand, random=cnt_rand, extra=extra))
     def export_exam_questions(self, exam_id, exam_uuid, title=''):
         """将指定试卷的全部题目导出为与导入模板一致的 Excel 文件"""
         if not exam_id or not exam_uuid:
@@ -1361,6 +1455,16 @@ class AdminExamsModule(QWidget):
             show_info(self, tr('common.success'), tr('admin.exams.clear_done'))
         except Exception as e:
             show_warn(self, tr('common.error'), str(e))
+    def regrade_exam(self, exam_id):
+        reply = ask_yes_no(self, tr('common.hint'), tr('admin.exams.regrade_confirm'), default_yes=False)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            from models import regrade_exam
+            count = regrade_exam(exam_id)
+            show_info(self, tr('common.success'), tr('admin.exams.regrade_done', count=count))
+        except Exception as e:
+            show_warn(self, tr('common.error'), str(e))
     def delete_exam(self, exam_id):
         reply = ask_yes_no(self, tr('common.hint'), tr('admin.exams.delete_confirm'), default_yes=False)
         if reply != QMessageBox.StandardButton.Yes:
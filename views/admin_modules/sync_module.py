@@ -1,13 +1,20 @@
 import os
 import pathlib
+import shutil
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from PySide6.QtCore import Qt, QThread, Signal, QTimer
+from PySide6.QtGui import QColor
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QGroupBox, QFormLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QTextBrowser, QProgressDialog, QFileDialog, QMessageBox
 from theme_manager import theme_manager
 from language import tr
 from icon_manager import IconManager
 from utils import show_info, show_warn, ask_yes_no
-from database import DB_DIR
+from database import (
+    DB_DIR, SCORES_DB_PATH, USERS_DB_PATH, ADMIN_DB_PATH, EXAMS_DB_PATH, KB_DB_PATH, RESOURCE_PATH,
+    close_thread_connections, checkpoint_all, push_target_key,
+    change_log_state, get_sync_mark, set_sync_marks, compact_change_log,
+)
 from models import (
     list_sync_targets,
     upsert_sync_target,
@@ -17,262 +24,384 @@ from models import (
     update_sync_target_active,
     get_exam_title
 )
-from sync import rsync_push, rsync_pull_scores, rsync_pull_users, rsync_pull_admins, rsync_pull_progress, rsync_pull_exams, rsync_pull_knowledge, rsync_pull_files_dir, merge_pulled_files
+from sync import merge_pulled_files, scan_reachability, prepare_push, SshSession, SyncScheduler, build_bundle, unpack_bundle, BUNDLE_SUFFIX
 from openpyxl import load_workbook, Workbook
 from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
 from openpyxl.utils import get_column_letter
 
+# 拉取的各类数据库与对应的本地库
+MERGE_LOCAL_PATHS = {
+    'scores': SCORES_DB_PATH,
+    'users': USERS_DB_PATH,
+    'admin': ADMIN_DB_PATH,
+    'exams': EXAMS_DB_PATH,
+    'knowledge': KB_DB_PATH,
+}
+
+# 每台设备一次拉取的内容：(类型, 远端文件名)
+PULL_BUNDLE = (
+    ('scores', 'scores.db'),
+    ('users', 'users.db'),
+    ('admin', 'admin.db'),
+    ('progress', 'progress.db'),
+    ('exams', 'exams.db'),
+    ('knowledge', 'knowledge.db'),
+    ('files', 'files'),
+)
+
 
 class SyncWorker(QThread):
     progress = Signal(str)
     progress_step = Signal(int)
+    reachability = Signal(dict)
     finished = Signal(str)
     error = Signal(str)
-    def __init__(self, targets, operation='push'):
+    def __init__(self, targets, operation='push', bundle_path=None):
         super().__init__()
         self.targets = targets
         self.operation = operation
+        self.bundle_path = bundle_path
+        self._sessions = {}
+        # 调度器的多个工作线程会同时取用会话
+        self._sessions_lock = threading.Lock()
+        self._open_locks = {}
+        self._opened = set()
+        self._prepared = None
+        self._reachability = {}
+    def _session(self, t):
+        """按目标（主机、用户、远端目录）缓存 SSH 会话，拉取与推送复用同一条主连接"""
+        key = self._mark_target(t)
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = SshSession(t[2], t[3], t[4], t[5] if len(t) > 5 else None, reachable=self._reachability.get(t[2]))
+                self._sessions[key] = session
+            open_lock = self._open_locks.setdefault(key, threading.Lock())
+        # 握手较慢，只在同一目标内串行，不阻塞其他目标
+        with open_lock:
+            if key not in self._opened:
+                session.open()
+                self._opened.add(key)
+        return session
+    def _mark_target(self, t):
+        # 与推送指纹使用同一个设备标识
+        return push_target_key(t[2], t[3], t[4])
+    def _drop_session(self, t):
+        # 重试时重新探测端口
+        key = self._mark_target(t)
+        with self._sessions_lock:
+            self._reachability.pop(t[2], None)
+            session = self._sessions.pop(key, None)
+            self._opened.discard(key)
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+    def _close_sessions(self):
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._opened.clear()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
     def run(self):
+        try:
+            self._run()
+        finally:
+            self._close_sessions()
+            close_thread_connections()
+    def _prescan(self):
+        """并发探测全部目标的 SSH 端口，离线设备不再进入传输队列"""
+        try:
+            self._reachability = scan_reachability(self.targets)
+        except Exception as e:
+            print(f"[WARN] reachability scan failed: {e}")
+            self._reachability = {}
+            return
+        self.reachability.emit(dict(self._reachability))
+        online = sum(1 for t in self.targets if self._reachability.get(t[2]))
+        self.progress.emit(f'在线设备 {online}/{len(self.targets)}')
+    def _live_targets(self, results, count_steps):
+        live = []
+        for t in self.targets:
+            if self._reachability.get(t[2], True):
+                live.append(t)
+            else:
+                self._report(results, f'{t[1]} ({t[2]}) 离线，已跳过', count_steps)
+        return live
+    def _run(self):
         results = []
+        if self.operation in ('export_bundle', 'import_bundle'):
+            try:
+                self._run_bundle(results)
+            except Exception as e:
+                self.error.emit(str(e))
+                return
+            self.finished.emit('\n'.join(results))
+            return
+        scheduler = SyncScheduler.from_settings()
+        self._prescan()
         if self.operation == 'sync':
-            base_dir = os.path.join(DB_DIR, 'pulled')
-            os.makedirs(base_dir, exist_ok=True)
-            pulled = []
             total_steps = len(self.targets) * 3 if self.targets else 0
-            if self.targets:
-                max_workers = min(4, len(self.targets))
-                def pull_one(t):
-                    ssh_password = t[5] if len(t) > 5 else None
-                    ip = t[2]
-                    dest_dir = os.path.join(base_dir, ip)
-                    os.makedirs(dest_dir, exist_ok=True)
-                    
-                    # Pull scores.db
-                    code_s, out_s, err_s = rsync_pull_scores(ip, t[3], t[4], dest_dir, ssh_password)
-                    # Pull users.db
-                    code_u, out_u, err_u = rsync_pull_users(ip, t[3], t[4], dest_dir, ssh_password)
-                    # Pull admin.db
-                    code_a, out_a, err_a = rsync_pull_admins(ip, t[3], t[4], dest_dir, ssh_password)
-                    # Pull progress.db
-                    code_p, out_p, err_p = rsync_pull_progress(ip, t[3], t[4], dest_dir, ssh_password)
-                    # Pull exams.db
-                    code_ex, out_ex, err_ex = rsync_pull_exams(ip, t[3], t[4], dest_dir, ssh_password)
-                    # Pull knowledge.db
-                    code_kb, out_kb, err_kb = rsync_pull_knowledge(ip, t[3], t[4], dest_dir, ssh_password)
-                    # Pull files/ directory
-                    files_dest = os.path.join(dest_dir, 'files')
-                    code_f, out_f, err_f = rsync_pull_files_dir(ip, t[3], t[4], files_dest, ssh_password)
-                    
-                    pulled_files = []
-                    if code_s == 0:
-                        rp = os.path.join(dest_dir, 'scores.db')
-                        if os.path.exists(rp): pulled_files.append(('scores', rp))
-                    if code_u == 0:
-                        rp = os.path.join(dest_dir, 'users.db')
-                        if os.path.exists(rp): pulled_files.append(('users', rp))
-                    if code_a == 0:
-                        rp = os.path.join(dest_dir, 'admin.db')
-                        if os.path.exists(rp): pulled_files.append(('admin', rp))
-                    if code_p == 0:
-                        rp = os.path.join(dest_dir, 'progress.db')
-                        if os.path.exists(rp): pulled_files.append(('progress', rp))
-                    if code_ex == 0:
-                        rp = os.path.join(dest_dir, 'exams.db')
-                        if os.path.exists(rp): pulled_files.append(('exams', rp))
-                    if code_kb == 0:
-                        rp = os.path.join(dest_dir, 'knowledge.db')
-                        if os.path.exists(rp): pulled_files.append(('knowledge', rp))
-                    if code_f == 0 and os.path.exists(files_dest):
-                        pulled_files.append(('files', files_dest))
-                    
-                    if not pulled_files:
-                        msg = f'{t[1]} ({ip}) 拉取失败: {err_s or "未知错误"}'
-                        return t, 1, err_s, msg, []
-                    
-                    msg = f'{t[1]} ({ip}) 拉取成功 ({len(pulled_files)}个文件/目录)'
-                    return t, 0, None, msg, pulled_files
-                with ThreadPoolExecutor(max_workers=max_workers) as ex:
-                    future_map = {ex.submit(pull_one, t): t for t in self.targets}
-                    for fut in as_completed(future_map):
-                        base_t = future_map[fut]
-                        try:
-                            t, code, err, msg, pf = fut.result()
-                            self.progress.emit(msg)
-                            if total_steps:
-                                self.progress_step.emit(1)
-                            results.append(msg)
-                            if code == 0 and pf:
-                                pulled.append((t, pf))
-                        except Exception as e:
-                            error_msg = f'{base_t[1]} 错误: {str(e)}'
-                            results.append(error_msg)
-                            self.error.emit(error_msg)
+            pulled = self._pull_all(scheduler, results, [name for db_type, name in PULL_BUNDLE], bool(total_steps))
             if pulled:
-                try:
-                    from models import merge_remote_scores_db, merge_user_databases, merge_admin_databases, merge_exam_databases, merge_knowledge_databases
-                except Exception as e:
-                    err_msg = f'合并模块加载失败: {str(e)}'
-                    results.append(err_msg)
-                    self.error.emit(err_msg)
-                else:
-                    for t, pf in pulled:
-                        for db_type, rp in pf:
-                            try:
-                                if db_type == 'scores':
-                                    merge_remote_scores_db(rp)
-                                    merge_msg = f'{t[1]} ({t[2]}) 成绩已合并'
-                                elif db_type == 'users':
-                                    merge_user_databases(rp)
-                                    merge_msg = f'{t[1]} ({t[2]}) 用户表已合并'
-                                elif db_type == 'admin':
-                                    merge_admin_databases(rp)
-                                    merge_msg = f'{t[1]} ({t[2]}) 管理员表已合并'
-                                elif db_type == 'exams':
-                                    merge_exam_databases(rp)
-                                    merge_msg = f'{t[1]} ({t[2]}) 考试表已合并'
-                                elif db_type == 'knowledge':
-                                    merge_knowledge_databases(rp)
-                                    merge_msg = f'{t[1]} ({t[2]}) 知识库已合并'
-                            except Exception as me:
-                                merge_msg = f'{t[1]} ({t[2]}) {db_type} 合并失败: {str(me)}'
-                            self.progress.emit(merge_msg)
-                            if total_steps:
-                                self.progress_step.emit(1)
-                            results.append(merge_msg)
-                # 合并拉取的文件
-                for t, pf in pulled:
-                    for db_type, rp in pf:
-                        if db_type == 'files':
-                            try:
-                                copied = merge_pulled_files(rp)
-                                merge_msg = f'{t[1]} ({t[2]}) 文件已合并 ({copied}个新文件)'
-                            except Exception as me:
-                                merge_msg = f'{t[1]} ({t[2]}) 文件合并失败: {str(me)}'
-                            self.progress.emit(merge_msg)
-                            if total_steps:
-                                self.progress_step.emit(1)
-                            results.append(merge_msg)
-            if self.targets:
-                max_workers_push = min(4, len(self.targets))
-                def push_one(t):
-                    ssh_password = t[5] if len(t) > 5 else None
-                    is_admin = t[6] if len(t) > 6 else 0
-                    code2, out2, err2 = rsync_push(t[2], t[3], t[4], ssh_password, include_admin=bool(is_admin))
-                    if code2 == 0:
-                        msg = f'{t[1]} ({t[2]}) 上传完成'
-                    elif code2 == 304:
-                        msg = f'{t[1]} ({t[2]}) 跳过本地设备'
-                    else:
-                        msg = f'{t[1]} ({t[2]}) 上传失败: {err2 or "未知错误"}'
-                    return t, msg
-                with ThreadPoolExecutor(max_workers=max_workers_push) as ex:
-                    future_map = {ex.submit(push_one, t): t for t in self.targets}
-                    for fut in as_completed(future_map):
-                        base_t = future_map[fut]
-                        try:
-                            t, msg = fut.result()
-                            self.progress.emit(msg)
-                            if total_steps:
-                                self.progress_step.emit(1)
-                            results.append(msg)
-                        except Exception as e:
-                            error_msg = f'{base_t[1]} 错误: {str(e)}'
-                            results.append(error_msg)
-                            self.error.emit(error_msg)
+                self._merge_pulled(pulled, results, count_steps=bool(total_steps))
+            self._push_all(scheduler, results, ('上传完成', '跳过本地设备', '上传失败'), bool(total_steps))
+        elif self.operation == 'push':
+            self._push_all(scheduler, results, ('推送成功', '跳过设备', '推送失败'), True)
         else:
-            if self.operation == 'push':
-                if self.targets:
-                    max_workers = min(4, len(self.targets))
-                    total_steps = len(self.targets)
-                    def push_only(t):
-                        ssh_password = t[5] if len(t) > 5 else None
-                        is_admin = t[6] if len(t) > 6 else 0
-                        code, out, err = rsync_push(t[2], t[3], t[4], ssh_password, include_admin=bool(is_admin))
-                        if code == 0:
-                            msg = f'{t[1]} ({t[2]}) 推送成功'
-                        elif code == 304:
-                            msg = f'{t[1]} ({t[2]}) 跳过设备'
-                        else:
-                            msg = f'推送失败: {err or "未知错误"}'
-                        return t, msg
-                    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-                        future_map = {ex.submit(push_only, t): t for t in self.targets}
-                        for fut in as_completed(future_map):
-                            base_t = future_map[fut]
-                            try:
-                                t, msg = fut.result()
-                                self.progress.emit(msg)
-                                if total_steps:
-                                    self.progress_step.emit(1)
-                                results.append(msg)
-                            except Exception as e:
-                                error_msg = f'{base_t[1]} 错误: {str(e)}'
-                                results.append(error_msg)
-                                self.error.emit(error_msg)
+            names = [name for db_type, name in PULL_BUNDLE if db_type in MERGE_LOCAL_PATHS]
+            pulled = self._pull_all(scheduler, results, names, True)
+            if pulled:
+                self._merge_pulled(pulled, results, count_steps=False)
+        self.finished.emit('\n'.join(results))
+
+    def _run_bundle(self, results):
+        """离线同步包：导出本机数据，或把别处导出的包解开后按拉取结果合并"""
+        if self.operation == 'export_bundle':
+            manifest = build_bundle(self.bundle_path)
+            size = os.path.getsize(self.bundle_path) / 1024 / 1024
+            self._report(results, f'同步包已导出: {self.bundle_path} ({len(manifest["dbs"])}个库, '
+                                  f'{len(set(manifest["files"].values()))}个文件, {size:.1f} MB)', False)
+            return
+        dest_dir = os.path.join(DB_DIR, 'pulled', 'bundle')
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        manifest = unpack_bundle(self.bundle_path, dest_dir)
+        source = manifest.get('source') or 'bundle'
+        t = (None, source, source, 'bundle', dest_dir)
+        pulled_files = [(db_type, os.path.join(dest_dir, name)) for db_type, name in PULL_BUNDLE
+                        if os.path.exists(os.path.join(dest_dir, name))]
+        if os.path.isdir(os.path.join(dest_dir, 'resources')):
+            pulled_files.append(('resources', os.path.join(dest_dir, 'resources')))
+        self._report(results, f'同步包已解开: 来自 {source}，导出于 {manifest.get("created_at")}', False)
+        self._merge_pulled([(t, pulled_files)], results, count_steps=False)
+
+    @staticmethod
+    def _timing(elapsed, tries):
+        if tries > 1:
+            return f' [{elapsed:.1f}s, 重试{tries - 1}次]'
+        return f' [{elapsed:.1f}s]'
+
+    def _pull_one(self, t, names):
+        ip = t[2]
+        dest_dir = os.path.join(DB_DIR, 'pulled', ip)
+        os.makedirs(dest_dir, exist_ok=True)
+        # 同一设备的拉取与推送复用一条 SSH 连接，所有库与 files/ 一次 rsync 拉取
+        status = self._session(t).pull_bundle(dest_dir, names)
+        pulled_files = []
+        err_s = None
+        for db_type, name in PULL_BUNDLE:
+            if name not in status:
+                continue
+            code, out, err = status[name]
+            rp = os.path.join(dest_dir, name)
+            if code == 0 and os.path.exists(rp):
+                pulled_files.append((db_type, rp))
+            elif db_type == 'scores':
+                err_s = err
+        if not pulled_files:
+            # 失败后丢弃会话，重试时重新探测与握手
+            self._drop_session(t)
+            return 1, f'{t[1]} ({ip}) 拉取失败: {err_s or "未知错误"}', []
+        return 0, f'{t[1]} ({ip}) 拉取成功 ({len(pulled_files)}个文件/目录)', pulled_files
+
+    def _pull_all(self, scheduler, results, names, count_steps):
+        pulled = []
+        targets = self._live_targets(results, count_steps)
+        jobs = scheduler.run(targets, lambda t: self._pull_one(t, names), should_retry=lambda r: r[0] != 0)
+        for t, res, elapsed, tries in jobs:
+            if isinstance(res, Exception):
+                self._drop_session(t)
+                error_msg = f'{t[1]} 错误: {str(res)}'
+                results.append(error_msg)
+                self.error.emit(error_msg)
+                continue
+            code, msg, pf = res
+            self._report(results, msg + self._timing(elapsed, tries), count_steps)
+            if code == 0 and pf:
+                pulled.append((t, pf))
+        return pulled
+
+    def _push_one(self, t):
+        is_admin = t[6] if len(t) > 6 else 0
+        code, out, err = self._session(t).push(include_admin=bool(is_admin), prepared=self._prepared)
+        if code not in (0, 304):
+            self._drop_session(t)
+        return code, out, err
+
+    def _push_all(self, scheduler, results, labels, count_steps):
+        done_label, skip_label, fail_label = labels
+        targets = self._live_targets(results, count_steps)
+        # 检查点与 config.db 摘要在合并之后、推送之前统一做一次，各目标共用
+        self._prepared = prepare_push() if targets else None
+        jobs = scheduler.run(targets, self._push_one, should_retry=lambda r: r[0] not in (0, 304))
+        for t, res, elapsed, tries in jobs:
+            if isinstance(res, Exception):
+                self._drop_session(t)
+                error_msg = f'{t[1]} 错误: {str(res)}'
+                results.append(error_msg)
+                self.error.emit(error_msg)
+                continue
+            code, out, err = res
+            if code == 0 and out == 'Up to date':
+                msg = f'{t[1]} ({t[2]}) 无变化，已跳过'
+            elif code == 0:
+                msg = f'{t[1]} ({t[2]}) {done_label}'
+            elif code == 304:
+                msg = f'{t[1]} ({t[2]}) {skip_label}'
             else:
-                total_steps = len(self.targets)
-                for t in self.targets:
+                msg = f'{t[1]} ({t[2]}) {fail_label}: {err or "未知错误"}'
+            self._report(results, msg + self._timing(elapsed, tries), count_steps)
+
+    def _report(self, results, msg, count_steps):
+        self.progress.emit(msg)
+        if count_steps:
+            self.progress_step.emit(1)
+        results.append(msg)
+
+    def _merge_pulled(self, pulled, results, count_steps=True):
+        """合并拉取结果：先并行校验并去掉重复/无变化的库，再每种库一次批量写入"""
+        try:
+            from models import (merge_remote_scores_dbs, merge_user_databases, merge_admin_databases,
+                                merge_exam_databases, merge_knowledge_databases, check_pulled_db, pulled_db_digest)
+        except Exception as e:
+            err_msg = f'合并模块加载失败: {str(e)}'
+            results.append(err_msg)
+            self.error.emit(err_msg)
+            return
+        mergers = {
+            'users': (merge_user_databases, '用户表'),
+            'admin': (merge_admin_databases, '管理员表'),
+            'exams': (merge_exam_databases, '考试表'),
+            'knowledge': (merge_knowledge_databases, '知识库'),
+        }
+        items = [(t, db_type, rp) for t, pf in pulled for db_type, rp in pf if db_type in MERGE_LOCAL_PATHS]
+        # 检查点未完成的本地库摘要不可比、合并结果也无法随后推送，本次跳过且不推进水位，下次同步再合并
+        busy = set(checkpoint_all())
+        busy_types = [k for k, p in MERGE_LOCAL_PATHS.items() if p in busy and any(it[1] == k for it in items)]
+        for db_type in busy_types:
+            self._report(results, f'本地 {db_type} 库正忙（WAL 检查点未完成），本次跳过合并', False)
+        items = [it for it in items if it[1] not in busy_types]
+        local_digest = {k: pulled_db_digest(p) for k, p in MERGE_LOCAL_PATHS.items() if os.path.exists(p)}
+
+        def inspect(item):
+            t, db_type, rp = item
+            # scores.db 在读取新记录时校验
+            if db_type != 'scores':
+                check_pulled_db(rp)
+            return pulled_db_digest(rp), change_log_state(rp)
+
+        followers = {}
+
+        def mark(i):
+            # 内容相同而被跳过的副本随首个副本一起推进水位
+            for j in [i] + followers.get(i, []):
+                t, db_type, rp = items[j]
+                set_sync_marks(self._mark_target(t), {os.path.basename(MERGE_LOCAL_PATHS[db_type]): states[j]})
+
+        digests = {}
+        states = {}
+        if items:
+            with ThreadPoolExecutor(max_workers=min(4, len(items))) as ex:
+                future_map = {ex.submit(inspect, it): i for i, it in enumerate(items)}
+                for fut in as_completed(future_map):
+                    i = future_map[fut]
                     try:
-                        ssh_password = t[5] if len(t) > 5 else None
-                        base_dir = os.path.join(DB_DIR, 'pulled')
-                        os.makedirs(base_dir, exist_ok=True)
-                        ip = t[2]
-                        dest_dir = os.path.join(base_dir, ip)
-                        os.makedirs(dest_dir, exist_ok=True)
-                        
-                        # Pull scores, users, admin, exams, knowledge
-                        rsync_pull_scores(ip, t[3], t[4], dest_dir, ssh_password)
-                        rsync_pull_users(ip, t[3], t[4], dest_dir, ssh_password)
-                        rsync_pull_admins(ip, t[3], t[4], dest_dir, ssh_password)
-                        rsync_pull_exams(ip, t[3], t[4], dest_dir, ssh_password)
-                        rsync_pull_knowledge(ip, t[3], t[4], dest_dir, ssh_password)
-                        
-                        result = f'{t[1]} ({ip}) 拉取完成'
-                        
-                        try:
-                            from models import merge_remote_scores_db, merge_user_databases, merge_admin_databases, merge_exam_databases, merge_knowledge_databases
-                            
-                            s_path = os.path.join(dest_dir, 'scores.db')
-                            if os.path.exists(s_path):
-                                merge_remote_scores_db(s_path)
-                                result += ' (成绩已合并)'
-                                
-                            u_path = os.path.join(dest_dir, 'users.db')
-                            if os.path.exists(u_path):
-                                merge_user_databases(u_path)
-                                result += ' (用户表已合并)'
-                                
-                            a_path = os.path.join(dest_dir, 'admin.db')
-                            if os.path.exists(a_path):
-                                merge_admin_databases(a_path)
-                                result += ' (管理员表已合并)'
-                                
-                            e_path = os.path.join(dest_dir, 'exams.db')
-                            if os.path.exists(e_path):
-                                merge_exam_databases(e_path)
-                                result += ' (考试表已合并)'
-                                
-                            kb_path = os.path.join(dest_dir, 'knowledge.db')
-                            if os.path.exists(kb_path):
-                                merge_knowledge_databases(kb_path)
-                                result += ' (知识库已合并)'
-                                
-                        except Exception as me:
-                            result += f' (部分合并失败: {str(me)})'
+                        digests[i], states[i] = fut.result()
                     except Exception as e:
-                        result = f'{t[1]} ({ip}) 错误: {str(e)}'
-                    
-                    self.progress.emit(result)
-                    if total_steps:
-                        self.progress_step.emit(1)
-                    results.append(result)
-        self.finished.emit('\n'.join(results))
+                        t, db_type, rp = items[i]
+                        self._report(results, f'{t[1]} ({t[2]}) {db_type} 校验失败: {str(e)}', count_steps)
+        # 同一来源的变更日志只合并上次水位之后的变更
+        since = {i: get_sync_mark(self._mark_target(items[i][0]), os.path.basename(MERGE_LOCAL_PATHS[items[i][1]]), states[i][0])
+                 for i in states}
+        groups = {}
+        seen = {}
+        for i, (t, db_type, rp) in enumerate(items):
+            if i not in digests:
+                continue
+            key = (db_type, digests[i])
+            if digests[i] == local_digest.get(db_type) or key in seen:
+                self._report(results, f'{t[1]} ({t[2]}) {db_type} 无新数据，已跳过', count_steps)
+                if key in seen:
+                    followers.setdefault(seen[key], []).append(i)
+                else:
+                    mark(i)
+                continue
+            if states[i][1] and since[i] >= states[i][1]:
+                self._report(results, f'{t[1]} ({t[2]}) {db_type} 自上次同步后无变更，已跳过', count_steps)
+                continue
+            seen[key] = i
+            groups.setdefault(db_type, []).append((i, t, rp))
+
+        scores = groups.get('scores', [])
+        if scores:
+            try:
+                attempts, answers, errors = merge_remote_scores_dbs([rp for i, t, rp in scores],
+                                                                   since={rp: since[i] for i, t, rp in scores})
+            except Exception as me:
+                attempts, answers, errors = 0, 0, {rp: str(me) for i, t, rp in scores}
+            for i, t, rp in scores:
+                if rp in errors:
+                    self._report(results, f'{t[1]} ({t[2]}) scores 合并失败: {errors[rp]}', count_steps)
+                else:
+                    mark(i)
+                    self._report(results, f'{t[1]} ({t[2]}) 成绩已合并', count_steps)
+            self._report(results, f'成绩合并完成: 新增 {attempts} 条考试记录, {answers} 条作答', False)
+        for db_type in ('users', 'admin', 'exams', 'knowledge'):
+            merge, label = mergers[db_type]
+            for i, t, rp in groups.get(db_type, []):
+                try:
+                    if db_type == 'exams':
+                        report = merge(rp)
+                    else:
+                        report = merge(rp, since=since[i])
+                    mark(i)
+                    merge_msg = f'{t[1]} ({t[2]}) {label}已合并'
+                    if isinstance(report, dict):
+                        merge_msg += f" (新增 {report['inserted']}, 更新 {report['updated']}, 删除 {report['deleted']})"
+                except Exception as me:
+                    merge_msg = f'{t[1]} ({t[2]}) {db_type} 合并失败: {str(me)}'
+                self._report(results, merge_msg, count_steps)
+        # 合并拉取的文件
+        for t, pf in pulled:
+            for db_type, rp in pf:
+                if db_type in ('files', 'resources'):
+                    try:
+                        copied = merge_pulled_files(rp, RESOURCE_PATH) if db_type == 'resources' else merge_pulled_files(rp)
+                        merge_msg = f'{t[1]} ({t[2]}) 文件已合并 ({copied}个新文件)'
+                    except Exception as me:
+                        merge_msg = f'{t[1]} ({t[2]}) 文件合并失败: {str(me)}'
+                    self._report(results, merge_msg, count_steps)
+        # 水位推进后，各目标都已越过的变更日志条目可以删除
+        for path in {MERGE_LOCAL_PATHS[db_type] for t, db_type, rp in items}:
+            compact_change_log(path)
+
+
+class ReachabilityWorker(QThread):
+    finished = Signal(dict)
+    def __init__(self, targets):
+        super().__init__()
+        self.targets = targets
+    def run(self):
+        try:
+            reach = scan_reachability(self.targets)
+        except Exception as e:
+            print(f"[WARN] reachability scan failed: {e}")
+            reach = {}
+        finally:
+            close_thread_connections()
+        self.finished.emit(reach)
 
 
 class AdminSyncModule(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.icon_manager = IconManager()
+        self.reachability = {}
         lay = QVBoxLayout()
         gb1 = QGroupBox(tr('admin.targets.group'))
         vb1 = QVBoxLayout()
@@ -331,6 +460,18 @@ class AdminSyncModule(QWidget):
         self.sync_btn.setIcon(self.icon_manager.get_icon('push'))
         self.sync_btn.clicked.connect(self.sync_all)
         hb.addWidget(self.sync_btn)
+        self.scan_btn = QPushButton(tr('sync.scan_btn'))
+        self.scan_btn.setIcon(self.icon_manager.get_icon('refresh'))
+        self.scan_btn.clicked.connect(self.scan_targets)
+        hb.addWidget(self.scan_btn)
+        self.export_bundle_btn = QPushButton(tr('sync.export_bundle_btn'))
+        self.export_bundle_btn.setIcon(self.icon_manager.get_icon('exam_export'))
+        self.export_bundle_btn.clicked.connect(self.export_bundle)
+        hb.addWidget(self.export_bundle_btn)
+        self.import_bundle_btn = QPushButton(tr('sync.import_bundle_btn'))
+        self.import_bundle_btn.setIcon(self.icon_manager.get_icon('exam_import'))
+        self.import_bundle_btn.clicked.connect(self.import_bundle)
+        hb.addWidget(self.import_bundle_btn)
         lay.addLayout(hb)
         self.sync_spinner = None
         colors_log = theme_manager.get_theme_colors()
@@ -349,6 +490,7 @@ class AdminSyncModule(QWidget):
         self.progress_timer = None
         self.sync_progress_dialog = None
         self.sync_worker = None
+        self.scan_worker = None
 
     def show_sync_progress(self, message, total_steps=None):
         if hasattr(self, 'sync_progress_dialog') and getattr(self, 'sync_progress_dialog'):
@@ -419,6 +561,9 @@ class AdminSyncModule(QWidget):
                     child.setEnabled(enabled)
         if hasattr(self, 'sync_btn'):
             self.sync_btn.setEnabled(enabled)
+        for name in ('scan_btn', 'export_bundle_btn', 'import_bundle_btn'):
+            if hasattr(self, name):
+                getattr(self, name).setEnabled(enabled)
     def update_progress_message(self, msg):
         try:
             if hasattr(self, 'sync_progress_dialog') and getattr(self, 'sync_progress_dialog'):
@@ -486,6 +631,7 @@ class AdminSyncModule(QWidget):
         self.progress_total = total_steps
         self.progress_done = 0
         self.sync_worker.progress_step.connect(self.on_progress_step)
+        self.sync_worker.reachability.connect(self.apply_reachability)
         self.sync_worker.start()
         self.show_sync_progress(tr('sync.syncing_message'), total_steps)
         self.start_progress_timer()
@@ -507,6 +653,7 @@ class AdminSyncModule(QWidget):
         self.progress_total = total_steps
         self.progress_done = 0
         self.sync_worker.progress_step.connect(self.on_progress_step)
+        self.sync_worker.reachability.connect(self.apply_reachability)
         self.sync_worker.start()
         self.show_sync_progress(tr('sync.pushing_message'), total_steps)
         self.start_progress_timer()
@@ -528,9 +675,37 @@ class AdminSyncModule(QWidget):
         self.progress_total = total_steps
         self.progress_done = 0
         self.sync_worker.progress_step.connect(self.on_progress_step)
+        self.sync_worker.reachability.connect(self.apply_reachability)
         self.sync_worker.start()
         self.show_sync_progress(tr('sync.pulling_message'), total_steps)
         self.start_progress_timer()
+    def export_bundle(self):
+        suggested = os.path.join(str(pathlib.Path.home()), 'Documents', 'exam_sync' + BUNDLE_SUFFIX)
+        fn, sel = QFileDialog.getSaveFileName(self, tr('sync.export_bundle_btn'), suggested, tr('sync.bundle_filter'))
+        if not fn:
+            return
+        if not fn.lower().endswith(BUNDLE_SUFFIX):
+            fn += BUNDLE_SUFFIX
+        self.run_bundle_worker('export_bundle', fn, tr('sync.bundle_exporting_message'))
+    def import_bundle(self):
+        suggested = os.path.join(str(pathlib.Path.home()), 'Documents')
+        fn, sel = QFileDialog.getOpenFileName(self, tr('sync.import_bundle_btn'), suggested, tr('sync.bundle_filter'))
+        if not fn:
+            return
+        self.run_bundle_worker('import_bundle', fn, tr('sync.bundle_importing_message'))
+    def run_bundle_worker(self, operation, path, message):
+        self.set_sync_buttons_enabled(False)
+        if hasattr(self, 'sync_log'):
+            self.sync_log.clear()
+        self.sync_worker = SyncWorker([], operation, bundle_path=path)
+        self.sync_worker.finished.connect(self.on_sync_finished)
+        self.sync_worker.error.connect(self.on_sync_error)
+        self.sync_worker.progress.connect(self.append_sync_log)
+        self.sync_worker.progress.connect(self.update_progress_message)
+        self.progress_total = 0
+        self.progress_done = 0
+        self.sync_worker.start()
+        self.show_sync_progress(message)
     def on_sync_finished(self, results):
         self.set_sync_buttons_enabled(True)
         if hasattr(self, 'sync_worker'):
@@ -702,12 +877,52 @@ class AdminSyncModule(QWidget):
         except Exception:
             pass
         self.targets_table.blockSignals(False)
+        self.apply_reachability({})
         try:
             self.targets_table.itemChanged.disconnect()
         except Exception:
             pass
         self.targets_table.itemChanged.connect(self.on_target_item_changed)
 
+    def scan_targets(self):
+        if self.scan_worker is not None and self.scan_worker.isRunning():
+            return
+        targets = list_sync_targets()
+        if not targets:
+            show_info(self, tr('sync.status.info'), tr('info.no_active_targets'))
+            return
+        self.scan_btn.setEnabled(False)
+        self.scan_worker = ReachabilityWorker(targets)
+        self.scan_worker.finished.connect(self.on_scan_finished)
+        self.scan_worker.start()
+
+    def on_scan_finished(self, reach):
+        self.scan_btn.setEnabled(True)
+        if self.scan_worker is not None:
+            self.scan_worker.deleteLater()
+            self.scan_worker = None
+        self.apply_reachability(reach)
+        online = sum(1 for v in reach.values() if v)
+        self.append_sync_log(tr('sync.scan_result', online=online, total=len(reach)))
+
+    def apply_reachability(self, reach):
+        """按最近一次探测结果为设备名着色：在线绿色，离线灰色"""
+        self.reachability.update(reach)
+        self.targets_table.blockSignals(True)
+        for r in range(self.targets_table.rowCount()):
+            it_name = self.targets_table.item(r, 0)
+            it_ip = self.targets_table.item(r, 1)
+            if it_name is None or it_ip is None:
+                continue
+            state = self.reachability.get(it_ip.text())
+            if state is None:
+                it_name.setData(Qt.ItemDataRole.ForegroundRole, None)
+                it_name.setToolTip('')
+            else:
+                it_name.setForeground(QColor('#67c23a' if state else '#909399'))
+                it_name.setToolTip(tr('sync.reach.online') if state else tr('sync.reach.offline'))
+        self.targets_table.blockSignals(False)
+
     def toggle_active(self, target_id, current_active):
         new_active = 0 if current_active else 1
         try:
@@ -11,6 +11,7 @@ from theme_manager import theme_manager
 from language import tr
 from utils import show_info, show_warn, ask_yes_no
 from file_viewer import open_file_in_viewer
+from views.user_modules.upload_worker import start_upload
 from models import (
     save_knowledge_file,
     list_knowledge_files,
@@ -196,12 +197,15 @@ class KnowledgeBaseModule(QWidget):
             return
         category = dlg.get_category()
         keywords = dlg.get_keywords()
-        ok_count = 0
-        for path in paths:
-            result = save_knowledge_file(path, self.user['id'], self.user['username'], category, keywords)
-            if result:
-                ok_count += 1
-        if ok_count > 0:
+        user_id, username = self.user['id'], self.user['username']
+        self.upload_worker = start_upload(
+            self, paths,
+            lambda path, progress: save_knowledge_file(path, user_id, username, category, keywords, progress=progress),
+            self.on_share_finished)
+
+    def on_share_finished(self, results):
+        self.upload_worker = None
+        if any(results):
             show_info(self, tr('common.success'), tr('knowledge.file_shared'))
             self.refresh_knowledge()
 
@@ -7,6 +7,7 @@ from theme_manager import theme_manager
 from language import tr
 from utils import show_info, show_warn
 from file_viewer import open_file_in_viewer
+from views.user_modules.upload_worker import start_upload
 from models import (
     PROGRESS_STATUS_NOT_STARTED,
     PROGRESS_STATUS_IN_PROGRESS,
@@ -159,14 +160,22 @@ class UserProgressModule(QWidget):
                     current_files = list(t.get('files') or [])
                     current_status = int(t.get('status') or PROGRESS_STATUS_NOT_STARTED)
                     break
-        # 保存新文件
-        for path in paths:
-            meta = save_task_file(path)
+        # 后台保存新文件，完成后再更新进度记录
+        self.upload_worker = start_upload(
+            self, paths,
+            lambda path, progress: save_task_file(path, progress=progress),
+            lambda metas: self.on_upload_finished(user_id, task_id, current_status, current_files, metas))
+
+    def on_upload_finished(self, user_id, task_id, current_status, current_files, metas):
+        self.upload_worker = None
+        for meta in metas:
             if meta:
                 # 检查是否已存在相同sha1
                 existing_shas = {f['sha1'] for f in current_files}
                 if meta['sha1'] not in existing_shas:
                     current_files.append(meta)
+        if not any(metas):
+            return
         # 更新进度记录
         try:
             set_user_task_progress(user_id, task_id, current_status, updated_by='user', files=current_files)
@@ -0,0 +1,87 @@
+import os
+from PySide6.QtCore import Qt, QThread, Signal
+from PySide6.QtWidgets import QProgressDialog
+from language import tr
+from utils import show_warn
+from database import close_thread_connections
+
+# 进度按千分比上报，避免超过 2GB 的文件在 int 信号中溢出
+UPLOAD_PROGRESS_MAX = 1000
+
+
+class UploadCancelled(Exception):
+    pass
+
+
+class FileUploadWorker(QThread):
+    """在后台线程逐个导入文件，save(path, progress) 为实际的保存函数"""
+    progress = Signal(int, str)
+    finished = Signal(list)
+    error = Signal(str)
+
+    def __init__(self, paths, save):
+        super().__init__()
+        self.paths = list(paths)
+        self.save = save
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        sizes = [os.path.getsize(p) if os.path.exists(p) else 0 for p in self.paths]
+        total = max(1, sum(sizes))
+        base = 0
+        results = []
+        try:
+            for path, size in zip(self.paths, sizes):
+                name = os.path.basename(path)
+
+                def on_progress(done, _size, name=name, base=base):
+                    if self._cancelled:
+                        raise UploadCancelled()
+                    self.progress.emit(int((base + done) * UPLOAD_PROGRESS_MAX / total), name)
+
+                self.progress.emit(int(base * UPLOAD_PROGRESS_MAX / total), name)
+                results.append(self.save(path, on_progress))
+                base += size
+        except UploadCancelled:
+            pass
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        finally:
+            close_thread_connections()
+        self.finished.emit(results)
+
+
+def start_upload(parent, paths, save, on_finished):
+    """弹出可取消的进度框并在后台上传，结束后以结果列表调用 on_finished"""
+    dlg = QProgressDialog(tr('upload.progress_message', name=''), tr('common.cancel'), 0, UPLOAD_PROGRESS_MAX, parent)
+    dlg.setWindowTitle(tr('upload.progress_title'))
+    dlg.setWindowModality(Qt.WindowModality.WindowModal)
+    dlg.setMinimumDuration(300)
+    dlg.setAutoClose(False)
+    dlg.setAutoReset(False)
+    worker = FileUploadWorker(paths, save)
+
+    def on_progress(value, name):
+        dlg.setLabelText(tr('upload.progress_message', name=name))
+        dlg.setValue(value)
+
+    def done(results):
+        dlg.close()
+        worker.deleteLater()
+        on_finished(results)
+
+    def failed(msg):
+        dlg.close()
+        worker.deleteLater()
+        show_warn(parent, tr('common.error'), msg)
+
+    worker.progress.connect(on_progress)
+    worker.finished.connect(done)
+    worker.error.connect(failed)
+    dlg.canceled.connect(worker.cancel)
+    worker.start()
+    return worker
@@ -1,5 +1,7 @@
+import atexit
 import json
 import random
+import time
 from PySide6.QtCore import Qt, QTimer
 from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QGroupBox, QGridLayout, QScrollArea, QLineEdit, QTextEdit
 from PySide6.QtGui import QKeySequence, QShortcut, QPixmap, QGuiApplication
@@ -7,10 +9,27 @@ from theme_manager import theme_manager
 from icon_manager import IconManager
 from exam_interface import ModernTimer, ModernProgressBar
 from language import tr
-from models import start_attempt, save_answer, submit_attempt, list_exams, grade_question, build_exam_questions_for_attempt, get_pic, get_exam_uuid, make_exam_uuid
+from models import start_attempt, save_answers, submit_attempt, list_exams, grade_question, build_exam_questions_for_attempt, get_pic, prefetch_neighbour_pics, get_exam_uuid, make_exam_uuid
 from PySide6.QtWidgets import QMessageBox
 from utils import show_info, show_warn, ask_yes_no
 
+AUTOSAVE_DELAY_MS = 1500
+# 交卷前同步写回作答的重试次数与间隔（秒）
+SUBMIT_FLUSH_RETRIES = 3
+SUBMIT_FLUSH_DELAY = 0.5
+
+
+@atexit.register
+def _flush_on_exit():
+    # 进程异常退出时尽量把未落盘的作答写回
+    win = ExamWindow.instance
+    if win is not None:
+        try:
+            win.flush_answers(notify=False)
+        except Exception:
+            pass
+
+
 class ExamWindow(QMainWindow):
     instance = None
     def __init__(self, user, exam_id, exam_uuid=None, parent=None):
@@ -161,6 +180,15 @@ class ExamWindow(QMainWindow):
         self.setCentralWidget(central)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.tick)
+        # 作答写回队列：按题合并，定时或切题时一次事务落盘
+        self._pending_answers = {}
+        self._autosave_warned = False
+        # 交卷后不再接受任何作答写入
+        self._answers_closed = False
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(AUTOSAVE_DELAY_MS)
+        self.autosave_timer.timeout.connect(self.flush_answers)
         self.answers = {}
         self.evaluation = {}
         tl = 0
@@ -225,6 +253,7 @@ class ExamWindow(QMainWindow):
         q = self.questions[self.current_index]
         sel = [text] if text.strip() else []
         self.answers[q['id']] = sel
+        self.queue_answer(q['id'], sel)
         self.update_buttons_state()
 
     def on_essay_text_changed(self):
@@ -234,6 +263,7 @@ class ExamWindow(QMainWindow):
         text = self.essay_input.toPlainText() if self.essay_input else ''
         sel = [text] if text.strip() else []
         self.answers[q['id']] = sel
+        self.queue_answer(q['id'], sel)
         self.update_buttons_state()
 
     def update_buttons_state(self):
@@ -339,6 +369,7 @@ class ExamWindow(QMainWindow):
             pixmap = QPixmap.fromImage(picture)
             label.setPixmap(pixmap)
             self.q_picture_layout.addWidget(label)
+        prefetch_neighbour_pics(self.questions, self.current_index, max_dim=int(self.pic_width))
         # 清空旧选项
         while self.opts_layout.count():
             child = self.opts_layout.takeAt(0)
@@ -487,19 +518,81 @@ class ExamWindow(QMainWindow):
             selected = selected[:1]
         return selected
 
-    def save_current(self):
+    def queue_answer(self, qid, sel):
+        if self._answers_closed:
+            return
+        self._pending_answers[qid] = (list(sel), bool(self.cheatting))
+        if not self.autosave_timer.isActive():
+            self.autosave_timer.start()
+
+    def flush_answers(self, notify=True, retry=True):
+        """把队列中的作答一次写回，返回是否成功；失败时作答留在队列中，retry=True 时由定时器稍后重试"""
+        pending = getattr(self, '_pending_answers', None)
+        if not pending or getattr(self, '_answers_closed', False):
+            return True
+        try:
+            self.autosave_timer.stop()
+        except Exception:
+            pass
+        items = [(qid, sel, cheat) for qid, (sel, cheat) in pending.items()]
+        pending.clear()
+        try:
+            save_answers(self.attempt_uuid, items)
+        except Exception as e:
+            print(f"[ERROR] autosave failed: {e}")
+            # 写入失败时放回队列，已有更新的作答优先
+            for qid, sel, cheat in items:
+                pending.setdefault(qid, (sel, cheat))
+            # 由定时器触发时不能向上抛出；提示只弹一次，写入恢复后才会再次提示
+            if retry:
+                self.autosave_timer.start()
+            if notify and not self._autosave_warned:
+                self._autosave_warned = True
+                show_warn(self, tr('common.error'), tr('exam.autosave_failed', error=str(e)))
+            return False
+        self._autosave_warned = False
+        return True
+
+    def stage_current(self):
         q = self.questions[self.current_index]
         sel = self.collect_selected()
-        if q['type'] == 'truefalse':
-            save_answer(self.attempt_uuid, q['id'], sel, self.cheatting)
-        elif q['type'] == 'single':
-            save_answer(self.attempt_uuid, q['id'], sel, self.cheatting)
-        else:
-            save_answer(self.attempt_uuid, q['id'], sel, self.cheatting)
+        self.queue_answer(q['id'], sel)
         self.answers[q['id']] = sel
         self.update_buttons_state()
         self.update_nav_buttons_state()
 
+    def save_current(self):
+        self.stage_current()
+        return self.flush_answers()
+
+    def flush_before_submit(self):
+        """交卷前停掉自动保存定时器，同步重试写回队列中的全部作答，返回是否写回成功"""
+        self.stage_current()
+        self.autosave_timer.stop()
+        for i in range(SUBMIT_FLUSH_RETRIES):
+            if i:
+                time.sleep(SUBMIT_FLUSH_DELAY)
+            if self.flush_answers(notify=False, retry=False):
+                return True
+        return False
+
+    def close_answers(self):
+        """交卷时关闭作答写入：之后定时器与退出时的写回都不会再改动已评分的 attempt，
+        返回未能写回而被丢弃的作答数"""
+        self.autosave_timer.stop()
+        self._answers_closed = True
+        lost = len(self._pending_answers)
+        if lost:
+            print(f"[ERROR] {lost} answers could not be saved before submit")
+        self._pending_answers.clear()
+        return lost
+
+    def warn_submit_blocked(self):
+        # 未能写回时不交卷，恢复后台重试并明确告知考生
+        self.autosave_timer.start()
+        self._autosave_warned = True
+        show_warn(self, tr('common.error'), tr('exam.submit_blocked'))
+
     def on_option_clicked(self, button):
         if getattr(self, '_submitted', False):
             return
@@ -510,6 +603,7 @@ class ExamWindow(QMainWindow):
                     b.setChecked(False)
         sel = self.collect_selected()
         self.answers[q['id']] = sel
+        self.queue_answer(q['id'], sel)
         self.update_buttons_state()
 
     def next_q(self):
@@ -527,12 +621,19 @@ class ExamWindow(QMainWindow):
         self.render_q()
         
     def submit(self):
-        self.save_current()
+        # 作答未能写回时不交卷，留给考生重试；时间已到则按已保存的作答交卷
+        saved = self.flush_before_submit()
+        if not saved and self.remaining > 0:
+            self.warn_submit_blocked()
+            return
         self.timer.stop()
         try:
             self.timer_widget.stop_timer()
         except Exception:
             pass
+        lost = self.close_answers()
+        if lost:
+            show_warn(self, tr('common.error'), tr('exam.answers_lost', count=lost))
         score, passed = submit_attempt(self.attempt_uuid)
         self.exam_passed = bool(passed)
         show_info(self, tr('exam.result'), f'{tr("exam.score_label")}:{score} {tr("exam.pass_text") if passed==1 else tr("exam.fail_text")}')
@@ -649,12 +750,16 @@ class ExamWindow(QMainWindow):
             return
         reply = ask_yes_no(self, tr('common.hint'), tr('exam.confirm_exit'), default_yes=False)
         if reply == QMessageBox.StandardButton.Yes:
+            if not self.flush_before_submit():
+                self.warn_submit_blocked()
+                event.ignore()
+                return
             try:
-                self.save_current()
                 self.timer.stop()
                 self.timer_widget.stop_timer()
             except Exception:
                 pass
+            self.close_answers()
             score, passed = submit_attempt(self.attempt_uuid)
             show_info(self, tr('exam.result'), tr('exam.exit_result', score=score, pass_text=(tr('exam.pass_text') if passed==1 else tr('exam.fail_text'))) + tr('exam.unanswered_note'))
             try:
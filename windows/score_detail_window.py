@@ -6,7 +6,7 @@ from PySide6.QtCore import Qt
 from PySide6.QtGui import QPixmap, QKeySequence, QShortcut
 from theme_manager import theme_manager
 from language import tr
-from models import get_attempt, get_attempt_answers, list_questions, get_exam_title, get_exam_uuid, grade_question, get_pic
+from models import get_attempt, get_attempt_answers, list_questions, get_exam_title, get_exam_uuid, grade_question, get_pic, prefetch_neighbour_pics
 import json
 from datetime import datetime
 
@@ -313,6 +313,7 @@ class ScoreDetailWindow(QDialog):
                 img_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
                 img_label.setStyleSheet(f"border: 1px solid {colors['border']}; border-radius: 8px;")
                 self.q_picture_layout.addWidget(img_label, 0, i)
+        prefetch_neighbour_pics(self.questions, self.current_index, max_dim=int(self.pic_width))
 
         # 3. Options (Exactly like ExamWindow)
         while self.opts_layout.count():